@@ -32,7 +32,6 @@ from io import TextIOWrapper
 from typing import Dict, Tuple, List, Optional, Iterable, cast, Any, Set
 
 import toml
-from grammar_graph import gg
 
 from isla import __version__ as isla_version, language
 from isla.derivation_tree import DerivationTree
@@ -42,7 +41,9 @@ from isla.helpers import (
     get_isla_resource_file_content,
     Exceptional,
     eassert,
+    grammar_to_immutable,
 )
+from isla.evaluator import grammar_graph
 from isla.isla_predicates import (
     STANDARD_STRUCTURAL_PREDICATES,
     STANDARD_SEMANTIC_PREDICATES,
@@ -887,7 +888,7 @@ def parse_cost_computer_spec(
             ),
             k=k_arg,
         ),
-        gg.GrammarGraph.from_grammar(grammar),
+        grammar_graph(grammar_to_immutable(grammar)),
     )
     return cost_computer
 
@@ -944,7 +945,7 @@ def get_input_string(
         return ISLaSolver(grammar, constraint)
 
     def graph():
-        return gg.GrammarGraph.from_grammar(grammar)
+        return grammar_graph(grammar_to_immutable(grammar))
 
     return (
         Exceptional.of(lambda: json.loads(inp))
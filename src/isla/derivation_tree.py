@@ -18,9 +18,12 @@
 
 import html
 import json
+import sys
 import zlib
+from collections import deque
 from functools import lru_cache
 from typing import (
+    Deque,
     Optional,
     Sequence,
     Dict,
@@ -30,6 +33,7 @@ from typing import (
     Callable,
     Union,
     Generator,
+    FrozenSet,
 )
 
 import graphviz
@@ -75,10 +79,13 @@ class DerivationTree:
             DerivationTree.next_id += 1
 
         self.__len = 1 if not children else None
+        self.__depth: Optional[int] = 1 if not children else None
+        self.__str: Optional[str] = None
         self.__hash = hash
         self.__structural_hash = structural_hash
         self.__k_paths: Dict[int, Set[Tuple[gg.Node, ...]]] = k_paths or {}
         self.__concrete_k_paths: Dict[int, Set[Tuple[gg.Node, ...]]] = {}
+        self.__nonterminals: Optional[FrozenSet[str]] = None
 
         self.__is_open = is_open
         if children is None:
@@ -88,13 +95,30 @@ class DerivationTree:
         elif any(child.__is_open for child in children):
             self.__is_open = True
 
+    # Cached values that are not serialized; `from_json` resets them, and they are
+    # recomputed on demand.
+    __TRANSIENT_FIELDS = frozenset(
+        {
+            "_DerivationTree__k_paths",
+            "_DerivationTree__concrete_k_paths",
+            "_DerivationTree__nonterminals",
+            "_DerivationTree__depth",
+            "_DerivationTree__str",
+        }
+    )
+
     def to_json(self) -> str:
-        the_dict = self.__dict__
-        if "_DerivationTree__k_paths" in the_dict:
-            del the_dict["_DerivationTree__k_paths"]
-        if "_DerivationTree__concrete_k_paths" in the_dict:
-            del the_dict["_DerivationTree__concrete_k_paths"]
-        return json.dumps(the_dict, default=lambda o: o.__dict__)
+        # The encoder calls `serializable_dict` for this tree and all its subtrees.
+        # We serialize filtered copies of the trees' dictionaries; the trees
+        # themselves (and their caches) remain untouched.
+        def serializable_dict(tree: DerivationTree) -> dict:
+            return {
+                key: value
+                for key, value in tree.__dict__.items()
+                if key not in DerivationTree.__TRANSIENT_FIELDS
+            }
+
+        return json.dumps(self, default=serializable_dict)
 
     def __getstate__(self) -> bytes:
         return zlib.compress(self.to_json().encode("UTF-8"))
@@ -107,6 +131,15 @@ class DerivationTree:
             result = DerivationTree.__new__(DerivationTree)
             result.__k_paths = {}
             result.__concrete_k_paths = {}
+            result.__nonterminals = None
+            result.__depth = None
+            result.__str = None
+
+            # Deserialization creates a new string for each node value. We intern
+            # them, such that all nodes with the same value share one string, as
+            # they do for trees created from grammar expansions.
+            value_key = "_DerivationTree__value"
+            a_dict[value_key] = sys.intern(a_dict[value_key])
 
             children_key = "_DerivationTree__children"
             ser_children = a_dict[children_key]
@@ -140,6 +173,24 @@ class DerivationTree:
     def __setstate__(self, state: bytes):
         return DerivationTree.from_json(zlib.decompress(state).decode("UTF-8"), self)
 
+    def __deepcopy__(self, memo) -> "DerivationTree":
+        """
+        Returns this tree: derivation trees are immutable, so there is no need to
+        copy them. Operations like :meth:`replace_path` return new trees sharing
+        the unchanged subtrees. Code must thus never modify a tree, or its
+        (cached) attributes, in place, since "deep copies" share that change.
+
+        >>> import copy
+        >>> tree = DerivationTree("<start>", [DerivationTree("<a>", None)])
+        >>> copy.deepcopy(tree) is tree
+        True
+
+        :param memo: The memo dictionary of :func:`copy.deepcopy` (unused).
+        :return: This tree.
+        """
+
+        return self
+
     @property
     def children(self) -> Tuple["DerivationTree"]:
         return self.__children
@@ -157,12 +208,12 @@ class DerivationTree:
         raise NotImplementedError()
 
     def has_unique_ids(self) -> bool:
+        # The same subtree object may occur several times; different subtree
+        # objects must not share an ID.
+        subtrees_by_id: Dict[int, DerivationTree] = {}
         return all(
-            not any(
-                subt_1 is not subt_2 and subt_1.id == subt_2.id
-                for _, subt_2 in self.paths()
-            )
-            for _, subt_1 in self.paths()
+            subtrees_by_id.setdefault(subtree.id, subtree) is subtree
+            for _, subtree in self.paths()
         )
 
     def k_coverage(
@@ -232,22 +283,25 @@ class DerivationTree:
         return self.__is_open
 
     def __compute_is_open(self):
-        if self.children is None:
-            return True
-
-        result = False
-
-        def action(_, node: DerivationTree) -> bool:
-            nonlocal result
-            if node.__is_open or node.children is None:
-                result = True
-                return True
-
-            return False
+        # Post-order pass storing the result for each visited subtree, such that
+        # later queries for subtrees (e.g., after `replace_path`) are O(1).
+        stack: List[Tuple[DerivationTree, bool]] = [(self, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if node.__is_open is not None:
+                continue
 
-        self.traverse(lambda p, n: None, action)
+            if node.children is None:
+                node.__is_open = True
+            elif children_done:
+                node.__is_open = any(child.__is_open for child in node.children)
+            else:
+                stack.append((node, True))
+                stack.extend(
+                    (child, False) for child in node.children if child.__is_open is None
+                )
 
-        return result
+        return self.__is_open
 
     def is_complete(self):
         return not self.is_open()
@@ -256,23 +310,21 @@ class DerivationTree:
     def get_subtree(self, path: Path) -> Optional["DerivationTree"]:
         """Access a subtree based on `path` (a list of children numbers)"""
         curr_node = self
-        while path:
+        for idx in path:
             if not curr_node.children:
                 return None
 
-            curr_node = curr_node.children[path[0]]
-            path = path[1:]
+            curr_node = curr_node.children[idx]
 
         return curr_node
 
     def is_valid_path(self, path: Path) -> bool:
         curr_node = self
-        while path:
-            if not curr_node.children or len(curr_node.children) <= path[0]:
+        for idx in path:
+            if not curr_node.children or len(curr_node.children) <= idx:
                 return False
 
-            curr_node = curr_node.children[path[0]]
-            path = path[1:]
+            curr_node = curr_node.children[idx]
 
         return True
 
@@ -321,6 +373,15 @@ class DerivationTree:
         is the root of the tree! Don't use as in `if not find_node(...).`, use
         `if find_node(...) is not None:`.
 
+        >>> leaf = DerivationTree("<b>", None)
+        >>> tree = DerivationTree("<start>", [DerivationTree("<a>", ()), leaf])
+        >>> tree.find_node(leaf)
+        (1,)
+        >>> tree.find_node(tree)
+        ()
+        >>> tree.find_node(DerivationTree("<b>", None)) is None
+        True
+
         :param node_or_id: The node or node ID to search for.
         :return: The path to the node or None.
         """
@@ -377,11 +438,11 @@ class DerivationTree:
         action: Callable[[Path, "DerivationTree"], None],
         abort_condition: Callable[[Path, "DerivationTree"], bool] = lambda p, n: False,
     ):
-        queue: List[Tuple[Path, DerivationTree]] = [((), self)]  # FIFO queue
+        queue: Deque[Tuple[Path, DerivationTree]] = deque([((), self)])  # FIFO queue
         explored: Set[Path] = {()}
 
         while queue:
-            p, v = queue.pop(0)
+            p, v = queue.popleft()
             action(p, v)
             if abort_condition(p, v):
                 return
@@ -395,15 +456,40 @@ class DerivationTree:
                 queue.append((child_path, child))
 
     def nonterminals(self) -> Set[str]:
-        result: Set[str] = set()
+        """
+        The nonterminal symbols occurring in this tree. The result is cached; subtrees
+        for which the nonterminals have already been computed are not traversed
+        again.
+
+        >>> tree = DerivationTree(
+        ...     "<start>",
+        ...     (
+        ...         DerivationTree("<a>", (DerivationTree("a", ()),)),
+        ...         DerivationTree("<b>"),
+        ...     ),
+        ... )
+        >>> sorted(tree.nonterminals())
+        ['<a>', '<b>', '<start>']
+
+        :return: The set of nonterminals in this tree.
+        """
 
-        def add_if_nonterminal(_: Path, tree: DerivationTree):
-            if is_nonterminal(tree.value):
-                result.add(tree.value)
+        if self.__nonterminals is None:
+            result: Set[str] = set()
+            stack: List[DerivationTree] = [self]
+            while stack:
+                node = stack.pop()
+                if node.__nonterminals is not None:
+                    result |= node.__nonterminals
+                    continue
 
-        self.traverse(action=add_if_nonterminal)
+                if is_nonterminal(node.value):
+                    result.add(node.value)
+                stack.extend(node.children or ())
 
-        return result
+            self.__nonterminals = frozenset(result)
+
+        return set(self.__nonterminals)
 
     def terminals(self) -> Set[str]:
         result: Set[str] = set()
@@ -492,16 +578,31 @@ class DerivationTree:
         )
 
     def open_leaves(self) -> Generator[Tuple[Path, "DerivationTree"], None, None]:
-        return (
-            (path, sub_tree)
-            for path, sub_tree in self.paths()
-            if sub_tree.children is None
-        )
+        # Closed subtrees cannot contain open leaves, so we do not enter them. Since
+        # `is_open` is cached per subtree, the traversal of a tree derived via
+        # `replace_path` only visits the open part of the tree. Children are pushed
+        # in reverse order to yield the leaves in pre-order, like `paths`.
+        stack: List[Tuple[Path, DerivationTree]] = [((), self)]
+        while stack:
+            path, node = stack.pop()
+            if node.children is None:
+                yield path, node
+                continue
+
+            for idx in reversed(range(len(node.children))):
+                child = node.children[idx]
+                if child.is_open():
+                    stack.append((path + (idx,), child))
 
     def depth(self) -> int:
-        if not self.children:
-            return 1
-        return 1 + max(child.depth() for child in self.children)
+        if self.__depth is None:
+            self.__depth = (
+                1
+                if not self.children
+                else 1 + max(child.depth() for child in self.children)
+            )
+
+        return self.__depth
 
     def new_ids(self) -> "DerivationTree":
         return DerivationTree(
@@ -529,23 +630,79 @@ class DerivationTree:
         # We remove "nested" replacements since removing elements in replacements is not
         # intended.
 
+        if len(subst_map) == 1:
+            # Most substitutions replace a single tree. Then, the only "nested"
+            # replacement is one where the replaced tree occurs inside its own
+            # replacement, and no replacement can introduce another one.
+            ((tree, repl),) = subst_map.items()
+            if not isinstance(tree, DerivationTree) or (
+                repl.id != tree.id and repl.find_node(tree.id) is not None
+            ):
+                return self
+
+            path = self.find_node(tree.id)
+            return self if path is None else self.replace_path(path, repl)
+
+        repl_ids = [
+            (repl.id, {subtree.id for _, subtree in repl.paths()})
+            for otree, repl in subst_map.items()
+            if isinstance(otree, DerivationTree)
+        ]
+
         id_subst_map = {
             tree.id: repl
             for tree, repl in subst_map.items()
             if (
                 isinstance(tree, DerivationTree)
                 and all(
-                    repl.id == tree.id or repl.find_node(tree.id) is None
-                    for otree, repl in subst_map.items()
-                    if isinstance(otree, DerivationTree)
+                    repl_id == tree.id or tree.id not in ids
+                    for repl_id, ids in repl_ids
                 )
             )
         }
 
+        def replace_sequentially() -> DerivationTree:
+            result = self
+            for tree_id in id_subst_map:
+                if (path := result.find_node(tree_id)) is not None:
+                    result = result.replace_path(path, id_subst_map[tree_id])
+
+            return result
+
+        if any(
+            repl.id != tree_id and repl.id in id_subst_map
+            for tree_id, repl in id_subst_map.items()
+        ):
+            # A replacement introduces a node that is itself to be replaced; we
+            # replace one after the other to retain the order of replacements.
+            return replace_sequentially()
+
+        # Otherwise, only the topmost nodes to replace matter, since replacing a
+        # node also replaces all of its descendants. We collect them in a single
+        # pre-order traversal and replace them afterward; their paths are disjoint.
+        # As `find_node`, we only replace the first occurrence of a node. If a node
+        # to replace occurs more than once (in a shared subtree), which occurrence
+        # that is depends on the previous replacements, so we fall back to
+        # replacing one after the other.
+        replacements: List[Tuple[Path, DerivationTree]] = []
+        seen_ids: Set[int] = set()
+        for path, node in self.paths():
+            if node.id not in id_subst_map:
+                continue
+
+            if node.id in seen_ids:
+                return replace_sequentially()
+            seen_ids.add(node.id)
+
+            # In pre-order, the descendants of a replaced node directly follow it.
+            if replacements and path[: len(replacements[-1][0])] == replacements[-1][0]:
+                continue
+
+            replacements.append((path, id_subst_map[node.id]))
+
         result = self
-        for tree_id in id_subst_map:
-            if (path := result.find_node(tree_id)) is not None:
-                result = result.replace_path(path, id_subst_map[tree_id])
+        for path, repl in replacements:
+            result = result.replace_path(path, repl)
 
         return result
 
@@ -553,27 +710,27 @@ class DerivationTree:
         if len(self) > len(other):
             return False
 
-        if self.value != other.value:
-            return False
+        stack: List[Tuple[DerivationTree, DerivationTree]] = [(self, other)]
+        while stack:
+            t1, t2 = stack.pop()
+            if t1 is t2:
+                continue
 
-        if not self.children:
-            return self.children is None or (
-                not other.children and other.children is not None
-            )
+            if t1.value != t2.value:
+                return False
 
-        if not other.children:
-            return False
+            if not t1.children:
+                if t1.children is None or (not t2.children and t2.children is not None):
+                    continue
 
-        assert self.children
-        assert other.children
+                return False
 
-        if len(self.children) != len(other.children):
-            return False
+            if not t2.children or len(t1.children) != len(t2.children):
+                return False
 
-        return all(
-            self.children[idx].is_prefix(other.children[idx])
-            for idx, _ in enumerate(self.children)
-        )
+            stack.extend(zip(t1.children, t2.children))
+
+        return True
 
     def is_potential_prefix(self, other: "DerivationTree") -> bool:
         # It's a potential prefix if for all common paths of the two trees, the leaves
@@ -581,22 +738,19 @@ class DerivationTree:
         if self.value != other.value:
             return False
 
-        # Perform a parallel BFS traversal
-        queue: List[Tuple[Path, DerivationTree, DerivationTree]] = [((), self, other)]
+        # Perform a parallel DFS traversal
+        stack: List[Tuple[DerivationTree, DerivationTree]] = [(self, other)]
 
-        while queue:
-            p, v_1, v_2 = queue.pop(0)
+        while stack:
+            v_1, v_2 = stack.pop()
 
             if v_1.children and v_2.children and len(v_1.children) != len(v_2.children):
                 return False
 
-            for child_idx, (child_1, child_2) in enumerate(
-                zip(v_1.children or [], v_2.children or [])
-            ):
+            for child_1, child_2 in zip(v_1.children or [], v_2.children or []):
                 if child_1.value != child_2.value:
                     return False
-                child_path = p + (child_idx,)
-                queue.append((child_path, child_1, child_2))
+                stack.append((child_1, child_2))
 
         return True
 
@@ -729,46 +883,41 @@ class DerivationTree:
             return None if self.children is None else list(self.children)
 
     def compute_hash_iteratively(self, structural=False):
-        # We perform an iterative reverse post-order depth-first traversal and use a stack
-        # to store intermediate results from lower levels.
+        # We perform an iterative post-order depth-first traversal. Subtrees whose
+        # hash is already known are not entered: trees derived via `replace_path`
+        # share all unchanged subtrees with the original tree, such that only the
+        # nodes on the replaced paths have to be hashed.
 
-        stack: List[int] = []
+        def cached_hash(node: DerivationTree) -> Optional[int]:
+            return node.__structural_hash if structural else node.__hash
 
-        def action(_, node: DerivationTree) -> None:
-            if structural and node.__structural_hash is not None:
-                for _ in range(len(node.children or [])):
-                    stack.pop()
-                stack.append(node.__structural_hash)
-                return
-            if not structural and node.__hash is not None:
-                for _ in range(len(node.children or [])):
-                    stack.pop()
-                stack.append(node.__hash)
-                return
+        stack: List[Tuple[DerivationTree, bool]] = [(self, False)]
+        while stack:
+            node, children_hashed = stack.pop()
+            if cached_hash(node) is not None:
+                continue
+
+            if node.children and not children_hashed:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+                continue
 
             if node.children is None:
                 node_hash = (
                     hash(node.value) if structural else hash((node.value, node.id))
                 )
             else:
-                children_values = []
-                for _ in range(len(node.children)):
-                    children_values.append(stack.pop())
                 node_hash = hash(
                     ((node.value,) if structural else (node.value, node.id))
-                    + tuple(children_values)
+                    + tuple(cached_hash(child) for child in node.children)
                 )
 
-            stack.append(node_hash)
             if structural:
                 node.__structural_hash = node_hash
             else:
                 node.__hash = node_hash
 
-        self.traverse(action, kind=DerivationTree.TRAVERSE_POSTORDER, reverse=True)
-
-        assert len(stack) == 1
-        return stack.pop()
+        return cached_hash(self)
 
     def __hash__(self):
         # return self.id  # Should be unique!
@@ -786,9 +935,19 @@ class DerivationTree:
         return self.__structural_hash
 
     def structurally_equal(self, other: "DerivationTree"):
+        if self is other:
+            return True
+
         if not isinstance(other, DerivationTree):
             return False
 
+        if (
+            self.__structural_hash is not None
+            and other.__structural_hash is not None
+            and self.__structural_hash != other.__structural_hash
+        ):
+            return False
+
         if (
             self.value != other.value
             or (self.children is None and other.children is not None)
@@ -816,8 +975,17 @@ class DerivationTree:
 
         while stack:
             t1, t2 = stack.pop()
+            if t1 is t2:
+                # Trees derived via `replace_path` share all unchanged subtrees.
+                continue
+
             if (
                 not isinstance(t2, DerivationTree)
+                or (
+                    t1.__hash is not None
+                    and t2.__hash is not None
+                    and t1.__hash != t2.__hash
+                )
                 or t1.value != t2.value
                 or t1.id != t2.id
                 or (t1.children is None and t2.children is not None)
@@ -855,11 +1023,52 @@ class DerivationTree:
 
     @lru_cache(maxsize=100)
     def to_string(self, show_open_leaves: bool = False, show_ids: bool = False) -> str:
+        return self.__to_string(show_open_leaves, show_ids)
+
+    def __str__(self) -> str:
+        """
+        The string representation of this tree, including open leaves. The
+        result is cached; while computing it, we reuse the cached strings of
+        subtrees that have already been converted. This is relevant since the
+        evaluator stringifies the same (sub)trees many times when instantiating
+        SMT formulas.
+
+        >>> tree = DerivationTree("<start>", [
+        ...     DerivationTree("<a>", [DerivationTree("x", ())]),
+        ...     DerivationTree("<b>", None),
+        ... ])
+        >>> str(tree.children[0])
+        'x'
+        >>> str(tree)
+        'x<b>'
+
+        :return: The string representation of this tree.
+        """
+
+        if self.__str is None:
+            self.__str = self.__to_string(show_open_leaves=True, use_cached_str=True)
+
+        return self.__str
+
+    def __to_string(
+        self,
+        show_open_leaves: bool = False,
+        show_ids: bool = False,
+        use_cached_str: bool = False,
+    ) -> str:
+        # Iterates over the leaves with an explicit stack, which does not hit the
+        # recursion limit for deep trees. If `use_cached_str` is set, subtrees
+        # whose `__str__` has already been computed are not traversed again; this
+        # is only correct for the `__str__` output format.
         result = []
         stack = [self]
 
         while stack:
-            node = stack.pop(0)
+            node = stack.pop()
+            if use_cached_str and node.__str is not None:
+                result.append(node.__str)
+                continue
+
             symbol = node.value
             children = node.children
 
@@ -875,13 +1084,10 @@ class DerivationTree:
 
                 continue
 
-            stack = list(children) + stack
+            stack.extend(reversed(children))
 
         return "".join(result)
 
-    def __str__(self) -> str:
-        return self.to_string(show_open_leaves=True)
-
     def to_dot(self) -> str:
         dot = Digraph(comment="Derivation Tree")
         dot.attr("node", shape="plain")
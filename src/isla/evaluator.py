@@ -19,8 +19,8 @@
 import copy
 import itertools
 import logging
-from functools import reduce
-from typing import Union, Optional, Set, Dict, cast, Tuple, List, Callable
+from functools import lru_cache
+from typing import Union, Optional, Set, Dict, cast, Tuple, List, Callable, Type
 
 import z3
 from grammar_graph import gg
@@ -29,7 +29,16 @@ from orderedset import OrderedSet
 import isla.isla_shortcuts as sc
 from isla import language
 from isla.derivation_tree import DerivationTree
-from isla.helpers import is_nonterminal, Maybe, chain_functions, is_prefix
+from isla.helpers import (
+    is_nonterminal,
+    Maybe,
+    chain_functions,
+    is_prefix,
+    grammar_to_immutable,
+    grammar_to_mutable,
+    nonterminal_reachability,
+    graph_reachability,
+)
 from isla.isla_predicates import (
     STANDARD_STRUCTURAL_PREDICATES,
     STANDARD_SEMANTIC_PREDICATES,
@@ -67,7 +76,7 @@ from isla.language import (
 )
 from isla.three_valued_truth import ThreeValuedTruth
 from isla.trie import SubtreesTrie
-from isla.type_defs import Grammar, Path
+from isla.type_defs import Grammar, Path, ImmutableGrammar
 from isla.z3_helpers import (
     evaluate_z3_expression,
     DomainError,
@@ -77,11 +86,34 @@ from isla.z3_helpers import (
     z3_eq,
     replace_in_z3_expr,
     z3_subst,
+    z3_string,
+    Z3EvalResult,
 )
 
 logger = logging.getLogger("evaluator")
 
 
+@lru_cache(maxsize=128)
+def grammar_graph(grammar: ImmutableGrammar) -> gg.GrammarGraph:
+    """
+    Returns the (cached) grammar graph for the given grammar. Reusing the same
+    graph across evaluations also retains the memoized reachability and path
+    queries of the graph. Only the graphs of the 128 most recently used grammars
+    are kept.
+
+    >>> from isla.helpers import grammar_to_immutable
+    >>> from isla_formalizations.scriptsizec import SCRIPTSIZE_C_GRAMMAR
+    >>> immutable_grammar = grammar_to_immutable(SCRIPTSIZE_C_GRAMMAR)
+    >>> grammar_graph(immutable_grammar) is grammar_graph(immutable_grammar)
+    True
+
+    :param grammar: The grammar in immutable form.
+    :return: The grammar graph for the grammar.
+    """
+
+    return gg.GrammarGraph.from_grammar(grammar_to_mutable(grammar))
+
+
 def propositionally_unsatisfiable(formula: Formula) -> bool:
     if formula == sc.true():
         return False
@@ -113,7 +145,7 @@ def evaluate(
     assert reference_tree is not None
     assert isinstance(reference_tree, DerivationTree)
     subtrees_trie = reference_tree.trie() if subtrees_trie is None else subtrees_trie
-    graph = gg.GrammarGraph.from_grammar(grammar) if graph is None else graph
+    graph = grammar_graph(grammar_to_immutable(grammar)) if graph is None else graph
 
     formula = instantiate_top_level_constant(
         parse_isla(formula, grammar, structural_predicates, semantic_predicates)
@@ -193,9 +225,7 @@ def evaluate(
         if smt_result.is_unknown():
             return ThreeValuedTruth.unknown()
         elif smt_result.is_false():
-            if not propositionally_unsatisfiable(
-                reduce(Formula.__and__, qfr_free_assumptions, sc.true())
-            ):
+            if not propositionally_unsatisfiable(sc.conjunction(*qfr_free_assumptions)):
                 return ThreeValuedTruth.false()
         else:
             assert smt_result.is_true()
@@ -423,11 +453,12 @@ def wellformed_quantified_formula(
                 f"Variable {formula.in_variable} in {formula} bound be outer SMT formula",
             )
         )
-    if formula.bound_variables().intersection(bound_vars):
+    qfd_bound_vars = formula.bound_variables()
+    if qfd_bound_vars.intersection(bound_vars):
         return Maybe(
             (
                 False,
-                f"Variables {', '.join(map(str, formula.bound_variables().intersection(bound_vars)))} "
+                f"Variables {', '.join(map(str, qfd_bound_vars.intersection(bound_vars)))} "
                 f"already bound in outer scope",
             )
         )
@@ -454,7 +485,7 @@ def wellformed_quantified_formula(
 
     unknown_typed_variables = [
         var
-        for var in formula.bound_variables()
+        for var in qfd_bound_vars
         if is_nonterminal(var.n_type) and var.n_type not in grammar
     ]
     if unknown_typed_variables:
@@ -487,7 +518,7 @@ def wellformed_quantified_formula(
         well_formed(
             formula.inner_formula,
             grammar,
-            bound_vars | formula.bound_variables(),
+            bound_vars | qfd_bound_vars,
             in_expr_vars | OrderedSet([formula.in_variable]),
             bound_by_smt,
         )
@@ -533,9 +564,18 @@ def wellformed_propositional_formula(
         return Maybe.nothing()
 
     if isinstance(formula, ConjunctiveFormula):
-        smt_formulas = [f for f in formula.args if type(f) is SMTFormula]
-        other_formulas = [f for f in formula.args if type(f) is not SMTFormula]
+        smt_formulas: List[SMTFormula] = []
+        other_formulas: List[Formula] = []
+        for arg in formula.args:
+            if type(arg) is SMTFormula:
+                smt_formulas.append(arg)
+            else:
+                other_formulas.append(arg)
 
+        # We check and register the SMT formulas in a single pass. Checking an SMT
+        # formula after registering the variables of a previous one does not
+        # change the result: A bound variable that is only registered by the
+        # previous formula would already have failed the check for that formula.
         for smt_formula in smt_formulas:
             res, msg = well_formed(
                 smt_formula, grammar, bound_vars, in_expr_vars, bound_by_smt
@@ -543,13 +583,9 @@ def wellformed_propositional_formula(
             if not res:
                 return Maybe((False, msg))
 
-        for smt_formula in smt_formulas:
-            bound_vars |= [
-                var
-                for var in smt_formula.free_variables()
-                if type(var) is BoundVariable
-            ]
-            bound_by_smt |= smt_formula.free_variables()
+            free_variables = smt_formula.free_variables()
+            bound_vars |= [var for var in free_variables if type(var) is BoundVariable]
+            bound_by_smt |= free_variables
 
         for f in other_formulas:
             res, msg = well_formed(f, grammar, bound_vars, in_expr_vars, bound_by_smt)
@@ -624,46 +660,64 @@ def evaluate_legacy(
     assert isinstance(reference_tree, DerivationTree)
 
     grammar = parse_bnf(grammar) if isinstance(grammar, str) else grammar
-    graph = gg.GrammarGraph.from_grammar(grammar) if graph is None else graph
+    graph = grammar_graph(grammar_to_immutable(grammar)) if graph is None else graph
     trie = reference_tree.trie() if trie is None else trie
 
-    def raise_not_implemented_error(
-        f: Formula,
-    ) -> Maybe[ThreeValuedTruth]:
+    evaluation_function = legacy_evaluation_function(type(formula))
+    if evaluation_function is None:
         raise NotImplementedError(
-            f"Don't know how to evaluate the formula {unparse_isla(f)}"
+            f"Don't know how to evaluate the formula {unparse_isla(formula)}"
         )
 
-    def close(evaluation_function: callable) -> callable:
-        return lambda f: evaluation_function(
-            f,
-            assignments,
-            reference_tree,
-            graph,
-            grammar,
-            trie,
-        )
+    return evaluation_function(
+        formula,
+        assignments,
+        reference_tree,
+        graph,
+        grammar,
+        trie,
+    ).a
 
-    monad = chain_functions(
-        map(
-            close,
-            [
-                evaluate_exists_int_formula,
-                evaluate_smt_formula,
-                evaluate_quantified_formula,
-                evaluate_structural_predicate_formula,
-                evaluate_semantic_predicate_formula,
-                evaluate_negated_formula_formula,
-                evaluate_conjunctive_formula_formula,
-                evaluate_disjunctive_formula,
-                raise_not_implemented_error,
-            ],
+
+@lru_cache(maxsize=None)
+def legacy_evaluation_function(
+    formula_type: Type[Formula],
+) -> Optional[Callable[..., Maybe[ThreeValuedTruth]]]:
+    """
+    Returns the function :func:`~isla.evaluator.evaluate_legacy` uses to evaluate
+    formulas of the given type. :func:`~isla.evaluator.evaluate_legacy` is called
+    for each subformula and assignment; resolving the function once per type
+    saves trying all evaluation functions in turn.
+
+    >>> legacy_evaluation_function(ForallFormula).__name__
+    'evaluate_quantified_formula'
+    >>> print(legacy_evaluation_function(ForallIntFormula))
+    None
+
+    :param formula_type: The type of the formula to evaluate.
+    :return: The evaluation function, or None if there is none for this type.
+    """
+
+    evaluation_functions = {
+        ExistsIntFormula: evaluate_exists_int_formula,
+        SMTFormula: evaluate_smt_formula,
+        QuantifiedFormula: evaluate_quantified_formula,
+        StructuralPredicateFormula: evaluate_structural_predicate_formula,
+        SemanticPredicateFormula: evaluate_semantic_predicate_formula,
+        NegatedFormula: evaluate_negated_formula_formula,
+        ConjunctiveFormula: evaluate_conjunctive_formula_formula,
+        DisjunctiveFormula: evaluate_disjunctive_formula,
+    }
+
+    return next(
+        (
+            evaluation_functions[cls]
+            for cls in formula_type.__mro__
+            if cls in evaluation_functions
         ),
-        formula,
+        None,
     )
 
-    return monad.a
-
 
 def evaluate_exists_int_formula(
     formula: Formula, _1, _2, _3, _4, _5
@@ -692,56 +746,111 @@ def evaluate_smt_formula(
     ):
         return Maybe(ThreeValuedTruth.unknown())
 
-    z3_formula = (
-        z3_subst(
+    # The result only depends on the strings substituted for the symbols of the
+    # formula, which allows for caching it. When evaluating a universal formula,
+    # the same SMT formula is frequently instantiated with equal strings.
+    return Maybe(
+        evaluate_instantiated_smt_formula(
             formula.formula,
-            {
-                z3.String(var.name): z3.StringVal(str(tree))
-                for var, tree in formula.substitutions.items()
-            },
+            tuple(
+                (var.name, str(tree)) for var, tree in formula.substitutions.items()
+            ),
+            tuple(
+                (var.name, str(assignments[var][1]), assignments[var][1].is_open())
+                for var in itertools.chain(
+                    formula.free_variables(), formula.instantiated_variables
+                )
+                if var in assignments
+            ),
         )
-        if formula.substitutions
-        else formula.formula
     )
 
-    try:
-        translation = evaluate_z3_expression(z3_formula)
 
-        var_map: Dict[str, Variable] = {var.name: var for var in assignments}
+@lru_cache(maxsize=4096)
+def evaluate_instantiated_smt_formula(
+    formula: z3.BoolRef,
+    substitutions: Tuple[Tuple[str, str], ...],
+    assignments: Tuple[Tuple[str, str, bool], ...],
+) -> ThreeValuedTruth:
+    """
+    Evaluates an SMT formula whose symbols are instantiated with strings. Results
+    are cached.
+
+    >>> x, y = z3.Strings("x y")
+    >>> print(evaluate_instantiated_smt_formula(
+    ...     z3.Length(x) < z3.Length(y), (("x", "a"),), (("y", "ab", False),)))
+    TRUE
+    >>> print(evaluate_instantiated_smt_formula(
+    ...     z3.Length(x) < z3.Length(y), (("x", "a"),), (("y", "<y>", True),)))
+    UNKNOWN
+
+    :param formula: The SMT formula.
+    :param substitutions: Pairs of symbol names and the strings substituted for
+      them before evaluating the formula.
+    :param assignments: Triples of symbol names, the strings assigned to them,
+      and whether the assigned trees are open.
+    :return: The truth value of the instantiated formula.
+    """
 
-        args_instantiation = [assignments[var_map[arg]][1] for arg in translation[0]]
+    # Substituted symbols are bound to closed strings, just like assigned ones.
+    assignment_map: Dict[str, Tuple[str, bool]] = {
+        name: (value, is_open) for name, value, is_open in assignments
+    }
+    assignment_map.update({name: (value, False) for name, value in substitutions})
 
-        if any(inst.is_open() for inst in args_instantiation):
-            return Maybe(ThreeValuedTruth.unknown())
+    def evaluate_translation(translation: Z3EvalResult) -> ThreeValuedTruth:
+        args_instantiation = [assignment_map[arg] for arg in translation[0]]
 
-        string_instantiations = tuple(map(str, args_instantiation))
+        if any(is_open for _, is_open in args_instantiation):
+            return ThreeValuedTruth.unknown()
+
+        string_instantiations = tuple(value for value, _ in args_instantiation)
 
         try:
-            return Maybe(
-                ThreeValuedTruth.from_bool(
-                    translation[1](string_instantiations)
-                    if string_instantiations
-                    else translation[1]
-                )
+            return ThreeValuedTruth.from_bool(
+                translation[1](string_instantiations)
+                if string_instantiations
+                else translation[1]
             )
         except DomainError:
-            return Maybe(ThreeValuedTruth.false())
+            return ThreeValuedTruth.false()
+
+    # We first try to evaluate the translation of the uninstantiated formula: It
+    # is cached, while substituting strings into the formula creates a new Z3
+    # expression, and thus a new translation, for each instantiation.
+    try:
+        return evaluate_translation(evaluate_z3_expression(formula))
     except NotImplementedError:
-        return Maybe(
-            is_valid(
-                z3.substitute(
-                    formula.formula,
-                    *tuple(
+        pass
+
+    # Some expressions can only be translated if their arguments are literals.
+    if substitutions:
+        try:
+            return evaluate_translation(
+                evaluate_z3_expression(
+                    z3_subst(
+                        formula,
                         {
-                            z3.String(symbol.name): z3.StringVal(
-                                str(symbol_assignment[1])
-                            )
-                            for symbol, symbol_assignment in assignments.items()
-                        }.items()
-                    ),
+                            z3_string(name): z3.StringVal(value)
+                            for name, value in substitutions
+                        },
+                    )
                 )
             )
+        except NotImplementedError:
+            pass
+
+    return is_valid(
+        z3.substitute(
+            formula,
+            *tuple(
+                {
+                    z3_string(name): z3.StringVal(value)
+                    for name, value, _ in assignments
+                }.items()
+            ),
         )
+    )
 
 
 def evaluate_quantified_formula(
@@ -803,23 +912,43 @@ def evaluate_quantified_formula(
     # quantifier, it results in "unknown" only if no instantiation matches the
     # quantifier.
 
-    has_potential_matches = any(
-        quantified_formula_might_match(
-            (
-                formula
-                if isinstance(formula.in_variable, DerivationTree)
-                else formula.substitute_expressions({formula.in_variable: in_inst})
-            ).substitute_expressions({v: t for v, (_, t) in assignments.items()}),
-            path_to_nonterminal,
-            reference_tree,
-            grammar,
-            graph.reachable,
+    # The instantiated formula does not depend on the open leaf, so we compute it
+    # at most once, in a single substitution pass, and only if there are open
+    # leaves at all. If `formula.in_variable` is a variable, `assignments` maps it
+    # to `in_inst`. For existential formulas, the check is only needed if no
+    # instantiation is satisfied, which is why we defer it.
+    def has_potential_matches() -> bool:
+        open_leaf_paths = (path for path, _ in reference_tree.open_leaves())
+        first_open_leaf_path = next(open_leaf_paths, None)
+        if first_open_leaf_path is None:
+            return False
+
+        # A single substitution pass only instantiates the `in` variable if it
+        # is bound in `assignments` (to `in_inst`), which it always is.
+        instantiated_formula = formula.substitute_expressions(
+            {variable: tree for variable, (_, tree) in assignments.items()}
+        )
+
+        reachability = graph_reachability(graph)
+
+        def reachable(from_nonterminal: str, to_nonterminal: str) -> bool:
+            return to_nonterminal in reachability[from_nonterminal]
+
+        return any(
+            quantified_formula_might_match(
+                instantiated_formula,
+                path_to_nonterminal,
+                reference_tree,
+                grammar,
+                reachable,
+            )
+            for path_to_nonterminal in itertools.chain(
+                [first_open_leaf_path], open_leaf_paths
+            )
         )
-        for path_to_nonterminal, _ in reference_tree.open_leaves()
-    )
 
     if isinstance(formula, ForallFormula):
-        if has_potential_matches:
+        if has_potential_matches():
             return Maybe(ThreeValuedTruth.unknown())
 
         return Maybe(
@@ -850,7 +979,7 @@ def evaluate_quantified_formula(
 
         return Maybe(
             ThreeValuedTruth.unknown()
-            if not result.is_true() and has_potential_matches
+            if not result.is_true() and has_potential_matches()
             else result
         )
 
@@ -958,6 +1087,18 @@ def evaluate_conjunctive_formula_formula(
     if not isinstance(formula, ConjunctiveFormula):
         return Maybe.nothing()
 
+    # We evaluate the SMT conjuncts first: Their (cached) evaluation is cheap
+    # compared to that of quantified formulas, which we can skip if an SMT
+    # conjunct is already false. Nested conjunctions are evaluated as one flat
+    # conjunction, which saves one dispatch through `evaluate_legacy` per level.
+    smt_formulas: List[Formula] = []
+    other_formulas: List[Formula] = []
+    for arg in split_conjunction(formula):
+        if type(arg) is SMTFormula:
+            smt_formulas.append(arg)
+        else:
+            other_formulas.append(arg)
+
     return Maybe(
         ThreeValuedTruth.all(
             evaluate_legacy(
@@ -968,7 +1109,7 @@ def evaluate_conjunctive_formula_formula(
                 trie,
                 graph=graph,
             )
-            for sub_formula in formula.args
+            for sub_formula in itertools.chain(smt_formulas, other_formulas)
         )
     )
 
@@ -984,6 +1125,8 @@ def evaluate_disjunctive_formula(
     if not isinstance(formula, DisjunctiveFormula):
         return Maybe.nothing()
 
+    # Nested disjunctions are evaluated as one flat disjunction; see
+    # `evaluate_conjunctive_formula_formula`.
     return Maybe(
         ThreeValuedTruth.any(
             evaluate_legacy(
@@ -994,7 +1137,7 @@ def evaluate_disjunctive_formula(
                 trie,
                 graph=graph,
             )
-            for sub_formula in formula.args
+            for sub_formula in split_disjunction(formula)
         )
     )
 
@@ -1010,14 +1153,14 @@ def eliminate_quantifiers(
     numeric_constants = (
         {
             var
-            for var in VariablesCollector().collect(formula)
+            for var in VariablesCollector.collect(formula)
             if isinstance(var, Constant) and var.is_numeric()
         }
         if numeric_constants is None
         else numeric_constants
     )
 
-    graph = gg.GrammarGraph.from_grammar(grammar) if graph is None else graph
+    graph = grammar_graph(grammar_to_immutable(grammar)) if graph is None else graph
 
     # We eliminate all quantified formulas over derivation tree elements
     # by replacing them by the finite set of matches in the inner trees.
@@ -1081,20 +1224,16 @@ def eliminate_quantifiers_in_numeric_quantified_formula(
             ),
         )
 
-        context_formula = context_formula | reduce(
-            Formula.__or__,
-            [
-                eliminate_quantifiers(
-                    quantified_formula.inner_formula.substitute_variables(
-                        {quantified_formula.bound_variable: constant}
-                    ),
-                    grammar,
-                    graph=graph,
-                    numeric_constants=numeric_constants,
-                )
-                for constant in numeric_constants
-            ],
-            sc.false(),
+        context_formula = context_formula | DisjunctiveFormula.from_iter(
+            eliminate_quantifiers(
+                quantified_formula.inner_formula.substitute_variables(
+                    {quantified_formula.bound_variable: constant}
+                ),
+                grammar,
+                graph=graph,
+                numeric_constants=numeric_constants,
+            )
+            for constant in numeric_constants
         )
     elif isinstance(quantified_formula, ForallIntFormula):
         context_formula = replace_formula(
@@ -1128,8 +1267,9 @@ def eliminate_quantifiers_in_quantified_formula(
     # from which the nonterminal of the bound variale can be reached. In that case,
     # we don't know whether the formula holds. We can still instantiate all matches,
     # but have to keep the original formula.
+    reachability = graph_reachability(graph)
     keep_orig_formula = keep_existential_quantifiers or any(
-        graph.reachable(leaf.value, quantified_formula.bound_variable.n_type)
+        quantified_formula.bound_variable.n_type in reachability[leaf.value]
         for _, leaf in quantified_formula.in_variable.open_leaves()
     )
 
@@ -1151,16 +1291,19 @@ def eliminate_quantifiers_in_quantified_formula(
         for match in matches
     ]
 
-    reduce_op = (
-        Formula.__and__
+    combinator = (
+        ConjunctiveFormula
         if isinstance(quantified_formula, ForallFormula)
-        else Formula.__or__
+        else DisjunctiveFormula
     )
 
     if instantiations:
-        replacement = reduce(reduce_op, instantiations)
-        if keep_orig_formula:
-            replacement = reduce_op(quantified_formula, replacement)
+        # Build one flat n-ary combination instead of folding the instantiations
+        # pairwise, which would create (and hash) a new intermediate formula for
+        # every single instantiation.
+        replacement = combinator.from_iter(
+            ([quantified_formula] if keep_orig_formula else []) + instantiations
+        )
 
         return replace_formula(context_formula, quantified_formula, replacement)
 
@@ -1179,12 +1322,57 @@ def matches_for_quantified_formula(
     grammar: Grammar,
     in_tree: Optional[DerivationTree] = None,
     initial_assignments: Optional[Dict[Variable, Tuple[Path, DerivationTree]]] = None,
+    immutable_grammar: Optional[ImmutableGrammar] = None,
 ) -> List[Dict[Variable, Tuple[Path, DerivationTree]]]:
     assert in_tree is None or isinstance(in_tree, DerivationTree)
     if in_tree is None:
         in_tree = formula.in_variable
         assert isinstance(in_tree, DerivationTree)
 
+    # The solver repeatedly matches the same (immutable) formulas against their
+    # `in` trees; these matches are cached per formula and grammar. Callers that
+    # already have the grammar in immutable form should pass it, which saves the
+    # conversion. The cached matches are shared, so we return copies.
+    if not initial_assignments and in_tree is formula.in_variable:
+        if immutable_grammar is None:
+            immutable_grammar = grammar_to_immutable(grammar)
+
+        return [
+            dict(match) for match in matches_in_formula_tree(formula, immutable_grammar)
+        ]
+
+    return compute_matches_for_quantified_formula(
+        formula, grammar, in_tree, initial_assignments
+    )
+
+
+@lru_cache(maxsize=1024)
+def matches_in_formula_tree(
+    formula: QuantifiedFormula, grammar: ImmutableGrammar
+) -> Tuple[Dict[Variable, Tuple[Path, DerivationTree]], ...]:
+    """
+    Returns the (cached) matches of the quantified formula in the derivation
+    tree it quantifies over.
+
+    :param formula: The quantified formula whose `in` variable is a tree.
+    :param grammar: The grammar in immutable form.
+    :return: The matches of the formula in its tree.
+    """
+
+    assert isinstance(formula.in_variable, DerivationTree)
+    return tuple(
+        compute_matches_for_quantified_formula(
+            formula, grammar_to_mutable(grammar), formula.in_variable
+        )
+    )
+
+
+def compute_matches_for_quantified_formula(
+    formula: QuantifiedFormula,
+    grammar: Grammar,
+    in_tree: DerivationTree,
+    initial_assignments: Optional[Dict[Variable, Tuple[Path, DerivationTree]]] = None,
+) -> List[Dict[Variable, Tuple[Path, DerivationTree]]]:
     qfd_var: BoundVariable = formula.bound_variable
     bind_expr: Optional[BindExpression] = formula.bind_expression
     new_assignments: List[Dict[Variable, Tuple[Path, DerivationTree]]] = []
@@ -1225,7 +1413,6 @@ def matches_for_quantified_formula(
                 new_assignments.append(new_assignment)
 
     in_tree.traverse(search_action)
-
     return new_assignments
 
 
@@ -1249,77 +1436,100 @@ def approximate_isla_to_smt_formula(
     replace_untranslatable_with_predicate=False,
     predicate_mapping: Optional[Dict[Formula, z3.BoolRef]] = None,
 ) -> z3.BoolRef:
+    """
+    Translates the given formula to an SMT formula. Quantifiers over derivation
+    trees and predicates cannot be translated; if
+    :code:`replace_untranslatable_with_predicate` is set, they are replaced by
+    fresh propositional variables (stored in :code:`predicate_mapping`).
+
+    Nested conjunctions and disjunctions are flattened into n-ary ones:
+
+    >>> x = Constant("x", "<x>")
+    >>> a = SMTFormula(z3_eq(x.to_smt(), z3.StringVal("a")), x)
+    >>> b = SMTFormula(z3_eq(x.to_smt(), z3.StringVal("b")), x)
+    >>> c = SMTFormula(z3_eq(x.to_smt(), z3.StringVal("c")), x)
+    >>> print(approximate_isla_to_smt_formula(a | (b | c)))
+    Or(x == "a", x == "b", x == "c")
+
+    :param formula: The formula to translate.
+    :param replace_untranslatable_with_predicate: Whether to replace untranslatable
+      subformulas by propositional variables.
+    :param predicate_mapping: A mapping from untranslatable subformulas to
+      propositional variables, which is extended by this function.
+    :return: The SMT formula.
+    """
+
     assert not predicate_mapping or replace_untranslatable_with_predicate
     predicate_mapping = {} if predicate_mapping is None else predicate_mapping
+    predicate_names: Set[str] = {str(p) for p in predicate_mapping.values()}
 
-    if isinstance(formula, SMTFormula):
-        return formula.formula
-
-    if isinstance(formula, ConjunctiveFormula):
-        return z3_and(
-            [
-                approximate_isla_to_smt_formula(
-                    child, replace_untranslatable_with_predicate, predicate_mapping
-                )
-                for child in formula.args
-            ]
-        )
-
-    if isinstance(formula, DisjunctiveFormula):
-        return z3_or(
-            [
-                approximate_isla_to_smt_formula(
-                    child, replace_untranslatable_with_predicate, predicate_mapping
-                )
-                for child in formula.args
-            ]
-        )
-
-    if isinstance(formula, NegatedFormula):
-        return z3.Not(
-            approximate_isla_to_smt_formula(
-                formula.args[0],
-                replace_untranslatable_with_predicate,
-                predicate_mapping,
+    def translate_untranslatable(subformula: Formula) -> z3.BoolRef:
+        if not replace_untranslatable_with_predicate:
+            raise NotImplementedError(
+                f"Don't know how to translate formula {subformula} to SMT"
             )
-        )
-
-    if isinstance(formula, ForallIntFormula):
-        return z3.ForAll(
-            [formula.bound_variable.to_smt()],
-            approximate_isla_to_smt_formula(
-                formula.inner_formula,
-                replace_untranslatable_with_predicate,
-                predicate_mapping,
-            ),
-        )
 
-    if isinstance(formula, ExistsIntFormula):
-        return z3.Exists(
-            [formula.bound_variable.to_smt()],
-            approximate_isla_to_smt_formula(
-                formula.inner_formula,
-                replace_untranslatable_with_predicate,
-                predicate_mapping,
-            ),
-        )
-
-    if not replace_untranslatable_with_predicate:
-        raise NotImplementedError(
-            f"Don't know how to translate formula {formula} to SMT"
-        )
-
-    if formula not in predicate_mapping:
-        name_idx = 1
-        replacement = z3.Bool(f"P_{name_idx}")
-        while replacement in predicate_mapping.values():
-            replacement = z3.Bool(f"P_{name_idx}")
-            name_idx += 1
+        if subformula not in predicate_mapping:
+            name_idx = 1
+            while f"P_{name_idx}" in predicate_names:
+                name_idx += 1
+
+            predicate_names.add(f"P_{name_idx}")
+            predicate_mapping[subformula] = z3.Bool(f"P_{name_idx}")
+
+        return predicate_mapping[subformula]
+
+    # We translate the formula in an iterative post-order traversal. Results are
+    # stored by formula ID; identical subformulas are thus only translated once.
+    results: Dict[int, z3.BoolRef] = {}
+    stack: List[Tuple[Formula, bool]] = [(formula, False)]
+    while stack:
+        subformula, children_translated = stack.pop()
+        if id(subformula) in results:
+            continue
+
+        if isinstance(subformula, SMTFormula):
+            results[id(subformula)] = subformula.formula
+            continue
+
+        if isinstance(subformula, ConjunctiveFormula):
+            children = split_conjunction(subformula)
+        elif isinstance(subformula, DisjunctiveFormula):
+            children = split_disjunction(subformula)
+        elif isinstance(subformula, NegatedFormula):
+            children = list(subformula.args)
+        elif isinstance(subformula, (ForallIntFormula, ExistsIntFormula)):
+            children = [subformula.inner_formula]
+        else:
+            results[id(subformula)] = translate_untranslatable(subformula)
+            continue
+
+        if not children_translated:
+            stack.append((subformula, True))
+            stack.extend((child, False) for child in reversed(children))
+            continue
+
+        translated_children = [results[id(child)] for child in children]
+
+        if isinstance(subformula, ConjunctiveFormula):
+            result = z3_and(translated_children)
+        elif isinstance(subformula, DisjunctiveFormula):
+            result = z3_or(translated_children)
+        elif isinstance(subformula, NegatedFormula):
+            result = z3.Not(translated_children[0])
+        elif isinstance(subformula, ForallIntFormula):
+            result = z3.ForAll(
+                [subformula.bound_variable.to_smt()], translated_children[0]
+            )
+        else:
+            assert isinstance(subformula, ExistsIntFormula)
+            result = z3.Exists(
+                [subformula.bound_variable.to_smt()], translated_children[0]
+            )
 
-        assert replacement not in predicate_mapping.values()
-        predicate_mapping[formula] = replacement
+        results[id(subformula)] = result
 
-    return predicate_mapping[formula]
+    return results[id(formula)]
 
 
 z3_type_predicate = z3.Function("type", z3.StringSort(), z3.StringSort(), z3.BoolSort())
@@ -1384,36 +1594,36 @@ def quantified_formula_might_match(
     formula does not already match.
     """
     if reachable is None:
-        reachable = gg.GrammarGraph.from_grammar(grammar).reachable
+        reachability = nonterminal_reachability(grammar_to_immutable(grammar))
+
+        def reachable(from_nonterminal: str, to_nonterminal: str) -> bool:
+            return to_nonterminal in reachability[from_nonterminal]
 
     node = tree.get_subtree(path_to_nonterminal)
     assert (
         node.children is None
     ), "quantified_formula_might_match only works for open leaf nodes"
 
-    if qfd_formula.in_variable.find_node(node) is None:
+    # If `tree` is the tree quantified over, `node` is trivially part of it; this
+    # saves a full search in `tree` for each open leaf checked by the solver.
+    if (
+        tree is not qfd_formula.in_variable
+        and qfd_formula.in_variable.find_node(node) is None
+    ):
         return False
 
     qfd_nonterminal = qfd_formula.bound_variable.n_type
 
     if qfd_formula.is_already_matched(node):
-        # This formula will only match `node` IFF (1) there is a subtree in `node` that
-        # might match or (2) the quantified nonterminal is reachable from (the *open*)
-        # `node`.
-        return (
-            node.children is None and reachable(node.value, qfd_nonterminal)
-        ) or any(
-            quantified_formula_might_match(qfd_formula, path, node, grammar, reachable)
-            for path, _ in node.paths()
-            if path
-        )
+        # This formula will only match `node` IFF the quantified nonterminal is
+        # reachable from (the *open*) `node`. Since `node` is a leaf, it has no
+        # subtrees that might match.
+        return reachable(node.value, qfd_nonterminal)
 
     if qfd_nonterminal == node.value:
         return qfd_formula.bind_expression is not None
 
-    if qfd_nonterminal != node.value and (
-        node.value == qfd_nonterminal or reachable(node.value, qfd_nonterminal)
-    ):
+    if reachable(node.value, qfd_nonterminal):
         return True
 
     if qfd_formula.bind_expression is None:
@@ -1421,10 +1631,6 @@ def quantified_formula_might_match(
         return False
 
     # This leaf won't reach the "root node" of the match tree for `qfd_formula`.
-    assert qfd_nonterminal != node.value and not (
-        node.value == qfd_nonterminal or reachable(node.value, qfd_nonterminal)
-    )
-
     return can_extend_leaf_to_make_quantifier_match_parent(
         qfd_formula, path_to_nonterminal, tree, grammar, reachable
     )
@@ -26,10 +26,12 @@ from orderedset import OrderedSet
 from isla import language
 from isla.helpers import (
     is_prefix,
+    is_prefix_free,
     path_iterator,
     dict_of_lists_to_list_of_dicts,
     assertions_activated,
     is_nonterminal,
+    graph_reachability,
 )
 from isla.derivation_tree import DerivationTree
 from isla.parser import non_canonical
@@ -196,7 +198,7 @@ def compute_self_embeddings(
     if (
         not isinstance(curr_node, str)
         or not is_nonterminal(curr_node)
-        or not graph.reachable(graph.get_node(curr_node), graph.get_node(curr_node))
+        or curr_node not in graph_reachability(graph)[curr_node]
     ):
         return []
 
@@ -259,6 +261,7 @@ def compute_direct_embeddings(
     # perfect_matches: List[Path] = []
     embeddable_matches: List[Tuple[Path, DerivationTree]] = []
 
+    reachability = graph_reachability(graph)
     for subtree_path, subtree in in_tree.paths():
         node, children = subtree
         if not isinstance(node, str):
@@ -270,7 +273,7 @@ def compute_direct_embeddings(
         #  if node == to_insert_nonterminal:
         #      perfect_matches.append(subtree_path)
 
-        if graph.reachable(graph.get_node(node), graph.get_node(tree.value)):
+        if tree.value in reachability[node]:
             embeddable_matches.append((subtree_path, subtree))
 
     results: Dict[int, DerivationTree] = {}
@@ -340,6 +343,7 @@ def insert_trees(
         ids_in_into_tree = {t.id for _, t in into_tree.filter(lambda _: True)}
         assert ids_in_tree_to_insert.isdisjoint(ids_in_into_tree)
 
+    reachability = graph_reachability(graph)
     possible_insertion_points: Dict[DerivationTree, List[Path]] = {
         tree: [
             path
@@ -349,7 +353,7 @@ def insert_trees(
                 or (
                     is_nonterminal(subtree.value)
                     and is_nonterminal(insert_tree_subtree.value)
-                    and graph.reachable(subtree.value, insert_tree_subtree.value)
+                    and insert_tree_subtree.value in reachability[subtree.value]
                 )
                 for insert_tree_subtree in children_with_at_most_one_parent(tree)
             )
@@ -367,17 +371,7 @@ def insert_trees(
     possible_combinations: List[Dict[DerivationTree, Path]] = [
         combination
         for combination in all_combinations
-        if combination
-        and all(
-            idx_1 == idx_2
-            or (
-                path_1 != path_2
-                and not is_prefix(path_1, path_2)
-                and not is_prefix(path_2, path_1)
-            )
-            for idx_1, path_1 in enumerate(combination.values())
-            for idx_2, path_2 in enumerate(combination.values())
-        )
+        if combination and is_prefix_free(combination.values())
     ]
 
     result: List[DerivationTree] = []
@@ -460,6 +454,7 @@ def find_higher_up_insertion_points(
 ) -> Dict[Path, DerivationTree]:
     result: Dict[Path, DerivationTree] = {}
 
+    reachability = graph_reachability(graph)
     for subtree in single_parent_tree_children:
         # We might have to insert subtree some steps higher up in the hierarchy.
         # Example Scriptsize-C: If we insert a <declaration> at a <statement> node,
@@ -475,7 +470,7 @@ def find_higher_up_insertion_points(
             if tree.get_subtree(p).value == subtree.value:
                 continue
 
-            if graph.reachable(tree.get_subtree(p).value, subtree.value):
+            if subtree.value in reachability[tree.get_subtree(p).value]:
                 result[p] = tree.get_subtree(p)
 
     return result
@@ -559,7 +554,7 @@ def wrap_in_tree_starting_in(
     start_node = graph.get_node(start_nonterminal)
     end_node = graph.get_node(tree.root_nonterminal())
     parse_tree = tree.to_parse_tree()
-    assert graph.reachable(start_node, end_node)
+    assert end_node.symbol in graph_reachability(graph)[start_nonterminal]
 
     derivation_path = [
         n.symbol for n in graph.shortest_non_trivial_path(start_node, end_node)
@@ -682,7 +677,7 @@ def paths_between(
     prefixes: List[Tuple[Set[Node], List[Node]]] = [
         (
             set()
-            if start_node == dest_node and graph.reachable(start_node, start_node)
+            if start_node == dest_node and start in graph_reachability(graph)[start]
             else {start_node},
             [start_node],
         )
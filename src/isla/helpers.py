@@ -28,7 +28,7 @@ import re
 import sys
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from functools import lru_cache, reduce
+from functools import lru_cache
 from typing import (
     Set,
     Generator,
@@ -46,8 +46,11 @@ from typing import (
     Generic,
     Iterator,
     Type,
+    FrozenSet,
 )
 
+from grammar_graph.gg import GrammarGraph
+
 from isla.global_config import GLOBAL_CONFIG
 from isla.type_defs import (
     Path,
@@ -110,27 +113,41 @@ def path_iterator(
 
 
 def delete_unreachable(grammar: Grammar) -> Grammar:
+    unreachable = unreachable_nonterminals(grammar)
     return {
         nonterminal: expansions
         for nonterminal, expansions in grammar.items()
-        if nonterminal not in unreachable_nonterminals(grammar)
+        if nonterminal not in unreachable
     }
 
 
 def is_prefix(path_1: Path, path_2: Path) -> bool:
-    if not path_1:
-        return True
+    return len(path_1) <= len(path_2) and all(map(operator.eq, path_1, path_2))
 
-    if not path_2:
-        return False
 
-    car_1, *cdr_1 = path_1
-    car_2, *cdr_2 = path_2
+def is_prefix_free(paths: Iterable[Path]) -> bool:
+    """
+    Checks whether none of the given paths is a prefix of (or equal to) another one.
+    In the lexicographic order of the paths, all paths between a path and one of
+    its extensions extend that path, too. Thus, it suffices to compare neighbors
+    after sorting instead of comparing all pairs of paths.
 
-    if car_1 != car_2:
-        return False
-    else:
-        return is_prefix(cdr_1, cdr_2)
+    >>> is_prefix_free([(0, 1), (1,), (0, 2, 0)])
+    True
+    >>> is_prefix_free([(0, 1), (1,), (0, 1, 0)])
+    False
+    >>> is_prefix_free([(1,), (0,), (1,)])
+    False
+
+    :param paths: The paths to check.
+    :return: True iff no path is a prefix of another one.
+    """
+
+    sorted_paths = sorted(paths)
+    return not any(
+        is_prefix(path_1, path_2)
+        for path_1, path_2 in zip(sorted_paths, sorted_paths[1:])
+    )
 
 
 TRAVERSE_PREORDER = 0
@@ -299,31 +316,45 @@ def cluster_by_common_elements(
     :param f: The function to determine commonality.
     :return: The clusters w.r.t. f.
     """
-    clusters = [[e2 for e2 in a_list if not f(e1).isdisjoint(f(e2))] for e1 in a_list]
+    # We compute the elements of interest only once and index them, such that
+    # neighbors of an element can be looked up instead of comparing all pairs.
+    elements_of_interest: List[Set[S]] = [f(e) for e in a_list]
+    index: Dict[S, List[int]] = {}
+    for idx, elements in enumerate(elements_of_interest):
+        for element in elements:
+            index.setdefault(element, []).append(idx)
+
+    result: List[Tuple[List[int], Set[S]]] = []
+    for idx in range(len(a_list)):
+        cluster = sorted({j for e in elements_of_interest[idx] for j in index[e]})
+        cluster_elements = set().union(*[elements_of_interest[j] for j in cluster])
 
-    result = []
-    for c in clusters:
         # Merge clusters with common elements...
-        clusters_with_common_elements = [
-            c1
-            for c1 in result
-            if any(not f(e).isdisjoint(f(e1)) for e in c for e1 in c1)
-        ]
-        for c1 in clusters_with_common_elements:
-            result.remove(c1)
-
-        merged_cluster = c + [e for c1 in clusters_with_common_elements for e in c1]
+        merged_cluster = list(cluster)
+        merged_elements = set(cluster_elements)
+        remaining_clusters = []
+        for c1, c1_elements in result:
+            if cluster_elements.isdisjoint(c1_elements):
+                remaining_clusters.append((c1, c1_elements))
+            else:
+                merged_cluster.extend(c1)
+                merged_elements |= c1_elements
 
         # ...and remove duplicate elements from the merged cluster.
+        remaining_clusters.append(
+            (list(dict.fromkeys(merged_cluster)), merged_elements)
+        )
+        result = remaining_clusters
+
+    clusters = []
+    for cluster, _ in result:
         no_dupl_cluster = []
-        for cluster in merged_cluster:
-            if cluster in no_dupl_cluster:
-                continue
-            no_dupl_cluster.append(cluster)
+        for elem in (a_list[idx] for idx in cluster):
+            if elem not in no_dupl_cluster:
+                no_dupl_cluster.append(elem)
+        clusters.append(no_dupl_cluster)
 
-        result.append(no_dupl_cluster)
-
-    return result
+    return clusters
 
 
 def srange(characters: str) -> List[str]:
@@ -554,6 +585,123 @@ def unreachable_nonterminals(
     return grammar.keys() - reachable_nonterminals(grammar, _start_symbol)
 
 
+@lru_cache(maxsize=128)
+def nonterminal_reachability(grammar: ImmutableGrammar) -> Dict[str, FrozenSet[str]]:
+    """
+    Computes the reachability relation between the nonterminals of the given grammar.
+    A nonterminal reaches another one if the latter occurs in a derivation from the
+    former in at least one expansion step. Thus, as for
+    :meth:`~grammar_graph.gg.GrammarGraph.reachable`, the relation is not reflexive.
+    It is cached for the 128 most recently used grammars, such that reachability
+    checks become simple set lookups.
+
+    >>> grammar = grammar_to_immutable({
+    ...     "<start>": ["<a>"],
+    ...     "<a>": ["a<b>", ""],
+    ...     "<b>": ["b<a>", "<c>"],
+    ...     "<c>": ["c"]})
+    >>> sorted(nonterminal_reachability(grammar)["<a>"])
+    ['<a>', '<b>', '<c>']
+    >>> sorted(nonterminal_reachability(grammar)["<c>"])
+    []
+
+    :param grammar: The grammar in immutable form.
+    :return: A mapping from nonterminals to the nonterminals reachable from them.
+    """
+
+    # We assign each nonterminal an index and represent the nonterminals reachable
+    # from it as a bit set, i.e., an int whose i-th bit is set iff the nonterminal
+    # with index i is reachable. The transitive closure is then computed by
+    # Warshall's algorithm, where each step is a single bitwise "or" of two rows.
+    index: Dict[str, int] = {}
+    successors: Dict[str, Set[str]] = {}
+    for nonterminal, expansions in grammar:
+        index.setdefault(nonterminal, len(index))
+        successors[nonterminal] = {
+            successor
+            for expansion in expansions
+            for successor in nonterminals(expansion)
+        }
+        for successor in successors[nonterminal]:
+            index.setdefault(successor, len(index))
+
+    reach: List[int] = [0] * len(index)
+    for nonterminal, direct_successors in successors.items():
+        for successor in direct_successors:
+            reach[index[nonterminal]] |= 1 << index[successor]
+
+    for k, reach_k in enumerate(reach):
+        if not reach_k:
+            continue
+
+        bit_k = 1 << k
+        for i, reach_i in enumerate(reach):
+            if reach_i & bit_k:
+                reach[i] = reach_i | reach_k
+
+    nonterminals_by_index = list(index)
+    result: Dict[str, FrozenSet[str]] = {}
+    for nonterminal in successors:
+        bits = reach[index[nonterminal]]
+        reached: Set[str] = set()
+        while bits:
+            lowest_bit = bits & -bits
+            reached.add(nonterminals_by_index[lowest_bit.bit_length() - 1])
+            bits ^= lowest_bit
+
+        result[nonterminal] = frozenset(reached)
+
+    return result
+
+
+@lru_cache(maxsize=128)
+def graph_reachability(graph: GrammarGraph) -> Dict[str, FrozenSet[str]]:
+    """
+    Returns the :func:`~isla.helpers.nonterminal_reachability` relation for the
+    grammar of the given graph. Use this instead of
+    :meth:`~grammar_graph.gg.GrammarGraph.reachable` when checking reachability
+    between nonterminals in a loop: the latter performs a graph search per
+    (uncached) query.
+
+    >>> graph = GrammarGraph.from_grammar({
+    ...     "<start>": ["<a>"],
+    ...     "<a>": ["a<b>", ""],
+    ...     "<b>": ["b"]})
+    >>> "<b>" in graph_reachability(graph)["<start>"]
+    True
+    >>> "<a>" in graph_reachability(graph)["<b>"]
+    False
+
+    :param graph: The grammar graph.
+    :return: A mapping from nonterminals to the nonterminals reachable from them.
+    """
+
+    return nonterminal_reachability(grammar_to_immutable(graph.to_grammar()))
+
+
+@lru_cache(maxsize=128)
+def graph_canonical_grammar(graph: GrammarGraph) -> CanonicalGrammar:
+    """
+    Returns the grammar of the given graph in canonical form. Predicates receiving
+    the solver's grammar graph should use this function instead of converting the
+    grammar of the graph in each evaluation. The result is shared between callers
+    and must not be modified.
+
+    >>> graph = GrammarGraph.from_grammar({
+    ...     "<start>": ["<a>"],
+    ...     "<a>": ["a<a>", ""]})
+    >>> graph_canonical_grammar(graph)["<a>"]
+    [['a', '<a>'], []]
+    >>> graph_canonical_grammar(graph) is graph_canonical_grammar(graph)
+    True
+
+    :param graph: The grammar graph.
+    :return: The canonical grammar of the graph.
+    """
+
+    return canonical(graph.grammar)
+
+
 def is_valid_grammar(
     grammar: Grammar,
     _start_symbol: str = start_symbol(),
@@ -1032,40 +1180,23 @@ def merge_intervals(
     :param list_of_maybe_intervals: The sequence of potential lists of intervals.
     :return: A potential list of intervals.
     """
-    maybe_list_of_intervals: Maybe[List[Tuple[int, int]]] = reduce(
-        lambda acc, maybe_intervals: acc.bind(
-            lambda list_of_intervals: maybe_intervals.bind(
-                lambda other_list_of_intervals: Maybe(
-                    list_of_intervals + other_list_of_intervals
-                )
-            )
-        ),
-        list_of_maybe_intervals,
-    )
+    intervals: List[Tuple[int, int]] = []
+    for maybe_intervals in list_of_maybe_intervals:
+        if not maybe_intervals.is_present():
+            return Maybe.nothing()
+        intervals.extend(maybe_intervals.get())
+
+    # After sorting, each interval either extends the last merged interval or
+    # starts a new one, so we merge in a single pass without copying the result.
+    # Overlapping or directly neighboring intervals are merged:
+    # (1, 4), (5, 7) -> (1, 7)
+    # (1, 4), (2, 5) -> (1, 5)
+    # (1, 4), (2, 3) -> (1, 4)
+    result: List[Tuple[int, int]] = []
+    for start, end in sorted(intervals, key=lambda interval: interval[0]):
+        if result and start <= result[-1][1] + 1:
+            result[-1] = (result[-1][0], max(result[-1][1], end))
+        else:
+            result.append((start, end))
 
-    def merge_two_intervals(
-        i1: Tuple[int, int], i2: Tuple[int, int]
-    ) -> List[Tuple[int, int]]:
-        assert i1[0] <= i2[0], "Assumed sorted intervals"
-
-        if i1[1] + 1 < i2[0]:
-            # Separated intervals
-            return [i1, i2]
-
-        # Overlapping intervals:
-        # (1, 4), (5, 7) -> (1, 7)
-        # (1, 4), (2, 5) -> (1, 5)
-        # (1, 4), (2, 3) -> (1, 4)
-        return [(i1[0], max(i1[1], i2[1]))]
-
-    return maybe_list_of_intervals.map(
-        lambda list_of_intervals: reduce(
-            lambda acc, interval: (
-                [interval]
-                if not acc
-                else (acc[:-1] + merge_two_intervals(acc[-1], interval))
-            ),
-            sorted(list_of_intervals, key=lambda interval: interval[0]),
-            [],
-        )
-    )
+    return Maybe(result)
@@ -16,10 +16,9 @@
 # You should have received a copy of the GNU General Public License
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
 
-import copy
 import functools
 import random
-from typing import Union, List, Optional, Dict, Tuple, Callable
+from typing import Union, List, Optional, Dict, Tuple, Callable, FrozenSet
 import heapq
 
 from grammar_graph.gg import GrammarGraph
@@ -28,13 +27,14 @@ from isla import language
 from isla.derivation_tree import DerivationTree
 from isla.existential_helpers import insert_tree, DIRECT_EMBEDDING, SELF_EMBEDDING
 from isla.helpers import (
-    delete_unreachable,
+    grammar_to_immutable,
     parent_reflexive,
     parent_or_child,
     is_nonterminal,
-    canonical,
     Maybe,
     chain_functions,
+    graph_reachability,
+    graph_canonical_grammar,
 )
 from isla.language import (
     SemPredEvalResult,
@@ -42,26 +42,21 @@ from isla.language import (
     SemanticPredicate,
     Variable,
 )
-from isla.parser import EarleyParser
+from isla.parser import parser_for
 from isla.type_defs import Grammar, Path, ParseTree, CanonicalGrammar
 
 
 def is_before(_: Optional[DerivationTree], path_1: Path, path_2: Path) -> bool:
-    if not path_1 or not path_2:
-        # Note: (1,) is not before (1,0), since it's a prefix!
-        # Also, (1,) cannot be before ().
-        # But (1,0) would be before (1,1).
-        return False
-
-    car_1, *cdr_1 = path_1
-    car_2, *cdr_2 = path_2
+    # The first differing index decides. If there is none, one path is a prefix
+    # of the other (or they are equal), and neither comes before the other.
+    # Note: (1,) is not before (1,0), since it's a prefix!
+    # Also, (1,) cannot be before ().
+    # But (1,0) would be before (1,1).
+    for idx_1, idx_2 in zip(path_1, path_2):
+        if idx_1 != idx_2:
+            return idx_1 < idx_2
 
-    if car_1 < car_2:
-        return True
-    elif car_2 < car_1:
-        return False
-    else:
-        return is_before(_, tuple(cdr_1), tuple(cdr_2))
+    return False
 
 
 BEFORE_PREDICATE = StructuralPredicate("before", 2, is_before)
@@ -221,9 +216,25 @@ LEVEL_PREDICATE = StructuralPredicate("level", 4, level_check)
 
 
 def reachable(graph: GrammarGraph, fr: str, to: str) -> bool:
-    f_node = graph.get_node(fr)
-    t_node = graph.get_node(to)
-    return graph.reachable(f_node, t_node)
+    return to in graph_reachability(graph)[fr]
+
+
+@functools.lru_cache(maxsize=1024)
+def nonterminals_reaching(graph: GrammarGraph, to: str) -> FrozenSet[str]:
+    """
+    Computes the nonterminals from which `to` is reachable. Checking many leaves
+    against this set is cheaper than one :func:`reachable` call per leaf.
+
+    :param graph: The grammar graph.
+    :param to: The nonterminal to reach.
+    :return: The nonterminals from which `to` is reachable.
+    """
+
+    return frozenset(
+        nonterminal
+        for nonterminal, reachable_nonterminals in graph_reachability(graph).items()
+        if to in reachable_nonterminals
+    )
 
 
 def count(  # noqa: C901
@@ -238,11 +249,10 @@ def count(  # noqa: C901
 
     num_needle_occurrences = len(in_tree.filter(lambda t: t.value == needle))
 
-    leaf_nonterminals = [node.value for _, node in in_tree.open_leaves()]
+    reaching_needle = nonterminals_reaching(graph, needle)
 
     more_needles_possible = any(
-        reachable(graph, leaf_nonterminal, needle)
-        for leaf_nonterminal in leaf_nonterminals
+        node.value in reaching_needle for _, node in in_tree.open_leaves()
     )
 
     if isinstance(num, Variable):
@@ -315,7 +325,7 @@ def count(  # noqa: C901
     def num_needles(candidate: DerivationTree) -> int:
         return len(candidate.filter(lambda t: t.value == needle))
 
-    canonical_grammar = canonical(graph.to_grammar())
+    canonical_grammar = graph_canonical_grammar(graph)
 
     candidates: List[Tuple[int, DerivationTree]] = []
 
@@ -337,7 +347,7 @@ def count(  # noqa: C901
         leaves_reaching_needle = [
             (leaf_path, leaf_node)
             for leaf_path, leaf_node in candidate.open_leaves()
-            if reachable(graph, leaf_node.value, needle)
+            if leaf_node.value in reaching_needle
         ]
 
         if candidate_needle_occurrences == target_num_needle_occurrences:
@@ -417,6 +427,8 @@ def find_expansion_without_needle(
     :return: `None` or a tree rooted in `root_node` not containing any node labeled
     with `needle` such that `needle` is not reachable from any leaf.
     """
+    reaching_needle = nonterminals_reaching(graph, needle)
+
     expanded_trees = [root_node]
     while expanded_trees:
         for new_tree in expanded_trees.pop().expand_one_step(canonical_grammar):
@@ -424,7 +436,7 @@ def find_expansion_without_needle(
                 continue
 
             if all(
-                not reachable(graph, leaf_node.value, needle)
+                leaf_node.value not in reaching_needle
                 for leaf_path, leaf_node in new_tree.open_leaves()
             ):
                 return new_tree
@@ -578,10 +590,11 @@ def just(
 
 
 def mk_parser(grammar: Grammar):
+    immutable_grammar = grammar_to_immutable(grammar)
+
     def Parser(start: str) -> Callable[[str], List[ParseTree]]:
-        specialized_grammar = copy.deepcopy(grammar) | {"<start>": [start]}
-        specialized_grammar = delete_unreachable(specialized_grammar)
-        parser = EarleyParser(specialized_grammar)
+        # Predicates create parsers on each evaluation; `parser_for` shares them.
+        parser = parser_for(immutable_grammar, start)
 
         def result(inp: str) -> List[ParseTree]:
             return list(parser.parse(inp))
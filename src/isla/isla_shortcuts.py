@@ -15,7 +15,6 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
-import functools
 from functools import cache
 from typing import Union
 
@@ -34,6 +33,8 @@ from isla.language import (
     ExistsFormula,
     StructuralPredicateFormula,
     SMTFormula,
+    ConjunctiveFormula,
+    DisjunctiveFormula,
 )
 
 
@@ -96,8 +97,8 @@ def smt_for(formula: z3.BoolRef, *free_variables: Variable) -> SMTFormula:
 
 
 def conjunction(*formulas: Formula) -> Formula:
-    return functools.reduce(lambda a, b: a & b, formulas, true())
+    return ConjunctiveFormula.from_iter(formulas)
 
 
 def disjunction(*formulas: Formula) -> Formula:
-    return functools.reduce(lambda a, b: a | b, formulas, false())
+    return DisjunctiveFormula.from_iter(formulas)
@@ -16,7 +16,6 @@
 # You should have received a copy of the GNU General Public License
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
 
-import copy
 import dataclasses
 import functools
 import itertools
@@ -43,6 +42,10 @@ from typing import (
     Protocol,
     TypeVar,
     MutableSet,
+    Type,
+    FrozenSet,
+    Iterator,
+    Any,
 )
 
 import antlr4
@@ -72,7 +75,6 @@ from isla.helpers import (
     Maybe,
     chain_functions,
     eassert,
-    Exceptional,
     instantiate_escaped_symbols,
     unreachable_nonterminals,
 )
@@ -92,14 +94,17 @@ from isla.parser import EarleyParser, PEGParser
 from isla.type_defs import Path, Grammar, ImmutableGrammar, ImmutableList, Pair
 from isla.z3_helpers import (
     is_valid,
+    evaluate_instantiated_z3_expression,
     z3_push_in_negations,
     z3_subst,
     get_symbols,
     smt_expr_to_str,
+    z3_string,
 )
 
 SolutionState = List[Tuple["Constant", "Formula", "DerivationTree"]]
 Assignment = Tuple["Constant", "Formula", "DerivationTree"]
+T = TypeVar("T")
 
 language_core_logger = logging.getLogger("isla-language-core")
 
@@ -117,21 +122,40 @@ class Variable:
     def __init__(self, name: str, n_type: str):
         self.name = name
         self.n_type = n_type
+        self.__hash: Optional[int] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # String hashes differ between interpreter runs, so we do not persist the
+        # cached hash.
+        result = dict(self.__dict__)
+        del result["_Variable__hash"]
+        return result
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.__hash = None
 
     def to_smt(self):
-        return z3.String(self.name)
+        return z3_string(self.name)
 
     def is_numeric(self):
         return self.n_type == Constant.NUMERIC_NTYPE
 
     def __eq__(self, other):
-        return type(self) is type(other) and (self.name, self.n_type) == (
-            other.name,
-            other.n_type,
+        # Variables are often compared with themselves, e.g., when looking them up
+        # in sets or dictionaries; we check identity first.
+        return self is other or (
+            type(self) is type(other)
+            and self.name == other.name
+            and self.n_type == other.n_type
         )
 
     def __hash__(self):
-        return hash((type(self).__name__, self.name, self.n_type))
+        # Variables are immutable and frequently stored in (ordered) sets, so we
+        # only compute the hash once.
+        if self.__hash is None:
+            self.__hash = hash((type(self).__name__, self.name, self.n_type))
+        return self.__hash
 
     def __repr__(self):
         return f'{type(self).__name__}("{self.name}", "{self.n_type}")'
@@ -227,11 +251,13 @@ class BindExpression:
             str, List[Tuple[DerivationTree, Dict[BoundVariable, Path]]]
         ] = {}
         self.__flattened_elements: Dict[str, Tuple[Tuple[BoundVariable, ...], ...]] = {}
+        self.__bound_variables: Optional[OrderedSet[BoundVariable]] = None
 
     def __add__(self, other: Union[str, "BoundVariable"]) -> "BindExpression":
         assert type(other) == str or type(other) == BoundVariable
         result = BindExpression(*self.bound_elements)
         result.bound_elements.append(other)
+        result.__bound_variables = None
         return result
 
     def substitute_variables(self, subst_map: Dict[Variable, Variable]):
@@ -243,10 +269,14 @@ class BindExpression:
         )
 
     def bound_variables(self) -> OrderedSet[BoundVariable]:
-        # Not isinstance(var, BoundVariable) since we want to exclude dummy variables
-        return OrderedSet(
-            [var for var in self.bound_elements if type(var) is BoundVariable]
-        )
+        # Not isinstance(var, BoundVariable) since we want to exclude dummy variables.
+        # The bound elements do not change after construction, so we compute the
+        # result once; we return a copy since callers may modify it.
+        if self.__bound_variables is None:
+            self.__bound_variables = OrderedSet(
+                [var for var in self.bound_elements if type(var) is BoundVariable]
+            )
+        return OrderedSet(self.__bound_variables)
 
     def all_bound_variables(self, grammar: Grammar) -> OrderedSet[BoundVariable]:
         # Includes dummy variables
@@ -710,6 +740,56 @@ class NoopFormulaTransformer(FormulaTransformer):
 
 
 class Formula(ABC):
+    # Formulas are immutable, so they cache values derived from their contents.
+    # `_CACHE_ATTRIBUTES` names the attributes holding these caches; subclasses
+    # add their own. Caches are not pickled: They are recomputed on demand, might
+    # refer to the formula itself, and cached hashes are only valid in the process
+    # that computed them.
+    _CACHE_ATTRIBUTES: Tuple[str, ...] = ("_Formula__views",)
+
+    # Views of this formula computed by functions like `split_conjunction`; see
+    # `cached_view`.
+    __views: Optional[Dict[str, Any]] = None
+
+    def cached_view(self, name: str, compute: Callable[[], T]) -> T:
+        """
+        Returns the view `name` of this formula (e.g., its conjuncts), which is
+        computed by `compute` when it is requested for the first time. Callers must
+        not modify the returned value.
+
+        >>> x = Constant("x", "<x>")
+        >>> a = SMTFormula(z3.Length(x.to_smt()) > 1, x)
+        >>> a.cached_view("str", lambda: str(a))
+        'Length(x) > 1'
+        >>> a.cached_view("str", lambda: "not computed again")
+        'Length(x) > 1'
+
+        :param name: The name of the view.
+        :param compute: A function computing the view.
+        :return: The (cached) view.
+        """
+
+        if self.__views is None:
+            self.__views = {}
+
+        try:
+            return self.__views[name]
+        except KeyError:
+            result = compute()
+            self.__views[name] = result
+            return result
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {
+            attribute: value
+            for attribute, value in self.__dict__.items()
+            if attribute not in self._CACHE_ATTRIBUTES
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.__dict__.update(dict.fromkeys(self._CACHE_ATTRIBUTES))
+
     @abstractmethod
     def bound_variables(self) -> OrderedSet[BoundVariable]:
         """Non-recursive: Only non-empty for quantified formulas"""
@@ -809,9 +889,9 @@ class Formula(ABC):
         if isinstance(self, NegatedFormula):
             return self.args[0]
         elif isinstance(self, ConjunctiveFormula):
-            return reduce(lambda a, b: a | b, [-arg for arg in self.args])
+            return reduce(operator.or_, (-arg for arg in self.args))
         elif isinstance(self, DisjunctiveFormula):
-            return reduce(lambda a, b: a & b, [-arg for arg in self.args])
+            return reduce(operator.and_, (-arg for arg in self.args))
         elif isinstance(self, ForallFormula):
             return ExistsFormula(
                 self.bound_variable,
@@ -896,8 +976,19 @@ class StructuralPredicateFormula(Formula):
         self.args: List[Variable | str | DerivationTree] = list(args)
 
     def evaluate(self, context_tree: DerivationTree) -> bool:
+        # We look up the paths of all tree arguments in a single traversal of
+        # `context_tree` instead of calling `find_node` for each argument.
+        wanted_ids = {arg.id for arg in self.args if not isinstance(arg, str)}
+        paths_by_id: Dict[int, Path] = {}
+        if wanted_ids:
+            for path, subtree in context_tree.paths():
+                if subtree.id in wanted_ids and subtree.id not in paths_by_id:
+                    paths_by_id[subtree.id] = path
+                    if len(paths_by_id) == len(wanted_ids):
+                        break
+
         args_with_paths: List[Union[str, Tuple[Path, DerivationTree]]] = [
-            arg if isinstance(arg, str) else (context_tree.find_node(arg), arg)
+            arg if isinstance(arg, str) else (paths_by_id.get(arg.id), arg)
             for arg in self.args
         ]
 
@@ -1202,23 +1293,51 @@ class SemanticPredicateFormula(Formula):
 
 
 class PropositionalCombinator(Formula, ABC):
+    _CACHE_ATTRIBUTES = Formula._CACHE_ATTRIBUTES + (
+        "_PropositionalCombinator__hash",
+        "_PropositionalCombinator__free_variables",
+        "_PropositionalCombinator__tree_arguments",
+        "_PropositionalCombinator__bound_variables",
+    )
+
     def __init__(self, *args: Formula):
         self.args = args
+        self.__hash: Optional[int] = None
+        self.__free_variables: Optional[OrderedSet[Variable]] = None
+        self.__tree_arguments: Optional[OrderedSet[DerivationTree]] = None
+        self.__bound_variables: Optional[OrderedSet[BoundVariable]] = None
 
     def bound_variables(self) -> OrderedSet[BoundVariable]:
-        return reduce(operator.or_, [arg.bound_variables() for arg in self.args])
+        # See `free_variables`.
+        if self.__bound_variables is None:
+            self.__bound_variables = OrderedSet(
+                itertools.chain.from_iterable(
+                    arg.bound_variables() for arg in self.args
+                )
+            )
+        return OrderedSet(self.__bound_variables)
 
     def free_variables(self) -> OrderedSet[Variable]:
-        result: OrderedSet[Variable] = OrderedSet([])
-        for arg in self.args:
-            result |= arg.free_variables()
-        return result
+        # Formulas are immutable, so we compute the free variables only once. We
+        # return a copy since callers may modify the result. The set is built in a
+        # single pass over all arguments' variables instead of by repeated unions.
+        if self.__free_variables is None:
+            self.__free_variables = OrderedSet(
+                itertools.chain.from_iterable(
+                    arg.free_variables() for arg in self.args
+                )
+            )
+        return OrderedSet(self.__free_variables)
 
     def tree_arguments(self) -> OrderedSet[DerivationTree]:
-        result: OrderedSet[DerivationTree] = OrderedSet([])
-        for arg in self.args:
-            result |= arg.tree_arguments()
-        return result
+        # See `free_variables`.
+        if self.__tree_arguments is None:
+            self.__tree_arguments = OrderedSet(
+                itertools.chain.from_iterable(
+                    arg.tree_arguments() for arg in self.args
+                )
+            )
+        return OrderedSet(self.__tree_arguments)
 
     def __len__(self):
         return 1 + len(self.args)
@@ -1227,7 +1346,10 @@ class PropositionalCombinator(Formula, ABC):
         return f"{type(self).__name__}({', '.join(map(repr, self.args))})"
 
     def __hash__(self):
-        return hash((type(self).__name__, self.args))
+        # Formulas are immutable, so we only compute the (recursive) hash once.
+        if self.__hash is None:
+            self.__hash = hash((type(self).__name__, self.args))
+        return self.__hash
 
     def __eq__(self, other):
         return type(self) == type(other) and self.args == other.args
@@ -1265,33 +1387,83 @@ class NegatedFormula(PropositionalCombinator):
             *[arg.substitute_expressions(subst_map) for arg in self.args]
         )
 
-    def __hash__(self):
-        return hash((type(self).__name__, self.args))
-
     def __str__(self):
         return f"¬({self.args[0]})"
 
 
 class ConjunctiveFormula(PropositionalCombinator):
+    _CACHE_ATTRIBUTES = PropositionalCombinator._CACHE_ATTRIBUTES + (
+        "_ConjunctiveFormula__hash",
+    )
+
     def __init__(self, *args: Formula):
         if len(args) < 2:
             raise RuntimeError(
                 f"Conjunction needs at least two arguments, {len(args)} given."
             )
         super().__init__(*args)
+        self.__hash: Optional[int] = None
+
+    @staticmethod
+    def from_iter(formulas: Iterable[Formula]) -> Formula:
+        """
+        Constructs a flat conjunction of the given formulas. In contrast to folding
+        the formulas with :code:`&`, this creates a single n-ary node. Nested
+        conjunctions are flattened, :code:`true` elements and duplicates are
+        dropped, and the result is :code:`false` if some element is :code:`false`
+        or contradicts another element.
+
+        >>> x = Constant("x", "<x>")
+        >>> a = SMTFormula(z3.Length(x.to_smt()) > 1, x)
+        >>> b = SMTFormula(z3.Length(x.to_smt()) < 5, x)
+        >>> c = SMTFormula(z3.Length(x.to_smt()) != 3, x)
+        >>> print(ConjunctiveFormula.from_iter([a, b & c, true(), b]))
+        (Length(x) > 1 ∧ Length(x) < 5 ∧ Length(x) != 3)
+        >>> print(ConjunctiveFormula.from_iter([a, true()]))
+        Length(x) > 1
+        >>> print(ConjunctiveFormula.from_iter([]))
+        True
+
+        :param formulas: The formulas to conjoin.
+        :return: The conjunction of the given formulas.
+        """
+
+        conjuncts: Dict[Formula, None] = {}
+        for formula in formulas:
+            for conjunct in split_conjunction(formula):
+                if isinstance(conjunct, SMTFormula):
+                    if conjunct.is_false:
+                        return conjunct
+                    if conjunct.is_true:
+                        continue
+
+                conjuncts[conjunct] = None
+
+        if any(
+            isinstance(conjunct, NegatedFormula) and conjunct.args[0] in conjuncts
+            for conjunct in conjuncts
+        ):
+            return false()
+
+        if not conjuncts:
+            return true()
+        if len(conjuncts) == 1:
+            return next(iter(conjuncts))
+
+        return ConjunctiveFormula(*conjuncts)
 
     def substitute_variables(self, subst_map: Dict[Variable, Variable]):
         return reduce(
-            lambda a, b: a & b,
-            [arg.substitute_variables(subst_map) for arg in self.args],
+            operator.and_,
+            (arg.substitute_variables(subst_map) for arg in self.args),
         )
 
     def substitute_expressions(
         self, subst_map: Dict[Union[Variable, DerivationTree], DerivationTree]
     ) -> Formula:
         return reduce(
-            lambda a, b: a & b,
-            [arg.substitute_expressions(subst_map) for arg in self.args],
+            operator.and_,
+            (arg.substitute_expressions(subst_map) for arg in self.args),
         )
 
     def accept(self, visitor: FormulaVisitor):
@@ -1306,7 +1478,11 @@ class ConjunctiveFormula(PropositionalCombinator):
         )
 
     def __hash__(self):
-        return hash((type(self).__name__, self.args))
+        # Consistent with `__eq__`, which does not distinguish differently nested
+        # conjunctions.
+        if self.__hash is None:
+            self.__hash = hash((type(self).__name__, tuple(split_conjunction(self))))
+        return self.__hash
 
     def __eq__(self, other):
         return split_conjunction(self) == split_conjunction(other)
@@ -1316,25 +1492,72 @@ class ConjunctiveFormula(PropositionalCombinator):
 
 
 class DisjunctiveFormula(PropositionalCombinator):
+    _CACHE_ATTRIBUTES = PropositionalCombinator._CACHE_ATTRIBUTES + (
+        "_DisjunctiveFormula__hash",
+    )
+
     def __init__(self, *args: Formula):
         if len(args) < 2:
             raise RuntimeError(
                 f"Disjunction needs at least two arguments, {len(args)} given."
             )
         super().__init__(*args)
+        self.__hash: Optional[int] = None
+
+    @staticmethod
+    def from_iter(formulas: Iterable[Formula]) -> Formula:
+        """
+        Constructs a flat disjunction of the given formulas; the dual of
+        :meth:`~isla.language.ConjunctiveFormula.from_iter`.
+
+        >>> x = Constant("x", "<x>")
+        >>> a = SMTFormula(z3.Length(x.to_smt()) > 1, x)
+        >>> b = SMTFormula(z3.Length(x.to_smt()) < 5, x)
+        >>> print(DisjunctiveFormula.from_iter([a | b, false(), a]))
+        (Length(x) > 1 ∨ Length(x) < 5)
+        >>> print(DisjunctiveFormula.from_iter([a, true()]))
+        True
+
+        :param formulas: The formulas to disjoin.
+        :return: The disjunction of the given formulas.
+        """
+
+        disjuncts: Dict[Formula, None] = {}
+        for formula in formulas:
+            for disjunct in split_disjunction(formula):
+                if isinstance(disjunct, SMTFormula):
+                    if disjunct.is_true:
+                        return disjunct
+                    if disjunct.is_false:
+                        continue
+
+                disjuncts[disjunct] = None
+
+        if any(
+            isinstance(disjunct, NegatedFormula) and disjunct.args[0] in disjuncts
+            for disjunct in disjuncts
+        ):
+            return true()
+
+        if not disjuncts:
+            return false()
+        if len(disjuncts) == 1:
+            return next(iter(disjuncts))
+
+        return DisjunctiveFormula(*disjuncts)
 
     def substitute_variables(self, subst_map: Dict[Variable, Variable]):
         return reduce(
-            lambda a, b: a | b,
-            [arg.substitute_variables(subst_map) for arg in self.args],
+            operator.or_,
+            (arg.substitute_variables(subst_map) for arg in self.args),
         )
 
     def substitute_expressions(
         self, subst_map: Dict[Union[Variable, DerivationTree], DerivationTree]
     ) -> Formula:
         return reduce(
-            lambda a, b: a | b,
-            [arg.substitute_expressions(subst_map) for arg in self.args],
+            operator.or_,
+            (arg.substitute_expressions(subst_map) for arg in self.args),
         )
 
     def accept(self, visitor: FormulaVisitor):
@@ -1349,7 +1572,10 @@ class DisjunctiveFormula(PropositionalCombinator):
         )
 
     def __hash__(self):
-        return hash((type(self).__name__, self.args))
+        # See `ConjunctiveFormula.__hash__`.
+        if self.__hash is None:
+            self.__hash = hash((type(self).__name__, tuple(split_disjunction(self))))
+        return self.__hash
 
     def __eq__(self, other):
         return split_disjunction(self) == split_disjunction(other)
@@ -1374,6 +1600,8 @@ def false() -> "SMTFormula":
 
 
 class SMTFormula(Formula):
+    _CACHE_ATTRIBUTES = Formula._CACHE_ATTRIBUTES + ("_SMTFormula__hash",)
+
     def __init__(
         self,
         formula: z3.BoolRef,
@@ -1413,9 +1641,13 @@ class SMTFormula(Formula):
 
         self.auto_subst = auto_subst
 
+        self.__hash: Optional[int] = None
+
     def __getstate__(self) -> Dict[str, bytes]:
         result: Dict[str, bytes] = {
-            f: pickle.dumps(v) for f, v in self.__dict__.items() if f != "formula"
+            f: pickle.dumps(v)
+            for f, v in self.__dict__.items()
+            if f != "formula" and f not in self._CACHE_ATTRIBUTES
         }
         # result["formula"] = self.formula.sexpr().encode("utf-8")
         result["formula"] = smt_expr_to_str(self.formula).encode("utf-8")
@@ -1437,6 +1669,7 @@ class SMTFormula(Formula):
         )[0]
 
         self.__dict__ = inst
+        self.__dict__.update(dict.fromkeys(self._CACHE_ATTRIBUTES))
         self.formula = z3_constr
 
     def substitute_variables(self, subst_map: Dict[Variable, Variable]) -> "SMTFormula":
@@ -1517,17 +1750,6 @@ class SMTFormula(Formula):
             ]
         )
 
-        new_smt_formula: z3.BoolRef = cast(
-            z3.BoolRef,
-            z3_subst(
-                self.formula,
-                {
-                    variable.to_smt(): z3.StringVal(str(tree))
-                    for variable, tree in complete_substitutions.items()
-                },
-            ),
-        )
-
         new_free_variables: OrderedSet[Variable] = OrderedSet(
             [
                 variable
@@ -1536,11 +1758,40 @@ class SMTFormula(Formula):
             ]
         )
 
-        if (
-            self.auto_eval
-            and len(new_free_variables) + len(new_instantiated_variables) == 0
-        ):
-            # Formula is ground, we can evaluate it!
+        is_ground = len(new_free_variables) + len(new_instantiated_variables) == 0
+        if self.auto_eval and is_ground:
+            # Formula is ground, we can evaluate it! All symbols of the formula are
+            # instantiated by `complete_substitutions`, so we can evaluate the
+            # (cached) translation of the formula without substituting first.
+            try:
+                result = evaluate_instantiated_z3_expression(
+                    self.formula,
+                    {
+                        variable.name: str(tree)
+                        for variable, tree in complete_substitutions.items()
+                    },
+                )
+                assert isinstance(result, bool)
+                return smt_atom(result)
+            except NotImplementedError:
+                pass
+
+        new_smt_formula: z3.BoolRef = (
+            cast(
+                z3.BoolRef,
+                z3_subst(
+                    self.formula,
+                    {
+                        variable.to_smt(): z3.StringVal(str(tree))
+                        for variable, tree in complete_substitutions.items()
+                    },
+                ),
+            )
+            if complete_substitutions
+            else self.formula
+        )
+
+        if self.auto_eval and is_ground:
             return smt_atom(is_valid(new_smt_formula).to_bool())
 
         return SMTFormula(
@@ -1661,9 +1912,12 @@ class SMTFormula(Formula):
         )
 
     def __hash__(self):
-        return hash(
-            (type(self).__name__, self.formula, tuple(self.substitutions.items()))
-        )
+        # See `PropositionalCombinator.__hash__`.
+        if self.__hash is None:
+            self.__hash = hash(
+                (type(self).__name__, self.formula, tuple(self.substitutions.items()))
+            )
+        return self.__hash
 
 
 def subst_map_relevant(
@@ -1679,9 +1933,16 @@ def subst_map_relevant(
 
 
 class NumericQuantifiedFormula(Formula, ABC):
+    _CACHE_ATTRIBUTES = Formula._CACHE_ATTRIBUTES + (
+        "_NumericQuantifiedFormula__hash",
+        "_NumericQuantifiedFormula__free_variables",
+    )
+
     def __init__(self, bound_variable: BoundVariable, inner_formula: Formula):
         self.bound_variable = bound_variable
         self.inner_formula = inner_formula
+        self.__hash: Optional[int] = None
+        self.__free_variables: Optional[OrderedSet[Variable]] = None
 
     def bound_variables(self) -> OrderedSet[BoundVariable]:
         """Non-recursive: Only non-empty for quantified formulas"""
@@ -1689,7 +1950,12 @@ class NumericQuantifiedFormula(Formula, ABC):
 
     def free_variables(self) -> OrderedSet[Variable]:
         """Recursive."""
-        return self.inner_formula.free_variables().difference(self.bound_variables())
+        # See `PropositionalCombinator.free_variables`.
+        if self.__free_variables is None:
+            self.__free_variables = self.inner_formula.free_variables().difference(
+                self.bound_variables()
+            )
+        return OrderedSet(self.__free_variables)
 
     def tree_arguments(self) -> OrderedSet[DerivationTree]:
         return self.inner_formula.tree_arguments()
@@ -1697,6 +1963,14 @@ class NumericQuantifiedFormula(Formula, ABC):
     def __len__(self):
         return 1 + len(self.inner_formula)
 
+    def __hash__(self):
+        # See `PropositionalCombinator.__hash__`.
+        if self.__hash is None:
+            self.__hash = hash(
+                (type(self).__name__, self.bound_variable, self.inner_formula)
+            )
+        return self.__hash
+
 
 class ExistsIntFormula(NumericQuantifiedFormula):
     def __init__(self, bound_variable: BoundVariable, inner_formula: Formula):
@@ -1729,7 +2003,7 @@ class ExistsIntFormula(NumericQuantifiedFormula):
         )
 
     def __hash__(self):
-        return hash((type(self).__name__, self.bound_variable, self.inner_formula))
+        return super().__hash__()
 
     def __eq__(self, other):
         return (
@@ -1778,7 +2052,7 @@ class ForallIntFormula(NumericQuantifiedFormula):
         )
 
     def __hash__(self):
-        return hash((type(self).__name__, self.bound_variable, self.inner_formula))
+        return super().__hash__()
 
     def __eq__(self, other):
         return (
@@ -1797,6 +2071,13 @@ class ForallIntFormula(NumericQuantifiedFormula):
 
 
 class QuantifiedFormula(Formula, ABC):
+    _CACHE_ATTRIBUTES = Formula._CACHE_ATTRIBUTES + (
+        "_QuantifiedFormula__hash",
+        "_QuantifiedFormula__bound_variables",
+        "_QuantifiedFormula__free_variables",
+        "_QuantifiedFormula__tree_arguments",
+    )
+
     def __init__(
         self,
         bound_variable: Union[BoundVariable, str],
@@ -1821,27 +2102,43 @@ class QuantifiedFormula(Formula, ABC):
         else:
             self.bind_expression = bind_expression
 
+        self.__hash: Optional[int] = None
+        self.__bound_variables: Optional[OrderedSet[BoundVariable]] = None
+        self.__free_variables: Optional[OrderedSet[Variable]] = None
+        self.__tree_arguments: Optional[OrderedSet[DerivationTree]] = None
+
     def bound_variables(self) -> OrderedSet[BoundVariable]:
-        return OrderedSet([self.bound_variable]) | (
-            OrderedSet([])
-            if self.bind_expression is None
-            else self.bind_expression.bound_variables()
-        )
+        # See `PropositionalCombinator.free_variables`.
+        if self.__bound_variables is None:
+            self.__bound_variables = OrderedSet([self.bound_variable]) | (
+                OrderedSet([])
+                if self.bind_expression is None
+                else self.bind_expression.bound_variables()
+            )
+        return OrderedSet(self.__bound_variables)
 
     def free_variables(self) -> OrderedSet[Variable]:
-        return (
-            OrderedSet(
-                [self.in_variable] if isinstance(self.in_variable, Variable) else []
-            )
-            | self.inner_formula.free_variables()
-        ) - self.bound_variables()
+        # See `PropositionalCombinator.free_variables`.
+        if self.__free_variables is None:
+            self.__free_variables = (
+                OrderedSet(
+                    [self.in_variable]
+                    if isinstance(self.in_variable, Variable)
+                    else []
+                )
+                | self.inner_formula.free_variables()
+            ) - self.bound_variables()
+        return OrderedSet(self.__free_variables)
 
     def tree_arguments(self) -> OrderedSet[DerivationTree]:
-        result = OrderedSet([])
-        if isinstance(self.in_variable, DerivationTree):
-            result.add(self.in_variable)
-        result.update(self.inner_formula.tree_arguments())
-        return result
+        # See `PropositionalCombinator.free_variables`.
+        if self.__tree_arguments is None:
+            result = OrderedSet([])
+            if isinstance(self.in_variable, DerivationTree):
+                result.add(self.in_variable)
+            result.update(self.inner_formula.tree_arguments())
+            self.__tree_arguments = result
+        return OrderedSet(self.__tree_arguments)
 
     def is_already_matched(self, tree: DerivationTree) -> bool:
         return False
@@ -1859,15 +2156,18 @@ class QuantifiedFormula(Formula, ABC):
         )
 
     def __hash__(self):
-        return hash(
-            (
-                type(self).__name__,
-                self.bound_variable,
-                self.in_variable,
-                self.inner_formula,
-                self.bind_expression or 0,
+        # See `PropositionalCombinator.__hash__`.
+        if self.__hash is None:
+            self.__hash = hash(
+                (
+                    type(self).__name__,
+                    self.bound_variable,
+                    self.in_variable,
+                    self.inner_formula,
+                    self.bind_expression or 0,
+                )
             )
-        )
+        return self.__hash
 
     def __eq__(self, other):
         return type(self) == type(other) and (
@@ -2074,9 +2374,16 @@ class VariablesCollector(FormulaVisitor):
 
     @staticmethod
     def collect(formula: Formula) -> OrderedSet[Variable]:
-        c = VariablesCollector()
-        formula.accept(c)
-        return c.result
+        # Formulas are immutable, so we collect the variables only once. We return
+        # a copy since callers may modify the result.
+        def collect_variables() -> OrderedSet[Variable]:
+            c = VariablesCollector()
+            formula.accept(c)
+            return c.result
+
+        return OrderedSet(
+            formula.cached_view("VariablesCollector.collect", collect_variables)
+        )
 
     def visit_exists_formula(self, formula: ExistsFormula):
         self.visit_quantified_formula(formula)
@@ -2114,9 +2421,17 @@ class BoundVariablesCollector(FormulaVisitor):
 
     @staticmethod
     def collect(formula: Formula) -> OrderedSet[BoundVariable]:
-        c = BoundVariablesCollector()
-        formula.accept(c)
-        return c.result
+        # See `VariablesCollector.collect`.
+        def collect_bound_variables() -> OrderedSet[BoundVariable]:
+            c = BoundVariablesCollector()
+            formula.accept(c)
+            return c.result
+
+        return OrderedSet(
+            formula.cached_view(
+                "BoundVariablesCollector.collect", collect_bound_variables
+            )
+        )
 
     def visit_exists_formula(self, formula: ExistsFormula):
         self.visit_quantified_formula(formula)
@@ -2209,10 +2524,60 @@ def replace_formula(  # noqa: C901
     may be None (it is irrelevant).
     """
 
+    # Subformulas occurring more than once (as the same object) are only processed
+    # once. We keep the subformulas in the memo to ensure that their IDs stay valid.
+    memo: Dict[int, Tuple[Formula, Formula]] = {}
+
+    def replace(formula: Formula) -> Formula:
+        if id(formula) not in memo:
+            memo[id(formula)] = (
+                formula,
+                _replace_formula(formula, to_replace, replace_with, replace),
+            )
+
+        return memo[id(formula)][1]
+
+    return replace(in_formula)
+
+
+def replace_formulas(
+    in_formula: Formula, replacements: Dict[Formula, Formula]
+) -> Formula:
+    """
+    Replaces all formulas in `replacements` inside `in_formula` by their
+    replacements in a single traversal. This is equivalent to, but faster than,
+    calling :func:`~isla.language.replace_formula` once for each replacement.
+
+    >>> x = Constant("x", "<x>")
+    >>> a = SMTFormula(z3.Length(x.to_smt()) > 1, x)
+    >>> b = SMTFormula(z3.Length(x.to_smt()) < 5, x)
+    >>> c = SMTFormula(z3.Length(x.to_smt()) != 3, x)
+    >>> print(replace_formulas((a & b) | c, {a: true(), c: false()}))
+    Length(x) < 5
+
+    :param in_formula: The formula in which to replace subformulas.
+    :param replacements: A mapping from formulas to their replacements.
+    :return: The formula with all replacements applied.
+    """
+
+    if not replacements:
+        return in_formula
+
+    return replace_formula(
+        in_formula, lambda formula: replacements.get(formula, False)
+    )
+
+
+def _replace_formula(  # noqa: C901
+    in_formula: Formula,
+    to_replace: Union[Formula, Callable[[Formula], bool | Formula]],
+    replace_with: Optional[Formula],
+    replace: Callable[[Formula], Formula],
+) -> Formula:
     if callable(to_replace):
         result = to_replace(in_formula)
         if isinstance(result, Formula):
-            return replace_formula(result, to_replace, replace_with)
+            return replace(result)
 
         assert isinstance(result, bool)
         if result:
@@ -2223,22 +2588,16 @@ def replace_formula(  # noqa: C901
 
     if isinstance(in_formula, ConjunctiveFormula):
         return reduce(
-            lambda a, b: a & b,
-            [
-                replace_formula(child, to_replace, replace_with)
-                for child in in_formula.args
-            ],
+            operator.and_,
+            (replace(child) for child in in_formula.args),
         )
     elif isinstance(in_formula, DisjunctiveFormula):
         return reduce(
-            lambda a, b: a | b,
-            [
-                replace_formula(child, to_replace, replace_with)
-                for child in in_formula.args
-            ],
+            operator.or_,
+            (replace(child) for child in in_formula.args),
         )
     elif isinstance(in_formula, NegatedFormula):
-        child_result = replace_formula(in_formula.args[0], to_replace, replace_with)
+        child_result = replace(in_formula.args[0])
 
         if child_result == false():
             return true()
@@ -2250,7 +2609,7 @@ def replace_formula(  # noqa: C901
         return ForallFormula(
             in_formula.bound_variable,
             in_formula.in_variable,
-            replace_formula(in_formula.inner_formula, to_replace, replace_with),
+            replace(in_formula.inner_formula),
             in_formula.bind_expression,
             in_formula.already_matched,
             id=in_formula.id,
@@ -2259,18 +2618,18 @@ def replace_formula(  # noqa: C901
         return ExistsFormula(
             in_formula.bound_variable,
             in_formula.in_variable,
-            replace_formula(in_formula.inner_formula, to_replace, replace_with),
+            replace(in_formula.inner_formula),
             in_formula.bind_expression,
         )
     elif isinstance(in_formula, ExistsIntFormula):
         return ExistsIntFormula(
             in_formula.bound_variable,
-            replace_formula(in_formula.inner_formula, to_replace, replace_with),
+            replace(in_formula.inner_formula),
         )
     elif isinstance(in_formula, ForallIntFormula):
         return ForallIntFormula(
             in_formula.bound_variable,
-            replace_formula(in_formula.inner_formula, to_replace, replace_with),
+            replace(in_formula.inner_formula),
         )
 
     return in_formula
@@ -2320,11 +2679,11 @@ def convert_conjunctive_formula_to_nnf(
     if not isinstance(formula, ConjunctiveFormula):
         return Maybe.nothing()
 
-    args = [convert_to_nnf(arg, negate) for arg in formula.args]
+    args = (convert_to_nnf(arg, negate) for arg in formula.args)
     if negate:
-        return Maybe(reduce(lambda a, b: a | b, args))
+        return Maybe(reduce(operator.or_, args))
     else:
-        return Maybe(reduce(lambda a, b: a & b, args))
+        return Maybe(reduce(operator.and_, args))
 
 
 def convert_disjunctive_formula_to_nnf(
@@ -2333,11 +2692,11 @@ def convert_disjunctive_formula_to_nnf(
     if not isinstance(formula, DisjunctiveFormula):
         return Maybe.nothing()
 
-    args = [convert_to_nnf(arg, negate) for arg in formula.args]
+    args = (convert_to_nnf(arg, negate) for arg in formula.args)
     if negate:
-        return Maybe(reduce(lambda a, b: a & b, args))
+        return Maybe(reduce(operator.and_, args))
     else:
-        return Maybe(reduce(lambda a, b: a | b, args))
+        return Maybe(reduce(operator.or_, args))
 
 
 def convert_structural_predicate_formula_to_nnf(
@@ -2455,23 +2814,13 @@ def convert_to_dnf(formula: Formula, deep: bool = True) -> Formula:
         if all(len(elem) == 1 for elem in disjuncts_list):
             return formula
 
-        return reduce(
-            lambda a, b: a | b,
-            [
-                reduce(
-                    lambda a, b: a & b,
-                    OrderedSet(split_conjunction(left & right)),
-                    true(),
-                )
-                for left, right in itertools.product(*disjuncts_list)
-            ],
-            false(),
+        return DisjunctiveFormula.from_iter(
+            ConjunctiveFormula.from_iter(combination)
+            for combination in itertools.product(*disjuncts_list)
         )
     elif isinstance(formula, DisjunctiveFormula):
-        return reduce(
-            lambda a, b: a | b,
-            [convert_to_dnf(subformula) for subformula in formula.args],
-            false(),
+        return DisjunctiveFormula.from_iter(
+            convert_to_dnf(subformula) for subformula in formula.args
         )
     elif deep and isinstance(formula, ForallFormula):
         return ForallFormula(
@@ -2529,9 +2878,9 @@ def ensure_unique_bound_variables(  # noqa: C901
 
         used_names |= {
             var.name
-            for var in BoundVariablesCollector()
-            .collect(formula)
-            .difference(formula.bound_variables())
+            for var in BoundVariablesCollector.collect(formula).difference(
+                formula.bound_variables()
+            )
         }
 
         old_used_names = set(used_names)
@@ -2565,13 +2914,13 @@ def ensure_unique_bound_variables(  # noqa: C901
         )
     elif isinstance(formula, ConjunctiveFormula):
         return reduce(
-            lambda a, b: a & b,
-            [ensure_unique_bound_variables(arg, used_names) for arg in formula.args],
+            operator.and_,
+            (ensure_unique_bound_variables(arg, used_names) for arg in formula.args),
         )
     elif isinstance(formula, DisjunctiveFormula):
         return reduce(
-            lambda a, b: a | b,
-            [ensure_unique_bound_variables(arg, used_names) for arg in formula.args],
+            operator.or_,
+            (ensure_unique_bound_variables(arg, used_names) for arg in formula.args),
         )
     else:
         return formula
@@ -2580,17 +2929,74 @@ def ensure_unique_bound_variables(  # noqa: C901
 def split_conjunction(formula: Formula) -> List[Formula]:
     if not type(formula) is ConjunctiveFormula:
         return [formula]
-    else:
-        formula: ConjunctiveFormula
-        return [elem for arg in formula.args for elem in split_conjunction(arg)]
+
+    # Formulas are immutable, so we compute the conjuncts only once. We return a
+    # copy since callers may modify the result.
+    return list(
+        formula.cached_view(
+            "split_conjunction", lambda: _flattened(formula, ConjunctiveFormula)
+        )
+    )
 
 
 def split_disjunction(formula: Formula) -> List[Formula]:
     if not type(formula) is DisjunctiveFormula:
         return [formula]
-    else:
-        formula: DisjunctiveFormula
-        return [elem for arg in formula.args for elem in split_disjunction(arg)]
+
+    # See `split_conjunction`.
+    return list(
+        formula.cached_view(
+            "split_disjunction", lambda: _flattened(formula, DisjunctiveFormula)
+        )
+    )
+
+
+def _flattened(
+    formula: Formula, combinator: Type[PropositionalCombinator]
+) -> Tuple[Formula, ...]:
+    result: List[Formula] = []
+    _flatten_into(result, formula, combinator)
+    return tuple(result)
+
+
+def _flatten_into(
+    result: List[Formula],
+    formula: Formula,
+    combinator: Type[PropositionalCombinator],
+) -> None:
+    """
+    Appends the arguments of (nested) `combinator` formulas in `formula` to `result`.
+    Callers flattening several formulas can pass the same list to avoid allocating
+    intermediate lists.
+
+    >>> x = Constant("x", "<x>")
+    >>> a = SMTFormula(z3.Length(x.to_smt()) > 1, x)
+    >>> b = SMTFormula(z3.Length(x.to_smt()) < 5, x)
+    >>> c = SMTFormula(z3.Length(x.to_smt()) != 3, x)
+    >>> result = []
+    >>> _flatten_into(result, a & (b & c), ConjunctiveFormula)
+    >>> _flatten_into(result, a | b, ConjunctiveFormula)
+    >>> for formula in result:
+    ...     print(formula)
+    Length(x) > 1
+    Length(x) < 5
+    Length(x) != 3
+    (Length(x) > 1 ∨ Length(x) < 5)
+
+    :param result: The list to which the flattened arguments are appended.
+    :param formula: The formula to flatten.
+    :param combinator: The type of formulas to flatten.
+    """
+
+    # We flatten nested formulas iteratively. Arguments are pushed in reverse
+    # order to retain their left-to-right order in the result.
+    stack: List[Formula] = [formula]
+    while stack:
+        current = stack.pop()
+        if type(current) is combinator:
+            stack.extend(reversed(current.args))
+        else:
+            result.append(current)
 
 
 class VariableManager:
@@ -2889,7 +3295,7 @@ def univ_close_over_var_push_in(
             return not qfd_vars.intersection(f.free_variables())
 
         def push_in_predicate(f: Formula) -> bool:
-            return in_var in BoundVariablesCollector().collect(f)
+            return in_var in BoundVariablesCollector.collect(f)
 
         independent_formulas = [
             elem for elem in elements if independent_predicate(elem)
@@ -2972,17 +3378,19 @@ class AddMexprTransformer(NoopFormulaTransformer):
         else:
             mexprs = self.mexprs
 
-        return reduce(
-            Formula.__and__ if isinstance(formula, ForallFormula) else Formula.__or__,
-            [
-                type(formula)(
-                    formula.bound_variable,
-                    formula.in_variable,
-                    formula.inner_formula,
-                    mexpr,
-                )
-                for mexpr in mexprs
-            ],
+        combinator = (
+            ConjunctiveFormula
+            if isinstance(formula, ForallFormula)
+            else DisjunctiveFormula
+        )
+        return combinator.from_iter(
+            type(formula)(
+                formula.bound_variable,
+                formula.in_variable,
+                formula.inner_formula,
+                mexpr,
+            )
+            for mexpr in mexprs
         )
 
     def __add_mexprs_to_qfr_with_existing_mexpr(
@@ -3196,10 +3604,12 @@ class ISLaEmitter(IslaLanguageListener.IslaLanguageListener):
         assert nonterminal[-1] == ">"
         assert len(nonterminal) > 2
 
+        used_names = self.used_variables | self.vars_for_free_nonterminals
         fresh_var = fresh_bound_variable(
-            self.used_variables | self.vars_for_free_nonterminals,
+            used_names,
             BoundVariable(nonterminal[1:-1], nonterminal),
             add=False,
+            used_names=used_names,
         )
 
         self.mgr.bv(fresh_var.name, fresh_var.n_type)
@@ -3215,12 +3625,16 @@ class ISLaEmitter(IslaLanguageListener.IslaLanguageListener):
         last_nonterminal: str = parsed_xpath_expr[-1][-1][0]
         assert is_nonterminal(last_nonterminal)
 
-        fresh_var = fresh_bound_variable(
+        used_names = (
             self.used_variables
             | {var.name for var in self.vars_for_free_nonterminals.values()}
-            | {var.name for var in self.vars_for_xpath_expressions.values()},
+            | {var.name for var in self.vars_for_xpath_expressions.values()}
+        )
+        fresh_var = fresh_bound_variable(
+            used_names,
             BoundVariable(last_nonterminal[1:-1], last_nonterminal),
             add=False,
+            used_names=used_names,
         )
 
         self.mgr.bv(fresh_var.name, fresh_var.n_type)
@@ -3300,6 +3714,7 @@ class ISLaEmitter(IslaLanguageListener.IslaLanguageListener):
                 self.used_variables,
                 BoundVariable(var_type[1:-1], var_type),
                 add=False,
+                used_names=self.used_variables,
             )
             self.used_variables.add(var.name)
 
@@ -3356,7 +3771,7 @@ class ISLaEmitter(IslaLanguageListener.IslaLanguageListener):
             assert not is_nonterminal(in_var_name)
             in_var = next(
                 var
-                for var in VariablesCollector().collect(formula)
+                for var in VariablesCollector.collect(formula)
                 if var.name == in_var_name
             )
             bound_var_type = xpath_expr[1][0][0]
@@ -3463,6 +3878,7 @@ class ISLaEmitter(IslaLanguageListener.IslaLanguageListener):
                 self.used_variables,
                 BoundVariable(bound_var_type[1:-1], bound_var_type),
                 add=False,
+                used_names=self.used_variables,
             )
             self.used_variables.add(bound_var.name)
 
@@ -4143,14 +4559,109 @@ def unparse_grammar(grammar: Grammar) -> str:
 
 
 def get_conjuncts(formula: Formula) -> List[Formula]:
-    return [
-        conjunct
-        for disjunct in split_disjunction(formula)
-        for conjunct in split_conjunction(disjunct)
-    ]
+    # See `split_conjunction`.
+    return list(_all_conjuncts(formula))
 
 
-T = TypeVar("T")
+def iter_conjuncts(formula: Formula) -> Iterator[Formula]:
+    """
+    Iterates over the :func:`~isla.language.get_conjuncts` of `formula` without
+    copying them. Use this function if you only read the conjuncts.
+
+    >>> x = Constant("x", "<x>")
+    >>> a = SMTFormula(z3.Length(x.to_smt()) > 1, x)
+    >>> b = SMTFormula(z3.Length(x.to_smt()) < 5, x)
+    >>> [str(conjunct) for conjunct in iter_conjuncts(a & b)]
+    ['Length(x) > 1', 'Length(x) < 5']
+
+    :param formula: The formula whose conjuncts to iterate over.
+    :return: An iterator over the conjuncts of `formula`.
+    """
+
+    return iter(_all_conjuncts(formula))
+
+
+def _all_conjuncts(formula: Formula) -> Tuple[Formula, ...]:
+    if not isinstance(formula, (ConjunctiveFormula, DisjunctiveFormula)):
+        return (formula,)
+
+    def compute() -> Tuple[Formula, ...]:
+        result: List[Formula] = []
+        for disjunct in split_disjunction(formula):
+            _flatten_into(result, disjunct, ConjunctiveFormula)
+        return tuple(result)
+
+    return formula.cached_view("get_conjuncts", compute)
+
+
+def has_conjunct_of_type(formula: Formula, formula_type: Type[Formula]) -> bool:
+    """
+    Checks whether one of the :func:`~isla.language.get_conjuncts` of `formula`
+    is an instance of `formula_type`. The types of the conjuncts are stored in the
+    formula object, such that repeated checks for the same formula do not have to
+    iterate over the conjuncts.
+
+    >>> x = Constant("x", "<x>")
+    >>> a = SMTFormula(z3.Length(x.to_smt()) > 1, x)
+    >>> b = ForallFormula(BoundVariable("y", "<y>"), x, a)
+    >>> has_conjunct_of_type(a & b, QuantifiedFormula)
+    True
+    >>> has_conjunct_of_type(a & b, ExistsFormula)
+    False
+
+    :param formula: The formula whose conjuncts to check.
+    :param formula_type: The type to check for.
+    :return: True iff some conjunct of `formula` is of type `formula_type`.
+    """
+
+    if not isinstance(formula, (ConjunctiveFormula, DisjunctiveFormula)):
+        return isinstance(formula, formula_type)
+
+    conjunct_types: FrozenSet[Type[Formula]] = formula.cached_view(
+        "has_conjunct_of_type", lambda: frozenset(map(type, iter_conjuncts(formula)))
+    )
+    return any(
+        issubclass(conjunct_type, formula_type) for conjunct_type in conjunct_types
+    )
+
+
+def partition_smt_conjuncts(
+    formula: Formula,
+) -> Tuple[Tuple[SMTFormula, ...], Tuple[Formula, ...]]:
+    """
+    Partitions the :func:`~isla.language.split_conjunction` of `formula` into the
+    SMT formulas that are not trivially true and all remaining conjuncts. The
+    partition is stored in the formula object, since the solver requests it for
+    every state with the same constraint.
+
+    >>> x = Constant("x", "<x>")
+    >>> a = SMTFormula(z3.Length(x.to_smt()) > 1, x)
+    >>> b = ForallFormula(BoundVariable("y", "<y>"), x, a)
+    >>> smt_formulas, others = partition_smt_conjuncts(b & a)
+    >>> print(", ".join(map(str, smt_formulas)))
+    Length(x) > 1
+    >>> print(", ".join(map(str, others)))
+    ∀ y ∈ x: (Length(x) > 1)
+
+    :param formula: The formula whose conjuncts to partition.
+    :return: A pair of the non-trivial SMT conjuncts and the remaining conjuncts.
+    """
+
+    def compute() -> Tuple[Tuple[SMTFormula, ...], Tuple[Formula, ...]]:
+        smt_formulas: List[SMTFormula] = []
+        other_conjuncts: List[Formula] = []
+        for conjunct in split_conjunction(formula):
+            if isinstance(conjunct, SMTFormula) and not z3.is_true(conjunct.formula):
+                smt_formulas.append(conjunct)
+            else:
+                other_conjuncts.append(conjunct)
+
+        return tuple(smt_formulas), tuple(other_conjuncts)
+
+    if type(formula) is not ConjunctiveFormula:
+        return compute()
+
+    return formula.cached_view("partition_smt_conjuncts", compute)
 
 
 def fresh_variable(
@@ -4159,33 +4670,72 @@ def fresh_variable(
     n_type: str,
     constructor: Callable[[str, str], T],
     add: bool = True,
+    used_names: Optional[Set[str]] = None,
 ) -> T:
+    """
+    Creates a variable whose name does not clash with any of the used variables.
+    If `base_name` is taken, the variable is named `base_name_0`, `base_name_1`,
+    etc.
+
+    Callers creating many fresh variables in a loop can pass the names of all used
+    variables in `used_names`, which is then updated alongside `used`. This avoids
+    scanning `used` in each call.
+
+    >>> used_names = {"x", "x_0"}
+    >>> fresh_variable(set(), "x", "<x>", Constant, used_names=used_names)
+    Constant("x_1", "<x>")
+    >>> sorted(used_names)
+    ['x', 'x_0', 'x_1']
+
+    :param used: The variables (or variable names) in use.
+    :param base_name: The name proposal for the fresh variable.
+    :param n_type: The type of the fresh variable.
+    :param constructor: The constructor for the fresh variable.
+    :param add: If True, the fresh variable is added to `used` (and `used_names`).
+    :param used_names: The names of all used variables, if maintained by the caller.
+    :return: The fresh variable.
+    """
+
+    if used_names is None:
+        used_names = {
+            used_var.name if isinstance(used_var, Variable) else used_var
+            for used_var in used
+        }
+
     name = base_name
     idx = 0
-    while any(
-        (used_var.name if isinstance(used_var, Variable) else used_var) == name
-        for used_var in used
-    ):
+    while name in used_names:
         name = f"{base_name}_{idx}"
         idx += 1
 
     result = constructor(name, n_type)
     if add:
         used.add(result)
+        used_names.add(name)
 
     return result
 
 
 def fresh_constant(
-    used: MutableSet[Variable | str], proposal: Constant, add: bool = True
+    used: MutableSet[Variable | str],
+    proposal: Constant,
+    add: bool = True,
+    used_names: Optional[Set[str]] = None,
 ) -> Constant:
-    return fresh_variable(used, proposal.name, proposal.n_type, Constant, add)
+    return fresh_variable(
+        used, proposal.name, proposal.n_type, Constant, add, used_names
+    )
 
 
 def fresh_bound_variable(
-    used: MutableSet[Variable | str], proposal: BoundVariable, add: bool = True
+    used: MutableSet[Variable | str],
+    proposal: BoundVariable,
+    add: bool = True,
+    used_names: Optional[Set[str]] = None,
 ) -> BoundVariable:
-    return fresh_variable(used, proposal.name, proposal.n_type, BoundVariable, add)
+    return fresh_variable(
+        used, proposal.name, proposal.n_type, BoundVariable, add, used_names
+    )
 
 
 def instantiate_top_constant(formula: Formula, tree: DerivationTree) -> Formula:
@@ -4272,7 +4822,7 @@ def is_valid_combination(
         if nonterminal == "<start>":
             specialized_grammar = grammar
         else:
-            specialized_grammar = copy.deepcopy(grammar) | {"<start>": [nonterminal]}
+            specialized_grammar = grammar | {"<start>": [nonterminal]}
             specialized_grammar = delete_unreachable(specialized_grammar)
 
         parser = EarleyParser(specialized_grammar)
@@ -4350,23 +4900,9 @@ def match(
             for leaf_path, _ in t.leaves()
         )
 
-    if (
-        t.value != mexpr_tree.value
-        or Exceptional.of(lambda: len(mexpr_tree.children) == 0 and t.children is None)
-        .recover(lambda _: False)
-        .get()
-    ):
-        return None
-
-    # If the match expression tree is "open," we have a match!
-    if (
-        mexpr_tree.children is None
-        or Exceptional.of(
-            lambda: len(mexpr_tree.children) == 0 and len(t.children) == 0
-        )
-        .recover(lambda _: False)
-        .get()
-    ):
+    def match_open_leaf(
+        t: DerivationTree, mexpr_var_paths: Dict[BoundVariable, Path], path_in_t: Path
+    ) -> Dict[BoundVariable, Tuple[Path, DerivationTree]]:
         assert not mexpr_var_paths or all(not path for path in mexpr_var_paths.values())
 
         if not is_nonterminal(t.value):
@@ -4407,32 +4943,49 @@ def match(
         # binding!).
         return {bv: (path_in_t, t) for bv in mexpr_var_paths if not mexpr_var_paths[bv]}
 
-    assert not mexpr_var_paths or all(
-        mexpr_var_paths[var] is not None for var in mexpr_var_paths
-    )
+    # We match both trees in an iterative pre-order traversal. Thus, the matches
+    # for open leaves are collected from left to right.
+    result: Dict[BoundVariable, Tuple[Path, DerivationTree]] = {}
+    root_is_open_leaf = False
+    stack: List[
+        Tuple[DerivationTree, DerivationTree, Dict[BoundVariable, Path], Path]
+    ] = [(t, mexpr_tree, mexpr_var_paths, path_in_t)]
+    while stack:
+        subtree, mexpr_subtree, var_paths, subtree_path = stack.pop()
+
+        if subtree.value != mexpr_subtree.value or (
+            mexpr_subtree.children == () and subtree.children is None
+        ):
+            return None
 
-    # On the other hand, if the numbers of children differ (and `mexpr_tree` *does* have
-    # children), this cannot possibly be a match.
-    if len(t.children or []) != len(mexpr_tree.children or []):
-        return None
+        # If the match expression tree is "open," we have a match!
+        if mexpr_subtree.children is None or (
+            not mexpr_subtree.children and not subtree.children
+        ):
+            if subtree is t:
+                root_is_open_leaf = True
+            result.update(match_open_leaf(subtree, var_paths, subtree_path))
+            continue
 
-    assert t.children and mexpr_tree.children
+        assert not var_paths or all(var_paths[var] is not None for var in var_paths)
 
-    # Otherwise, proceed by matching the children.
-    result = {}
-    for idx in range(len(t.children)):
-        maybe_match = match(
-            t.children[idx],
-            mexpr_tree.children[idx],
-            {bv: path[1:] for bv, path in mexpr_var_paths.items() if path[0] == idx},
-            path_in_t + (idx,),
-        )
-        if maybe_match is None:
+        # On the other hand, if the numbers of children differ (and `mexpr_tree`
+        # *does* have children), this cannot possibly be a match.
+        if len(subtree.children or []) != len(mexpr_subtree.children):
             return None
 
-        result |= maybe_match
+        # Otherwise, proceed by matching the children.
+        stack.extend(
+            (
+                subtree.children[idx],
+                mexpr_subtree.children[idx],
+                {bv: path[1:] for bv, path in var_paths.items() if path[0] == idx},
+                subtree_path + (idx,),
+            )
+            for idx in reversed(range(len(subtree.children)))
+        )
 
-    assert is_complete_match(t, result)
+    assert root_is_open_leaf or is_complete_match(t, result)
     return result
 
 
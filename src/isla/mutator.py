@@ -22,14 +22,16 @@ from typing import Tuple, Callable, Optional
 from grammar_graph import gg
 
 from isla.derivation_tree import DerivationTree
+from isla.evaluator import grammar_graph
 from isla.existential_helpers import paths_between, path_to_tree
 from isla.fuzzer import GrammarCoverageFuzzer
 from isla.helpers import (
     Maybe,
     Exceptional,
     parent_or_child,
-    canonical,
     to_id,
+    grammar_to_immutable,
+    graph_canonical_grammar,
 )
 from isla.type_defs import Grammar, Path
 
@@ -43,8 +45,11 @@ class Mutator:
         graph: Optional[gg.GrammarGraph] = None,
     ):
         self.fuzzer = GrammarCoverageFuzzer(grammar)
-        self.graph = graph or gg.GrammarGraph.from_grammar(grammar)
-        self.canonical_grammar = canonical(grammar)
+        # The graph and the canonical grammar are shared with other users of the
+        # same grammar; the solver, e.g., creates a new mutator for each call
+        # to `mutate`.
+        self.graph = graph or grammar_graph(grammar_to_immutable(grammar))
+        self.canonical_grammar = graph_canonical_grammar(self.graph)
 
         self.min_mutations = min_mutations
         self.max_mutations = max_mutations
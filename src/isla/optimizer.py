@@ -37,7 +37,7 @@ import isla.derivation_tree
 import isla.evaluator
 from isla import language, solver
 from isla.performance_evaluator import logger, generate_inputs
-from isla.helpers import weighted_geometric_mean
+from isla.helpers import weighted_geometric_mean, grammar_to_immutable
 from isla.solver import (
     CostWeightVector,
     ISLaSolver,
@@ -544,15 +544,16 @@ def evaluate_isla_generator(
     k=3,
 ) -> PerformanceEvaluationResult:
     print(f"Evaluating weight vector {v}")
+    # The solver uses the cached graph for its grammar; sharing it with the cost
+    # computer avoids computing the reachability relation etc. twice.
+    graph = isla.evaluator.grammar_graph(grammar_to_immutable(grammar))
     solver = ISLaSolver(
         grammar,
         formula,
         max_number_free_instantiations=1,
         max_number_smt_instantiations=1,
         timeout_seconds=timeout,
-        cost_computer=GrammarBasedBlackboxCostComputer(
-            CostSettings(v, k), gg.GrammarGraph.from_grammar(grammar)
-        ),
+        cost_computer=GrammarBasedBlackboxCostComputer(CostSettings(v, k), graph),
     )
 
     return evaluate_producer(
@@ -560,7 +561,7 @@ def evaluate_isla_generator(
         diagram_title="\n".join(wrap(str(v), 60)),
         producer=solver,
         formula=formula,
-        graph=gg.GrammarGraph.from_grammar(grammar),
+        graph=graph,
         validator=validator,
         timeout_seconds=timeout,
         k=k,
@@ -35,8 +35,8 @@ import random
 from functools import lru_cache
 from typing import Tuple, Iterable, Generator, List, Dict, Collection
 
-from isla.helpers import tree_to_string, RE_NONTERMINAL
-from isla.type_defs import Grammar, ParseTree, CanonicalGrammar
+from isla.helpers import tree_to_string, RE_NONTERMINAL, delete_unreachable
+from isla.type_defs import Grammar, ParseTree, CanonicalGrammar, ImmutableGrammar
 
 START_SYMBOL = "<start>"
 
@@ -526,3 +526,34 @@ class PEGParser(Parser):
             if res is not None:
                 return (to, (key, res))
         return 0, None
+
+
+@lru_cache(maxsize=256)
+def parser_for(grammar: ImmutableGrammar, nonterminal: str) -> EarleyParser:
+    """
+    Returns an Earley parser for the sub-grammar of the given grammar starting
+    at :code:`nonterminal`. Parsers are cached, since constructing them requires
+    canonicalizing the grammar and computing its nullable nonterminals. The
+    parse trees produced by the returned parser are rooted in :code:`<start>`;
+    for other nonterminals, the actual tree is the only child of the root.
+
+    >>> from isla.helpers import grammar_to_immutable
+    >>> grammar = grammar_to_immutable(
+    ...     {"<start>": ["<a>"], "<a>": ["a<b>"], "<b>": ["b"]})
+    >>> parser_for(grammar, "<a>") is parser_for(grammar, "<a>")
+    True
+    >>> sorted(parser_for(grammar, "<b>").grammar())
+    ['<b>', '<start>']
+
+    :param grammar: The grammar in immutable form.
+    :param nonterminal: The nonterminal to start parsing with.
+    :return: A (shared) parser for the given nonterminal.
+    """
+
+    # The expansion lists are not modified, so a shallow copy suffices.
+    mutable_grammar = dict(grammar)
+    if nonterminal != "<start>":
+        mutable_grammar["<start>"] = (nonterminal,)
+        mutable_grammar = delete_unreachable(mutable_grammar)
+
+    return EarleyParser(mutable_grammar)
@@ -17,12 +17,10 @@
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
 
 import copy
-import functools
 import heapq
 import itertools
 import logging
 import math
-import operator
 import random
 import sys
 import time
@@ -40,6 +38,7 @@ from typing import (
     Callable,
     Iterable,
     Sequence,
+    FrozenSet,
 )
 
 import pkg_resources
@@ -57,6 +56,7 @@ from isla import language
 from isla.derivation_tree import DerivationTree
 from isla.evaluator import (
     evaluate,
+    grammar_graph,
     quantified_formula_might_match,
     get_toplevel_quantified_formulas,
     eliminate_quantifiers,
@@ -72,7 +72,6 @@ from isla.fuzzer import GrammarFuzzer, GrammarCoverageFuzzer, expansion_key
 from isla.helpers import (
     delete_unreachable,
     shuffle,
-    dict_of_lists_to_list_of_dicts,
     weighted_geometric_mean,
     assertions_activated,
     split_str_with_nonterminals,
@@ -91,6 +90,8 @@ from isla.helpers import (
     compute_nullable_nonterminals,
     eassert,
     merge_dict_of_sets,
+    grammar_to_immutable,
+    nonterminal_reachability,
 )
 from isla.isla_predicates import (
     STANDARD_STRUCTURAL_PREDICATES,
@@ -106,6 +107,9 @@ from isla.language import (
     ensure_unique_bound_variables,
     parse_isla,
     get_conjuncts,
+    iter_conjuncts,
+    has_conjunct_of_type,
+    partition_smt_conjuncts,
     parse_bnf,
     ForallIntFormula,
     set_smt_auto_eval,
@@ -114,18 +118,24 @@ from isla.language import (
     fresh_constant,
 )
 from isla.mutator import Mutator
-from isla.parser import EarleyParser
-from isla.type_defs import Grammar, Path, ImmutableList, CanonicalGrammar
+from isla.parser import EarleyParser, parser_for
+from isla.type_defs import (
+    Grammar,
+    Path,
+    ImmutableList,
+    CanonicalGrammar,
+    ImmutableGrammar,
+)
 from isla.z3_helpers import (
     z3_solve,
     z3_subst,
     z3_eq,
-    z3_and,
     visit_z3_expr,
     smt_string_val_to_string,
     parent_relationships_in_z3_expr,
     numeric_intervals_from_regex,
     z3_or,
+    z3_string,
 )
 
 
@@ -146,15 +156,13 @@ class SolutionState:
         return evaluate(self.constraint, self.tree, grammar)
 
     def complete(self) -> bool:
-        if not self.tree.is_complete():
-            return False
-
         # We assume that any universal quantifier has already been instantiated, if it
         # matches, and is thus satisfied, or another unsatisfied constraint resulted
         # from the instantiation. Existential, predicate, and SMT formulas have to be
-        # eliminated first.
+        # eliminated first. Most states in the queue still have a constraint, so we
+        # check it before the tree.
 
-        return self.constraint == sc.true()
+        return self.constraint == sc.true() and self.tree.is_complete()
 
     # Less-than comparisons are needed for usage in the binary heap queue
     def __lt__(self, other: "SolutionState"):
@@ -163,16 +171,33 @@ class SolutionState:
     def __hash__(self):
         if self.__hash is None:
             result = hash((self.constraint, self.tree))
-            object.__setattr__(self, "__hash", result)
+            object.__setattr__(self, "_SolutionState__hash", result)
             return result
 
         return self.__hash
 
+    def __deepcopy__(self, memo) -> "SolutionState":
+        """
+        Returns this state: solution states, their constraints, and their trees
+        are immutable, so there is no need to copy them. A state is "updated" by
+        creating a new one that shares the unchanged component. Code must thus
+        never modify a state, its constraint, or its tree in place.
+
+        :param memo: The memo dictionary of :func:`copy.deepcopy` (unused).
+        :return: This state.
+        """
+
+        return self
+
     def __eq__(self, other):
-        return (
+        # Structural tree hashes are cached, and computing them for a tree derived
+        # from a hashed one only visits the new nodes. Comparing them first
+        # rejects most unequal states before comparing trees or constraints.
+        return self is other or (
             isinstance(other, SolutionState)
-            and self.constraint == other.constraint
+            and self.tree.structural_hash() == other.tree.structural_hash()
             and self.tree.structurally_equal(other.tree)
+            and self.constraint == other.constraint
         )
 
 
@@ -473,7 +498,22 @@ class ISLaSolver:
             self.grammar |= {"<start>": [start_symbol]}
             self.grammar = delete_unreachable(self.grammar)
 
-        self.graph = GrammarGraph.from_grammar(self.grammar)
+        self.immutable_grammar = grammar_to_immutable(self.grammar)
+        # We share the graph with the evaluator (and other solvers for the same
+        # grammar), such that computations memoized per graph are only done once.
+        self.graph = grammar_graph(self.immutable_grammar)
+        self.reachability: Dict[str, FrozenSet[str]] = nonterminal_reachability(
+            self.immutable_grammar
+        )
+        # Maps each nonterminal to the nonterminals from which it is reachable.
+        self.reverse_reachability: Dict[str, FrozenSet[str]] = {
+            nonterminal: frozenset(
+                source
+                for source, reachable_nonterminals in self.reachability.items()
+                if nonterminal in reachable_nonterminals
+            )
+            for nonterminal in self.reachability
+        }
         self.canonical_grammar = canonical(self.grammar)
         self.timeout_seconds = timeout_seconds
         self.start_time: Optional[int] = None
@@ -581,18 +621,27 @@ class ISLaSolver:
         initial_state = SolutionState(initial_formula, self.initial_tree)
         initial_states = self.establish_invariant(initial_state)
 
-        self.queue: List[Tuple[float, SolutionState]] = []
+        self.queue: List[Tuple[float, SolutionState]] = [
+            (self.compute_cost(state), state) for state in initial_states
+        ]
+        heapq.heapify(self.queue)
         self.tree_hashes_in_queue: Set[int] = {self.initial_tree.structural_hash()}
         self.state_hashes_in_queue: Set[int] = {hash(state) for state in initial_states}
-        for state in initial_states:
-            heapq.heappush(self.queue, (self.compute_cost(state), state))
 
         self.seen_coverages: Set[str] = set()
         self.current_level: int = 0
         self.step_cnt: int = 0
         self.last_cost_recomputation: int = 0
 
-        self.regex_cache = {}
+        self.regex_cache: Dict[str, z3.ReRef] = regex_cache_for(
+            self.immutable_grammar, self.grammar_unwinding_threshold
+        )
+        self.quantifier_free_solutions_cache: Dict[
+            Tuple[ImmutableList[language.SMTFormula], Optional[int]],
+            List[Dict[language.Constant | DerivationTree, DerivationTree]],
+        ] = {}
+        # Created on demand; see `extract_model_value_int_var`.
+        self.numeric_padding_solver: Optional[z3.Solver] = None
 
         self.solutions: List[DerivationTree] = []
 
@@ -665,7 +714,9 @@ class ISLaSolver:
             self.logger.debug(
                 "Polling new state (%s, %s) (hash %d, cost %f)",
                 state.constraint,
-                state.tree.to_string(show_open_leaves=True, show_ids=True),
+                lazystr(
+                    lambda: state.tree.to_string(show_open_leaves=True, show_ids=True)
+                ),
                 hash(state),
                 cost,
             )
@@ -759,12 +810,7 @@ class ISLaSolver:
             failed parse.
         :return: A parsed `DerivationTree`.
         """
-        grammar = copy.deepcopy(self.grammar)
-        if nonterminal != "<start>":
-            grammar |= {"<start>": [nonterminal]}
-            grammar = delete_unreachable(grammar)
-
-        parser = EarleyParser(grammar)
+        parser = parser_for(self.immutable_grammar, nonterminal)
         try:
             parse_tree = next(parser.parse(inp))
             if nonterminal != "<start>":
@@ -977,8 +1023,6 @@ class ISLaSolver:
             start_symbol=start_symbol,
         )
 
-        result.regex_cache = self.regex_cache
-
         return result
 
     @staticmethod
@@ -995,10 +1039,7 @@ class ISLaSolver:
         self,
         state: SolutionState,
     ) -> Maybe[List[SolutionState]]:
-        if all(
-            not isinstance(conjunct, language.ForallFormula)
-            for conjunct in get_conjuncts(state.constraint)
-        ):
+        if not has_conjunct_of_type(state.constraint, language.ForallFormula):
             return Maybe.nothing()
 
         expansion_result = self.expand_tree(state)
@@ -1037,7 +1078,7 @@ class ISLaSolver:
                 isinstance(conjunct, language.NegatedFormula)
                 and isinstance(conjunct.args[0], language.SemanticPredicateFormula)
             )
-            for conjunct in get_conjuncts(state.constraint)
+            for conjunct in iter_conjuncts(state.constraint)
         ), (
             "Constraint is not true and contains formulas "
             f"other than semantic predicate formulas: {state.constraint}"
@@ -1047,7 +1088,7 @@ class ISLaSolver:
             state.constraint == sc.true()
             or all(
                 not pred_formula.binds_tree(leaf)
-                for pred_formula in get_conjuncts(state.constraint)
+                for pred_formula in iter_conjuncts(state.constraint)
                 if isinstance(pred_formula, language.SemanticPredicateFormula)
                 for _, leaf in state.tree.open_leaves()
             )
@@ -1055,7 +1096,7 @@ class ISLaSolver:
                 not cast(
                     language.SemanticPredicateFormula, pred_formula.args[0]
                 ).binds_tree(leaf)
-                for pred_formula in get_conjuncts(state.constraint)
+                for pred_formula in iter_conjuncts(state.constraint)
                 if isinstance(pred_formula, language.NegatedFormula)
                 and isinstance(pred_formula.args[0], language.SemanticPredicateFormula)
             )
@@ -1074,6 +1115,11 @@ class ISLaSolver:
         self,
         state: SolutionState,
     ) -> Maybe[List[SolutionState]]:
+        # We check the constraint first: Creating a fuzzer is not for free (the
+        # fuzzer checks the validity of the grammar).
+        if state.constraint != sc.true():
+            return Maybe.nothing()
+
         fuzzer = (
             self.fuzzer if self.global_fuzzer else self.fuzzer_factory(self.grammar)
         )
@@ -1081,13 +1127,12 @@ class ISLaSolver:
         if isinstance(fuzzer, GrammarCoverageFuzzer):
             fuzzer.covered_expansions.update(self.seen_coverages)
 
-        if state.constraint != sc.true():
-            return Maybe.nothing()
+        open_leaves = list(state.tree.open_leaves())
 
         closed_results: List[SolutionState] = []
         for _ in range(self.max_number_free_instantiations):
             result = state.tree
-            for path, leaf in state.tree.open_leaves():
+            for path, leaf in open_leaves:
                 leaf_inst = fuzzer.expand_tree(DerivationTree(leaf.value, None))
                 result = result.replace_path(path, leaf_inst)
 
@@ -1099,6 +1144,10 @@ class ISLaSolver:
         self,
         state: SolutionState,
     ) -> Maybe[List[SolutionState]]:
+        open_leaves = [subtree for _, subtree in state.tree.open_leaves()]
+        if not open_leaves:
+            return Maybe([])
+
         fuzzer = (
             self.fuzzer if self.global_fuzzer else self.fuzzer_factory(self.grammar)
         )
@@ -1110,7 +1159,7 @@ class ISLaSolver:
         for _ in range(self.max_number_free_instantiations):
             substitutions: Dict[DerivationTree, DerivationTree] = {
                 subtree: fuzzer.expand_tree(DerivationTree(subtree.value, None))
-                for path, subtree in state.tree.open_leaves()
+                for subtree in open_leaves
             }
 
             if substitutions:
@@ -1137,7 +1186,7 @@ class ISLaSolver:
             )
         ]
 
-        formula = state.constraint
+        instantiations: Dict[language.Formula, language.Formula] = {}
         for predicate_formula in predicate_formulas:
             instantiation = language.SMTFormula(
                 z3.BoolVal(predicate_formula.evaluate(state.tree))
@@ -1147,18 +1196,21 @@ class ISLaSolver:
                 instantiation,
                 predicate_formula,
             )
-            formula = language.replace_formula(
-                formula, predicate_formula, instantiation
-            )
+            instantiations[predicate_formula] = instantiation
 
-        return SolutionState(formula, state.tree)
+        return SolutionState(
+            language.replace_formulas(state.constraint, instantiations), state.tree
+        )
 
     def eliminate_existential_integer_quantifiers(
         self, state: SolutionState
     ) -> Maybe[List[SolutionState]]:
+        if not has_conjunct_of_type(state.constraint, language.ExistsIntFormula):
+            return Maybe.nothing()
+
         existential_int_formulas = [
             conjunct
-            for conjunct in get_conjuncts(state.constraint)
+            for conjunct in iter_conjuncts(state.constraint)
             if isinstance(conjunct, language.ExistsIntFormula)
         ]
 
@@ -1220,9 +1272,12 @@ class ISLaSolver:
     def instantiate_universal_integer_quantifiers(
         self, state: SolutionState
     ) -> Maybe[List[SolutionState]]:
+        if not has_conjunct_of_type(state.constraint, language.ForallIntFormula):
+            return Maybe.nothing()
+
         universal_int_formulas = [
             conjunct
-            for conjunct in get_conjuncts(state.constraint)
+            for conjunct in iter_conjuncts(state.constraint)
             if isinstance(conjunct, language.ForallIntFormula)
         ]
 
@@ -1332,7 +1387,7 @@ class ISLaSolver:
             )
 
             fresh_var = language.fresh_bound_variable(
-                language.VariablesCollector().collect(state.constraint),
+                language.VariablesCollector.collect(state.constraint),
                 inner_formula.bound_variable,
                 add=False,
             )
@@ -1651,13 +1706,11 @@ class ISLaSolver:
         :return: The discovered solutions.
         """
 
-        conjuncts = split_conjunction(state.constraint)
-        semantic_formulas = [
-            conjunct
-            for conjunct in conjuncts
-            if isinstance(conjunct, language.SMTFormula)
-            and not z3.is_true(conjunct.formula)
-        ]
+        if not has_conjunct_of_type(state.constraint, language.SMTFormula):
+            return Maybe.nothing()
+
+        # The partition is cached in the constraint, which is shared by many states.
+        semantic_formulas, other_conjuncts = partition_smt_conjuncts(state.constraint)
 
         if not semantic_formulas:
             return Maybe.nothing()
@@ -1666,12 +1719,8 @@ class ISLaSolver:
             "Eliminating semantic formulas [%s]", lazyjoin(", ", semantic_formulas)
         )
 
-        prefix_conjunction = reduce(lambda a, b: a & b, semantic_formulas, sc.true())
-        new_disjunct = prefix_conjunction & reduce(
-            lambda a, b: a & b,
-            [conjunct for conjunct in conjuncts if conjunct not in semantic_formulas],
-            sc.true(),
-        )
+        prefix_conjunction = sc.conjunction(*semantic_formulas)
+        new_disjunct = prefix_conjunction & sc.conjunction(*other_conjuncts)
 
         return Maybe(
             self.eliminate_semantic_formula(
@@ -1785,6 +1834,9 @@ class ISLaSolver:
         # We produce up to two groups of output states: One where the first existential
         # formula, if it can be matched, is matched, and one where the first existential
         # formula is eliminated by tree insertion.
+        if not has_conjunct_of_type(state.constraint, language.ExistsFormula):
+            return None
+
         maybe_first_existential_formula_with_idx = Maybe.from_iterator(
             (idx, conjunct)
             for idx, conjunct in enumerate(split_conjunction(state.constraint))
@@ -1794,7 +1846,9 @@ class ISLaSolver:
         if not maybe_first_existential_formula_with_idx:
             return None
 
-        first_matched = OrderedSet(
+        # We use dictionaries as (insertion-ordered) sets of solution states; we
+        # only need membership and ordered, duplicate-free iteration here.
+        first_matched: Dict[SolutionState, None] = dict.fromkeys(
             self.match_existential_formula(
                 maybe_first_existential_formula_with_idx.get()[0], state
             )
@@ -1815,24 +1869,21 @@ class ISLaSolver:
             )
 
         # 3. Eliminate first existential formula by tree insertion.
-        elimination_result = OrderedSet(
-            self.eliminate_existential_formula(
-                maybe_first_existential_formula_with_idx.get()[0], state
+        elimination_result: Dict[SolutionState, None] = {
+            result: None
+            for result in dict.fromkeys(
+                self.eliminate_existential_formula(
+                    maybe_first_existential_formula_with_idx.get()[0], state
+                )
             )
-        )
-        elimination_result = OrderedSet(
-            [
-                result
-                for result in elimination_result
-                if not any(
-                    other_result.tree == result.tree
-                    and self.propositionally_unsatisfiable(
-                        result.constraint & -other_result.constraint
-                    )
-                    for other_result in first_matched
+            if not any(
+                other_result.tree == result.tree
+                and self.propositionally_unsatisfiable(
+                    result.constraint & -other_result.constraint
                 )
-            ]
-        )
+                for other_result in first_matched
+            )
+        }
 
         if not elimination_result and not first_matched:
             self.logger.warning(
@@ -1855,6 +1906,9 @@ class ISLaSolver:
     def match_all_universal_formulas(
         self, state: SolutionState
     ) -> Maybe[List[SolutionState]]:
+        if not has_conjunct_of_type(state.constraint, language.ForallFormula):
+            return Maybe.nothing()
+
         universal_formulas = [
             conjunct
             for conjunct in split_conjunction(state.constraint)
@@ -1891,6 +1945,17 @@ class ISLaSolver:
         :return: A (possibly empty) list of expanded trees.
         """
 
+        quantified_formulas = [
+            formula
+            for formula in iter_conjuncts(state.constraint)
+            if isinstance(
+                formula,
+                language.ForallFormula
+                if only_universal
+                else language.QuantifiedFormula,
+            )
+        ]
+
         nonterminal_expansions: Dict[Path, List[List[DerivationTree]]] = {
             leaf_path: [
                 [
@@ -1902,43 +1967,37 @@ class ISLaSolver:
             for leaf_path, leaf_node in state.tree.open_leaves()
             if any(
                 self.quantified_formula_might_match(formula, leaf_path, state.tree)
-                for formula in get_conjuncts(state.constraint)
-                if (only_universal and isinstance(formula, language.ForallFormula))
-                or (
-                    not only_universal
-                    and isinstance(formula, language.QuantifiedFormula)
-                )
+                for formula in quantified_formulas
             )
         }
 
         if not nonterminal_expansions:
             return []
 
-        possible_expansions: List[Dict[Path, List[DerivationTree]]] = []
+        possible_expansions: Iterable[Dict[Path, List[DerivationTree]]]
         if not limit:
-            possible_expansions = dict_of_lists_to_list_of_dicts(nonterminal_expansions)
-            assert len(possible_expansions) == math.prod(
-                len(values) for values in nonterminal_expansions.values()
+            # We generate the Cartesian product of all expansions lazily.
+            paths = list(nonterminal_expansions)
+            possible_expansions = (
+                dict(zip(paths, expansions))
+                for expansions in itertools.product(*nonterminal_expansions.values())
             )
         else:
+            # Random choices can coincide; each combination is only expanded once.
+            chosen_expansions: Dict[Tuple[Tuple[Path, int], ...], None] = {}
             for _ in range(limit):
-                curr_expansion = {}
-                for path, expansions in nonterminal_expansions.items():
-                    if not expansions:
-                        continue
-
-                    curr_expansion[path] = random.choice(expansions)
-                possible_expansions.append(curr_expansion)
+                chosen_expansions[
+                    tuple(
+                        (path, random.randrange(len(expansions)))
+                        for path, expansions in nonterminal_expansions.items()
+                        if expansions
+                    )
+                ] = None
 
-        # This replaces a previous `if` statement with the negated condition as guard,
-        # which seems to be dead code (the guard can never hold true due to the check
-        # of emptiness of `nonterminal_expansions` above). We keep this assertion here
-        # to be sure.
-        assert (
-            len(possible_expansions) > 1
-            or len(possible_expansions) == 1
-            and possible_expansions[0]
-        )
+            possible_expansions = [
+                {path: nonterminal_expansions[path][idx] for path, idx in choice}
+                for choice in chosen_expansions
+            ]
 
         result: List[SolutionState] = []
         for possible_expansion in possible_expansions:
@@ -1953,18 +2012,28 @@ class ISLaSolver:
                 assert expanded_tree != state.tree
                 assert expanded_tree.structural_hash() != state.tree.structural_hash()
 
+            # Expanded paths frequently share prefixes; we only look up each
+            # affected subtree once.
+            affected_paths = dict.fromkeys(
+                path[:idx]
+                for path in possible_expansion
+                for idx in range(len(path) + 1)
+            )
+
             updated_constraint = state.constraint.substitute_expressions(
                 {
-                    state.tree.get_subtree(path[:idx]): expanded_tree.get_subtree(
-                        path[:idx]
-                    )
-                    for path in possible_expansion
-                    for idx in range(len(path) + 1)
+                    state.tree.get_subtree(path): expanded_tree.get_subtree(path)
+                    for path in affected_paths
                 }
             )
 
             result.append(SolutionState(updated_constraint, expanded_tree))
 
+        # This replaces a previous `if` statement with the negated condition as guard,
+        # which seems to be dead code (the guard can never hold true due to the check
+        # of emptiness of `nonterminal_expansions` above). We keep this assertion here
+        # to be sure.
+        assert result
         assert not limit or len(result) <= limit
         return result
 
@@ -1979,16 +2048,24 @@ class ISLaSolver:
             matches: List[Dict[language.Variable, Tuple[Path, DerivationTree]]] = [
                 match
                 for match in matches_for_quantified_formula(
-                    universal_formula, self.grammar
+                    universal_formula,
+                    self.grammar,
+                    immutable_grammar=self.immutable_grammar,
                 )
                 if not universal_formula.is_already_matched(
                     match[universal_formula.bound_variable][1]
                 )
             ]
 
+            # Most quantifiers have no new match; we only create the updated
+            # formula if there is one.
+            if not matches:
+                continue
+
             universal_formula_with_matches = universal_formula.add_already_matched(
                 {match[universal_formula.bound_variable][1] for match in matches}
             )
+            conjuncts[idx] = universal_formula_with_matches
 
             for match in matches:
                 inst_formula = (
@@ -2001,7 +2078,6 @@ class ISLaSolver:
                 )
 
                 instantiated_formulas.append(inst_formula)
-                conjuncts[idx] = universal_formula_with_matches
 
         if instantiated_formulas:
             return [
@@ -2027,14 +2103,16 @@ class ISLaSolver:
 
         matches: List[
             Dict[language.Variable, Tuple[Path, DerivationTree]]
-        ] = matches_for_quantified_formula(existential_formula, self.grammar)
+        ] = matches_for_quantified_formula(
+            existential_formula, self.grammar, immutable_grammar=self.immutable_grammar
+        )
 
         for match in matches:
             inst_formula = existential_formula.inner_formula.substitute_expressions(
                 {variable: match_tree for variable, (_, match_tree) in match.items()}
             )
-            constraint = inst_formula & sc.conjunction(
-                *list_del(conjuncts, existential_formula_idx)
+            constraint = sc.conjunction(
+                inst_formula, *list_del(conjuncts, existential_formula_idx)
             )
             result.append(SolutionState(constraint, state.tree))
 
@@ -2060,8 +2138,20 @@ class ISLaSolver:
             )
         )
 
+        # Like the inserted trees, the variables bound by the match expression
+        # only depend on the formula; we compute them only once.
+        bind_expr_bound_vars: OrderedSet[language.BoundVariable] = (
+            OrderedSet()
+            if existential_formula.bind_expression is None
+            else existential_formula.bind_expression.bound_variables()
+        )
+
         result: List[SolutionState] = []
 
+        # The path of the tree into which we insert does not depend on the
+        # inserted tree or insertion result; we compute it only once.
+        replaced_path = state.tree.find_node(existential_formula.in_variable)
+
         inserted_tree: DerivationTree
         bind_expr_paths: Dict[language.BoundVariable, Path]
         for inserted_tree, bind_expr_paths in inserted_trees_and_bind_paths:
@@ -2090,7 +2180,6 @@ class ISLaSolver:
             ]
 
             for insertion_result in insertion_results:
-                replaced_path = state.tree.find_node(existential_formula.in_variable)
                 resulting_tree = state.tree.replace_path(
                     replaced_path, insertion_result
                 )
@@ -2120,8 +2209,7 @@ class ISLaSolver:
                             (var, path)
                             for var, path in bind_expr_paths.items()
                             if (
-                                var
-                                in existential_formula.bind_expression.bound_variables()
+                                var in bind_expr_bound_vars
                                 and insertion_result.find_node(
                                     inserted_tree.get_subtree(path)
                                 )
@@ -2137,8 +2225,7 @@ class ISLaSolver:
                         {
                             var: inserted_tree.get_subtree(path)
                             for var, path in bind_expr_paths.items()
-                            if var
-                            in existential_formula.bind_expression.bound_variables()
+                            if var in bind_expr_bound_vars
                         }
                     )
 
@@ -2148,18 +2235,20 @@ class ISLaSolver:
                     ).substitute_expressions(tree_substitution)
                 )
 
-                instantiated_original_constraint = sc.conjunction(
-                    *list_del(conjuncts, existential_formula_idx)
-                ).substitute_expressions(tree_substitution)
-
                 new_tree = resulting_tree.substitute(tree_substitution)
 
-                new_formula = (
-                    instantiated_formula
-                    & self.formula.substitute_expressions(
+                # We build the new constraint as one flat conjunction instead of
+                # first conjoining the remaining conjuncts and splitting them up
+                # again when substituting and conjoining the result.
+                new_formula = sc.conjunction(
+                    instantiated_formula,
+                    self.formula.substitute_expressions(
                         {self.top_constant.get(): new_tree}
-                    )
-                    & instantiated_original_constraint
+                    ),
+                    *(
+                        conjunct.substitute_expressions(tree_substitution)
+                        for conjunct in list_del(conjuncts, existential_formula_idx)
+                    ),
                 )
 
                 new_state = SolutionState(new_formula, new_tree)
@@ -2175,7 +2264,7 @@ class ISLaSolver:
                     lost_tree_predicate_arguments: List[DerivationTree] = [
                         arg
                         for invstate in self.establish_invariant(new_state)
-                        for predicate_formula in get_conjuncts(invstate.constraint)
+                        for predicate_formula in iter_conjuncts(invstate.constraint)
                         if isinstance(
                             predicate_formula, language.StructuralPredicateFormula
                         )
@@ -2198,7 +2287,7 @@ class ISLaSolver:
                     lost_semantic_formula_arguments = [
                         arg
                         for invstate in self.establish_invariant(new_state)
-                        for semantic_formula in get_conjuncts(new_state.constraint)
+                        for semantic_formula in iter_conjuncts(new_state.constraint)
                         if isinstance(semantic_formula, language.SMTFormula)
                         for arg in semantic_formula.substitutions.values()
                         if invstate.tree.find_node(arg) is None
@@ -2242,10 +2331,8 @@ class ISLaSolver:
         :return: A list of instantiated SolutionStates.
         """
 
-        assert all(
-            isinstance(conjunct, language.SMTFormula)
-            for conjunct in get_conjuncts(semantic_formula)
-        )
+        conjuncts = get_conjuncts(semantic_formula)
+        assert all(isinstance(conjunct, language.SMTFormula) for conjunct in conjuncts)
 
         # NODE: We need to cluster SMT formulas by tree substitutions. If there are two
         # formulas with a variable $var which is instantiated to different trees, we
@@ -2255,7 +2342,7 @@ class ISLaSolver:
         smt_formulas = self.rename_instantiated_variables_in_smt_formulas(
             [
                 smt_formula
-                for smt_formula in get_conjuncts(semantic_formula)
+                for smt_formula in conjuncts
                 if isinstance(smt_formula, language.SMTFormula)
             ]
         )
@@ -2266,18 +2353,19 @@ class ISLaSolver:
         # better handle smaller constraints, and those which do not have variables in
         # common can be handled independently.
 
-        def cluster_keys(smt_formula: language.SMTFormula):
-            return (
+        formula_keys = {
+            smt_formula: (
                 smt_formula.free_variables()
                 | smt_formula.instantiated_variables
-                | set(
-                    [
-                        subtree
-                        for tree in smt_formula.substitutions.values()
-                        for _, subtree in tree.paths()
-                    ]
-                )
+                | {
+                    subtree
+                    for tree in smt_formula.substitutions.values()
+                    for _, subtree in tree.paths()
+                }
             )
+            for smt_formula in smt_formulas
+        }
+        cluster_keys = formula_keys.__getitem__
 
         formula_clusters: List[List[language.SMTFormula]] = cluster_by_common_elements(
             smt_formulas, cluster_keys
@@ -2324,8 +2412,12 @@ class ISLaSolver:
         solutions: List[
             Dict[Union[language.Constant, DerivationTree], DerivationTree]
         ] = [
-            functools.reduce(operator.or_, dicts)
-            for dicts in itertools.product(*all_solutions)
+            {
+                constant: value
+                for solution in cluster_solutions
+                for constant, value in solution.items()
+            }
+            for cluster_solutions in itertools.product(*all_solutions)
         ]
 
         results = []
@@ -2348,7 +2440,6 @@ class ISLaSolver:
 
         return results
 
-    @lru_cache(100)
     def solve_quantifier_free_formula(
         self,
         smt_formulas: ImmutableList[language.SMTFormula],
@@ -2368,6 +2459,27 @@ class ISLaSolver:
         :return: A (possibly empty) list of solutions.
         """
 
+        # The cache lives on the solver instance; an `lru_cache` on this method
+        # would keep every solver alive via the `self` argument.
+        key = (smt_formulas, max_instantiations)
+        if key in self.quantifier_free_solutions_cache:
+            return self.quantifier_free_solutions_cache[key]
+
+        result = self.__solve_quantifier_free_formula(smt_formulas, max_instantiations)
+
+        if len(self.quantifier_free_solutions_cache) >= 100:
+            del self.quantifier_free_solutions_cache[
+                next(iter(self.quantifier_free_solutions_cache))
+            ]
+        self.quantifier_free_solutions_cache[key] = result
+
+        return result
+
+    def __solve_quantifier_free_formula(
+        self,
+        smt_formulas: ImmutableList[language.SMTFormula],
+        max_instantiations: Optional[int] = None,
+    ) -> List[Dict[language.Constant | DerivationTree, DerivationTree]]:
         # If any SMT formula refers to *sub*trees in the instantiations of other SMT
         # formulas, we have to instantiate those first.
         priority_formulas = smt_formulas_referring_to_subtrees(smt_formulas)
@@ -2376,37 +2488,52 @@ class ISLaSolver:
             smt_formulas = priority_formulas
             assert not smt_formulas_referring_to_subtrees(smt_formulas)
 
-        tree_substitutions = reduce(
-            lambda d1, d2: d1 | d2,
-            [smt_formula.substitutions for smt_formula in smt_formulas],
-            {},
-        )
-
-        constants = reduce(
-            lambda d1, d2: d1 | d2,
-            [
-                smt_formula.free_variables() | smt_formula.instantiated_variables
-                for smt_formula in smt_formulas
-            ],
-            set(),
-        )
+        # Merge in place; folding with `|` would copy the accumulated dict / set
+        # once per formula.
+        tree_substitutions: Dict[language.Variable, DerivationTree] = {}
+        constants: Set[language.Variable] = set()
+        for smt_formula in smt_formulas:
+            tree_substitutions.update(smt_formula.substitutions)
+            constants.update(smt_formula.free_variables())
+            constants.update(smt_formula.instantiated_variables)
 
         solutions: List[
             Dict[Union[language.Constant, DerivationTree], DerivationTree]
         ] = []
-        internal_solutions: List[Dict[language.Constant, z3.StringVal]] = []
+
+        (
+            formulas,
+            fresh_var_map,
+            length_vars,
+            int_vars,
+        ) = self.smt_formulas_with_language_constraints(
+            constants,
+            tuple([smt_formula.formula for smt_formula in smt_formulas]),
+            tree_substitutions,
+        )
+
+        # We enumerate solutions using a single, incremental Z3 solver. The
+        # language constraints are added only once; for each solution, we add
+        # a clause excluding it. That way, Z3 can retain what it learned in
+        # previous queries.
+        z3_solver = z3.Solver()
+        z3_solver.set("timeout", 500)
+        z3_solver.add(*formulas)
+
+        # Solutions are compared by their items; we keep them in a set to detect
+        # repeated solutions without comparing with all previous ones.
+        seen_solutions: Set[
+            FrozenSet[Tuple[language.Constant | DerivationTree, DerivationTree]]
+        ] = set()
 
         num_instantiations = max_instantiations or self.max_number_smt_instantiations
         for _ in range(num_instantiations):
-            (
-                solver_result,
-                maybe_model,
-            ) = self.solve_smt_formulas_with_language_constraints(
-                constants,
-                tuple([smt_formula.formula for smt_formula in smt_formulas]),
-                tree_substitutions,
-                internal_solutions,
-            )
+            solver_result = z3_solver.check()
+            z3_model = z3_solver.model() if solver_result == z3.sat else None
+
+            if solver_result == z3.unknown:
+                # `z3_solve` retries with fresh solvers, different seeds, etc.
+                solver_result, z3_model = z3_solve(list(z3_solver.assertions()))
 
             if solver_result != z3.sat:
                 if not solutions:
@@ -2414,7 +2541,14 @@ class ISLaSolver:
                 else:
                     return solutions
 
-            assert maybe_model is not None
+            assert z3_model is not None
+
+            maybe_model = {
+                var: self.extract_model_value(
+                    var, z3_model, fresh_var_map, length_vars, int_vars
+                )
+                for var in constants
+            }
 
             new_solution = {
                 tree_substitutions.get(constant, constant): maybe_model[constant]
@@ -2426,15 +2560,33 @@ class ISLaSolver:
                 for constant in constants
             }
 
-            if new_solution in solutions:
+            new_solution_key = frozenset(new_solution.items())
+            if new_solution_key in seen_solutions:
                 # This can happen for trivial solutions, i.e., if the formula is
                 # logically valid. Then, the assignment for that constant will
                 # always be {}
                 return solutions
             else:
+                seen_solutions.add(new_solution_key)
                 solutions.append(new_solution)
                 if new_internal_solution:
-                    internal_solutions.append(new_internal_solution)
+                    # Exclude the solution: At least one constant has to differ.
+                    z3_solver.add(
+                        z3_or(
+                            [
+                                z3.Not(
+                                    self.previous_solution_formula(
+                                        var,
+                                        string_val,
+                                        fresh_var_map,
+                                        length_vars,
+                                        int_vars,
+                                    )
+                                )
+                                for var, string_val in new_internal_solution.items()
+                            ]
+                        )
+                    )
                 else:
                     # Again, for a trivial solution (e.g., True), the assignment
                     # can be empty.
@@ -2442,13 +2594,30 @@ class ISLaSolver:
 
         return solutions
 
-    def solve_smt_formulas_with_language_constraints(
+    def smt_formulas_with_language_constraints(
         self,
         variables: Set[language.Variable],
         smt_formulas: ImmutableList[z3.BoolRef],
         tree_substitutions: Dict[language.Variable, DerivationTree],
-        solutions_to_exclude: List[Dict[language.Variable, z3.StringVal]],
-    ) -> Tuple[z3.CheckSatResult, Dict[language.Variable, DerivationTree]]:
+    ) -> Tuple[
+        List[z3.BoolRef],
+        Dict[language.Variable, z3.ExprRef],
+        Set[language.Variable],
+        Set[language.Variable],
+    ]:
+        """
+        Computes the Z3 formulas to pass to the SMT solver for solving the given
+        SMT formulas. Adds language constraints for the variables and replaces
+        `str.len` and `str.to.int` terms by fresh variables where possible.
+
+        :param variables: The variables in the SMT formulas.
+        :param smt_formulas: The SMT formulas to solve.
+        :param tree_substitutions: The trees the variables are instantiated with.
+        :return: The Z3 formulas, the map from "length" and "int" variables to the
+          fresh Z3 variables replacing them, and the sets of "length" and "int"
+          variables. The latter are needed to extract model values.
+        """
+
         # We disable optimized Z3 queries if the SMT formulas contain "too concrete"
         # substitutions, that is, substitutions with a tree that is not merely an
         # open leaf. Example: we have a constrained `str.len(<chars>) < 10` and a
@@ -2476,16 +2645,19 @@ class ISLaSolver:
 
         # Create fresh variables for `str.len` and `str.to.int` variables.
         all_variables = set(variables)
+        all_variable_names = {var.name for var in all_variables}
         fresh_var_map: Dict[language.Variable, z3.ExprRef] = {}
         for var in length_vars | int_vars:
             fresh = fresh_constant(
                 all_variables,
                 language.Constant(var.name, "NOT-NEEDED"),
+                used_names=all_variable_names,
             )
             fresh_var_map[var] = z3.Int(fresh.name)
 
         # In `smt_formulas`, we replace all `length(...)` terms for "length variables"
         # with the corresponding fresh variable.
+        length_and_int_var_symbols = {var.to_smt() for var in length_vars | int_vars}
         replacement_map: Dict[z3.ExprRef, z3.ExprRef] = {
             expr: fresh_var_map[
                 get_elem_by_equivalence(
@@ -2497,7 +2669,7 @@ class ISLaSolver:
             for formula in smt_formulas
             for expr in visit_z3_expr(formula)
             if expr.decl().kind() in {z3.Z3_OP_SEQ_LENGTH, z3.Z3_OP_STR_TO_INT}
-            and expr.children()[0] in {var.to_smt() for var in length_vars | int_vars}
+            and expr.children()[0] in length_and_int_var_symbols
         }
 
         # Perform substitution, add formulas
@@ -2546,31 +2718,7 @@ class ISLaSolver:
                 )
             )
 
-        for prev_solution in solutions_to_exclude:
-            prev_solution_formula = z3_and(
-                [
-                    self.previous_solution_formula(
-                        var, string_val, fresh_var_map, length_vars, int_vars
-                    )
-                    for var, string_val in prev_solution.items()
-                ]
-            )
-
-            formulas.append(z3.Not(prev_solution_formula))
-
-        sat_result, maybe_model = z3_solve(formulas)
-
-        if sat_result != z3.sat:
-            return sat_result, {}
-
-        assert maybe_model is not None
-
-        return sat_result, {
-            var: self.extract_model_value(
-                var, maybe_model, fresh_var_map, length_vars, int_vars
-            )
-            for var in variables
-        }
+        return formulas, fresh_var_map, length_vars, int_vars
 
     @staticmethod
     def previous_solution_formula(
@@ -2890,7 +3038,7 @@ class ISLaSolver:
         if not var.is_numeric():
             return fallback(var, model, fresh_var_map, length_vars, int_vars)
 
-        z3_var = z3.String(var.name)
+        z3_var = z3_string(var.name)
         if z3_var.decl() in model.decls():
             model_value = model[z3_var]
         else:
@@ -2991,54 +3139,72 @@ class ISLaSolver:
             # set for the nonterminal in question, we return a derivation tree.
             # Otherwise, a RuntimeError is raised.
 
-            z3_solver = z3.Solver()
-            z3_solver.set("timeout", 300)
-
-            maybe_plus_re = z3.Option(z3.Re("+"))
-            zeroes_padding_re = z3.Star(z3.Re("0"))
-
-            # TODO: Ensure symbols are fresh
+            # The constraints on the sign and padding are the same for all
+            # queries, so we add them to a persistent solver only once and push
+            # the constraint for the concrete value.
             maybe_plus_var = z3.String("__plus")
             zeroes_padding_var = z3.String("__padding")
 
-            z3_solver.add(z3.InRe(maybe_plus_var, maybe_plus_re))
-            z3_solver.add(z3.InRe(zeroes_padding_var, zeroes_padding_re))
+            if self.numeric_padding_solver is None:
+                self.numeric_padding_solver = z3.Solver()
+                self.numeric_padding_solver.set("timeout", 300)
+
+                # TODO: Ensure symbols are fresh
+                self.numeric_padding_solver.add(
+                    z3.InRe(maybe_plus_var, z3.Option(z3.Re("+")))
+                )
+                self.numeric_padding_solver.add(
+                    z3.InRe(zeroes_padding_var, z3.Star(z3.Re("0")))
+                )
 
-            z3_solver.add(
-                z3.InRe(
-                    z3.Concat(
-                        maybe_plus_var if int_model_value >= 0 else z3.StringVal("-"),
-                        zeroes_padding_var,
-                        z3.StringVal(
-                            str_model_value
+            z3_solver = self.numeric_padding_solver
+            z3_solver.push()
+            try:
+                z3_solver.add(
+                    z3.InRe(
+                        z3.Concat(
+                            maybe_plus_var
                             if int_model_value >= 0
-                            else str(-int_model_value)
+                            else z3.StringVal("-"),
+                            zeroes_padding_var,
+                            z3.StringVal(
+                                str_model_value
+                                if int_model_value >= 0
+                                else str(-int_model_value)
+                            ),
                         ),
-                    ),
-                    self.extract_regular_expression(var.n_type),
+                        self.extract_regular_expression(var.n_type),
+                    )
                 )
-            )
 
-            if z3_solver.check() != z3.sat:
-                raise RuntimeError(
-                    "Could not parse a numeric solution "
-                    + f"({str_model_value}) for variable "
-                    + f"{var} of type '{var.n_type}'; try "
-                    + "running the solver without optimized Z3 queries or make "
-                    + "sure that ranges are restricted to syntactically valid "
-                    + "ones (according to the grammar).",
-                )
+                if z3_solver.check() != z3.sat:
+                    raise RuntimeError(
+                        "Could not parse a numeric solution "
+                        + f"({str_model_value}) for variable "
+                        + f"{var} of type '{var.n_type}'; try "
+                        + "running the solver without optimized Z3 queries or make "
+                        + "sure that ranges are restricted to syntactically valid "
+                        + "ones (according to the grammar).",
+                    )
 
-            return self.parse(
-                (
-                    z3_solver.model()[maybe_plus_var].as_string()
-                    if int_model_value >= 0
-                    else "-"
+                padding_model = z3_solver.model()
+                padded_value = (
+                    (
+                        padding_model[maybe_plus_var].as_string()
+                        if int_model_value >= 0
+                        else "-"
+                    )
+                    + padding_model[zeroes_padding_var].as_string()
+                    + (
+                        str_model_value
+                        if int_model_value >= 0
+                        else str(-int_model_value)
+                    )
                 )
-                + z3_solver.model()[zeroes_padding_var].as_string()
-                + (str_model_value if int_model_value >= 0 else str(-int_model_value)),
-                var.n_type,
-            )
+            finally:
+                z3_solver.pop()
+
+            return self.parse(padded_value, var.n_type)
 
     def extract_model_value_flexible_var(
         self,
@@ -3062,7 +3228,7 @@ class ISLaSolver:
         """
 
         return self.parse(
-            smt_string_val_to_string(model[z3.String(var.name)]),
+            smt_string_val_to_string(model[z3_string(var.name)]),
             var.n_type,
         )
 
@@ -3200,7 +3366,7 @@ class ISLaSolver:
             else:
                 regex = self.extract_regular_expression(constant.n_type)
 
-            formulas.append(z3.InRe(z3.String(constant.name), regex))
+            formulas.append(z3.InRe(z3_string(constant.name), regex))
 
         return formulas
 
@@ -3272,10 +3438,7 @@ class ISLaSolver:
 
                 # Remove states with unsatisfiable SMT-LIB formulas.
                 if (
-                    any(
-                        isinstance(f, language.SMTFormula)
-                        for f in split_conjunction(new_state.constraint)
-                    )
+                    has_conjunct_of_type(new_state.constraint, language.SMTFormula)
                     and not self.eliminate_all_semantic_formulas(
                         new_state, max_instantiations=1
                     )
@@ -3288,6 +3451,11 @@ class ISLaSolver:
                     )
 
                 # Remove states with unsatisfiable existential formulas.
+                if not has_conjunct_of_type(
+                    new_state.constraint, language.ExistsFormula
+                ):
+                    continue
+
                 existential_formulas = [
                     f
                     for f in split_conjunction(new_state.constraint)
@@ -3296,8 +3464,10 @@ class ISLaSolver:
                 for existential_formula in existential_formulas:
                     old_start_time = self.start_time
                     old_timeout_seconds = self.timeout_seconds
-                    old_queue = list(self.queue)
-                    old_solutions = list(self.solutions)
+                    # The nested search works on fresh lists, so we can restore
+                    # the original ones afterward without copying them.
+                    old_queue = self.queue
+                    old_solutions = self.solutions
 
                     self.queue = []
                     self.solutions = []
@@ -3324,13 +3494,17 @@ class ISLaSolver:
 
             self.currently_unsat_checking = False
 
-        assert all(
-            state.tree.find_node(tree) is not None
-            for state in new_states
-            for quantified_formula in split_conjunction(state.constraint)
-            if isinstance(quantified_formula, language.QuantifiedFormula)
-            for _, tree in quantified_formula.in_variable.filter(lambda t: True)
-        )
+        if assertions_activated():
+            # All trees in quantified formulas must be part of the state's tree.
+            # We compare node IDs (as does `find_node`), but only index them once.
+            for state in new_states:
+                tree_ids = {subtree.id for _, subtree in state.tree.paths()}
+                assert all(
+                    tree.id in tree_ids
+                    for quantified_formula in split_conjunction(state.constraint)
+                    if isinstance(quantified_formula, language.QuantifiedFormula)
+                    for _, tree in quantified_formula.in_variable.paths()
+                )
 
         solution_trees = [
             new_state.tree
@@ -3407,7 +3581,9 @@ class ISLaSolver:
         self.logger.debug(
             "Pushing new state (%s, %s) (hash %d, cost %f)",
             state.constraint,
-            state.tree.to_string(show_open_leaves=True, show_ids=True),
+            lazystr(
+                lambda: state.tree.to_string(show_open_leaves=True, show_ids=True)
+            ),
             hash(state),
             cost,
         )
@@ -3425,11 +3601,8 @@ class ISLaSolver:
         self.logger.info(
             f"Recomputing costs in queue after {self.step_cnt} solver steps"
         )
-        old_queue = list(self.queue)
-        self.queue = []
-        for _, state in old_queue:
-            cost = self.compute_cost(state)
-            heapq.heappush(self.queue, (cost, state))
+        self.queue = [(self.compute_cost(state), state) for _, state in self.queue]
+        heapq.heapify(self.queue)
 
     def assert_no_dangling_smt_formula_argument_trees(
         self, state: SolutionState
@@ -3437,13 +3610,14 @@ class ISLaSolver:
         if not assertions_activated() and not self.debug:
             return
 
+        tree_ids = {subtree.id for _, subtree in state.tree.paths()}
         dangling_smt_formula_argument_trees = [
             (smt_formula, arg)
             for smt_formula in language.FilterVisitor(
                 lambda f: isinstance(f, language.SMTFormula)
             ).collect(state.constraint)
             for arg in cast(language.SMTFormula, smt_formula).substitutions.values()
-            if isinstance(arg, DerivationTree) and state.tree.find_node(arg) is None
+            if isinstance(arg, DerivationTree) and arg.id not in tree_ids
         ]
 
         if dangling_smt_formula_argument_trees:
@@ -3461,13 +3635,14 @@ class ISLaSolver:
         if not assertions_activated() and not self.debug:
             return
 
+        tree_ids = {subtree.id for _, subtree in state.tree.paths()}
         dangling_predicate_argument_trees = [
             (predicate_formula, arg)
             for predicate_formula in language.FilterVisitor(
                 lambda f: isinstance(f, language.StructuralPredicateFormula)
             ).collect(state.constraint)
             for arg in cast(language.StructuralPredicateFormula, predicate_formula).args
-            if isinstance(arg, DerivationTree) and state.tree.find_node(arg) is None
+            if isinstance(arg, DerivationTree) and arg.id not in tree_ids
         ]
 
         if dangling_predicate_argument_trees:
@@ -3489,9 +3664,11 @@ class ISLaSolver:
 
     def establish_invariant(self, state: SolutionState) -> List[SolutionState]:
         formula = convert_to_dnf(convert_to_nnf(state.constraint), deep=False)
+        # The DNF can contain duplicate disjuncts. Each of them would be processed
+        # separately before being rejected when enqueued, so we drop them here.
         return [
             SolutionState(disjunct, state.tree)
-            for disjunct in split_disjunction(formula)
+            for disjunct in dict.fromkeys(split_disjunction(formula))
         ]
 
     def compute_cost(self, state: SolutionState) -> float:
@@ -3503,16 +3680,23 @@ class ISLaSolver:
     def remove_nonmatching_universal_quantifiers(
         self, state: SolutionState
     ) -> SolutionState:
-        conjuncts = [conjunct for conjunct in get_conjuncts(state.constraint)]
+        conjuncts = get_conjuncts(state.constraint)
         deleted = False
 
         for idx, universal_formula in reversed(list(enumerate(conjuncts))):
             if not isinstance(universal_formula, language.ForallFormula):
                 continue
 
-            if (
-                universal_formula.in_variable.is_complete()
-                and not matches_for_quantified_formula(universal_formula, self.grammar)
+            # A complete tree without the quantified nonterminal cannot contain a
+            # match; the (cached) nonterminal set spares us the matching.
+            if universal_formula.in_variable.is_complete() and (
+                universal_formula.bound_variable.n_type
+                not in universal_formula.in_variable.nonterminals()
+                or not matches_for_quantified_formula(
+                    universal_formula,
+                    self.grammar,
+                    immutable_grammar=self.immutable_grammar,
+                )
             ):
                 deleted = True
                 del conjuncts[idx]
@@ -3532,7 +3716,11 @@ class ISLaSolver:
             if not isinstance(universal_formula, language.ForallFormula):
                 continue
 
-            matches = matches_for_quantified_formula(universal_formula, self.grammar)
+            matches = matches_for_quantified_formula(
+                universal_formula,
+                self.grammar,
+                immutable_grammar=self.immutable_grammar,
+            )
 
             all_matches_matched = all(
                 universal_formula.is_already_matched(
@@ -3542,6 +3730,20 @@ class ISLaSolver:
             )
 
             def some_leaf_might_match() -> bool:
+                # Any open leaf other than the quantified nonterminal from which the
+                # quantified nonterminal is reachable might match. We check this by a
+                # single set intersection before checking leaves one by one.
+                qfd_nonterminal = universal_formula.bound_variable.n_type
+                open_leaf_nonterminals = {
+                    leaf.value
+                    for _, leaf in universal_formula.in_variable.open_leaves()
+                }
+                open_leaf_nonterminals.discard(qfd_nonterminal)
+                if not self.reverse_reachability.get(
+                    qfd_nonterminal, frozenset()
+                ).isdisjoint(open_leaf_nonterminals):
+                    return True
+
                 return any(
                     self.quantified_formula_might_match(
                         universal_formula, leaf_path, universal_formula.in_variable
@@ -3557,7 +3759,7 @@ class ISLaSolver:
             state
             if not one_removed
             else SolutionState(
-                reduce(lambda a, b: a & b, conjuncts, sc.true()),
+                sc.conjunction(*conjuncts),
                 state.tree,
             )
         )
@@ -3573,9 +3775,19 @@ class ISLaSolver:
             path_to_nonterminal,
             tree,
             self.grammar,
-            self.graph.reachable,
+            self.reachable,
         )
 
+    def reachable(self, from_nonterminal: str, to_nonterminal: str) -> bool:
+        """
+        :param from_nonterminal: The source nonterminal.
+        :param to_nonterminal: The target nonterminal.
+        :return: True iff :code:`to_nonterminal` can be derived from
+          :code:`from_nonterminal` in at least one expansion step.
+        """
+
+        return to_nonterminal in self.reachability[from_nonterminal]
+
     def extract_regular_expression(self, nonterminal: str) -> z3.ReRef:
         if nonterminal in self.regex_cache:
             return self.regex_cache[nonterminal]
@@ -3608,7 +3820,7 @@ class ISLaSolver:
             and all(
                 not is_nonterminal(elem)
                 or elem != nonterminal
-                and not self.graph.reachable(elem, nonterminal)
+                and not self.reachable(elem, nonterminal)
                 for elem in canonical_expansions[0]
             )
         ):
@@ -4048,6 +4260,33 @@ def shortest_derivations(graph: gg.GrammarGraph) -> Dict[str, int]:
     }
 
 
+@lru_cache(maxsize=32)
+def regex_cache_for(
+    grammar: ImmutableGrammar, grammar_unwinding_threshold: int
+) -> Dict[str, z3.ReRef]:
+    """
+    Returns the (initially empty) cache of regular expressions for the nonterminals
+    of the given grammar. The mapping from nonterminals to regular expressions only
+    depends on the grammar and the unwinding threshold, so solver instances for the
+    same grammar share one cache and do not have to repeat the expensive conversion.
+    Caches are kept for the 32 most recently used grammars; each cache holds at most
+    one entry per nonterminal of its grammar.
+
+    >>> grammar = grammar_to_immutable({"<start>": ["<a>"], "<a>": ["a"]})
+    >>> regex_cache_for(grammar, 4) is regex_cache_for(grammar, 4)
+    True
+    >>> regex_cache_for(grammar, 4) is regex_cache_for(grammar, 5)
+    False
+
+    :param grammar: The grammar in immutable form.
+    :param grammar_unwinding_threshold: The unwinding threshold for the regex
+      conversion of recursive grammars.
+    :return: A mutable dictionary serving as a regular expression cache.
+    """
+
+    return {}
+
+
 @lru_cache()
 def compute_symbol_costs(graph: GrammarGraph) -> Dict[str, int]:
     grammar = graph.to_grammar()
@@ -4203,12 +4442,12 @@ class EvaluatePredicateFormulasTransformer(NoopFormulaTransformer):
     def transform_conjunctive_formula(
         self, sub_formula: language.ConjunctiveFormula
     ) -> language.Formula:
-        return reduce(language.Formula.__and__, sub_formula.args)
+        return sc.conjunction(*sub_formula.args)
 
     def transform_disjunctive_formula(
         self, sub_formula: language.DisjunctiveFormula
     ) -> language.Formula:
-        return reduce(language.Formula.__or__, sub_formula.args)
+        return sc.disjunction(*sub_formula.args)
 
     def transform_smt_formula(
         self, sub_formula: language.SMTFormula
@@ -4217,12 +4456,17 @@ class EvaluatePredicateFormulasTransformer(NoopFormulaTransformer):
         # True (or False in a negation scope); in that case, we replace
         # it by "true." Otherwise, we keep it for later analysis.
 
-        instantiated_formula = copy.deepcopy(sub_formula)
-        set_smt_auto_subst(instantiated_formula, True)
-        set_smt_auto_eval(instantiated_formula, True)
-        instantiated_formula = instantiated_formula.substitute_expressions(
-            sub_formula.substitutions, force=True
-        )
+        # `substitute_expressions` does not mutate the formula, so instead of a
+        # (costly, pickle-based) deep copy, we create a shallow one with auto
+        # substitution and evaluation activated.
+        instantiated_formula = language.SMTFormula(
+            sub_formula.formula,
+            *sub_formula.free_variables_,
+            instantiated_variables=sub_formula.instantiated_variables,
+            substitutions=sub_formula.substitutions,
+            auto_eval=True,
+            auto_subst=True,
+        ).substitute_expressions(sub_formula.substitutions, force=True)
 
         assert instantiated_formula in {sc.true(), sc.false()}
 
@@ -50,21 +50,53 @@ class ThreeValuedTruth:
 
     @staticmethod
     def all(args: Iterable["ThreeValuedTruth"]) -> "ThreeValuedTruth":
-        args = list(args)
-        if any(elem.is_false() for elem in args):
-            return ThreeValuedTruth.false()
-        if any(elem.is_unknown() for elem in args):
-            return ThreeValuedTruth.unknown()
-        return ThreeValuedTruth.true()
+        """
+        Three-valued conjunction. A false element determines the result, so we
+        stop consuming `args` (which may be a lazily evaluated generator) there.
+
+        >>> t, f = ThreeValuedTruth.true(), ThreeValuedTruth.false()
+        >>> u = ThreeValuedTruth.unknown()
+        >>> ThreeValuedTruth.all([t, u, t])
+        ThreeValuedTruth(val=2)
+        >>> ThreeValuedTruth.all(iter([u, f, None]))
+        ThreeValuedTruth(val=0)
+
+        :param args: The truth values to combine.
+        :return: The conjunction of the given truth values.
+        """
+
+        result = ThreeValuedTruth.true()
+        for elem in args:
+            if elem.is_false():
+                return ThreeValuedTruth.false()
+            if elem.is_unknown():
+                result = ThreeValuedTruth.unknown()
+        return result
 
     @staticmethod
     def any(args: Iterable["ThreeValuedTruth"]) -> "ThreeValuedTruth":
-        args = list(args)
-        if any(elem.is_true() for elem in args):
-            return ThreeValuedTruth.true()
-        if any(elem.is_unknown() for elem in args):
-            return ThreeValuedTruth.unknown()
-        return ThreeValuedTruth.false()
+        """
+        Three-valued disjunction; the dual of
+        :meth:`~isla.three_valued_truth.ThreeValuedTruth.all`.
+
+        >>> t, f = ThreeValuedTruth.true(), ThreeValuedTruth.false()
+        >>> u = ThreeValuedTruth.unknown()
+        >>> ThreeValuedTruth.any([f, u, f])
+        ThreeValuedTruth(val=2)
+        >>> ThreeValuedTruth.any(iter([u, t, None]))
+        ThreeValuedTruth(val=1)
+
+        :param args: The truth values to combine.
+        :return: The disjunction of the given truth values.
+        """
+
+        result = ThreeValuedTruth.false()
+        for elem in args:
+            if elem.is_true():
+                return ThreeValuedTruth.true()
+            if elem.is_unknown():
+                result = ThreeValuedTruth.unknown()
+        return result
 
     @staticmethod
     def not_(arg: "ThreeValuedTruth") -> "ThreeValuedTruth":
@@ -22,7 +22,7 @@ import random
 import re
 import sys
 from functools import lru_cache, reduce, partial
-from typing import Callable, Tuple, cast, List, Optional, Dict, Union, Generator, Set
+from typing import Callable, Tuple, cast, List, Optional, Dict, Generator, Set
 
 import z3
 from z3.z3 import _coerce_exprs
@@ -240,12 +240,20 @@ def evaluate_z3_seq_in_re(
 
     return Maybe(
         construct_result(
-            lambda args: re.match(f"^{args[1]}$", args[0]) is not None,
+            lambda args: _full_match_regex(cast(str, args[1])).match(args[0])
+            is not None,
             children_results,
         )
     )
 
 
+@lru_cache(maxsize=1024)
+def _full_match_regex(pattern: str) -> re.Pattern:
+    # Membership constraints are usually checked for many instantiations, but with
+    # a constant regular expression; we compile it only once.
+    return re.compile(f"^{pattern}$")
+
+
 def evaluate_z3_re_star(
     expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
 ) -> Maybe[Z3EvalResult]:
@@ -535,20 +543,27 @@ def construct_result(
             tuple([child_result for _, child_result in children_results])
         )
 
+    # The positions of the children's parameters in `params` do not depend on the
+    # instantiation; we look them up only once.
+    children_param_indices: Tuple[Tuple[int, ...], ...] = tuple(
+        tuple(params.index(str(child_param)) for child_param in child_params)
+        for child_params, _ in children_results
+    )
+
     def closure(var_insts: Tuple[str, ...]) -> bool | int | str:
         assert len(var_insts) == len(params)
         instantiated_children_results: Tuple[bool | int | str, ...] = ()
-        for child_params, child_result in children_results:
+        for (child_params, child_result), child_param_indices in zip(
+            children_results, children_param_indices
+        ):
             if not child_params:
                 assert type(child_result) in {bool, int, str}
                 instantiated_children_results += (cast(bool | int | str, child_result),)
                 continue
 
-            instantiated_child_params: Tuple[str] = cast(Tuple[str], ())
-            for child_param in child_params:
-                instantiated_child_params += (
-                    var_insts[params.index(str(child_param))],
-                )
+            instantiated_child_params: Tuple[str, ...] = tuple(
+                var_insts[idx] for idx in child_param_indices
+            )
 
             eval_child_result = child_result(instantiated_child_params)
             assert type(eval_child_result) in {bool, int, str}
@@ -559,6 +574,34 @@ def construct_result(
     return params, closure
 
 
+def evaluate_instantiated_z3_expression(
+    expr: z3.ExprRef, instantiation: Dict[str, str]
+) -> bool | int | str:
+    """
+    Evaluates :code:`expr` with its symbols instantiated by the given strings.
+    Substituting string values into :code:`expr` and evaluating the result would
+    create (and translate) a new expression for each instantiation; this function
+    reuses the cached translation of :code:`expr` instead.
+
+    >>> x, y = z3.Strings("x y")
+    >>> evaluate_instantiated_z3_expression(
+    ...     z3.Length(x) < z3.Length(y), {"x": "a", "y": "ab"})
+    True
+
+    :param expr: The expression to evaluate.
+    :param instantiation: A mapping from the names of all symbols in :code:`expr`
+      to strings.
+    :return: The value of the instantiated expression.
+    :raises NotImplementedError: If :code:`expr` cannot be evaluated.
+    """
+
+    params, result = evaluate_z3_expression(expr)
+    if not params:
+        return result
+
+    return result(tuple(instantiation[param] for param in params))
+
+
 def z3_solve(
     formulas: List[z3.BoolRef], timeout_ms=500
 ) -> Tuple[z3.CheckSatResult, Optional[z3.ModelRef]]:
@@ -572,8 +615,7 @@ def z3_solve(
         solver = z3.Solver()
         if timeout_ms is not None:
             solver.set("timeout", timeout_ms)
-        for formula in formulas:
-            solver.add(formula)
+        solver.add(*formulas)
         result = solver.check()
 
         if result == z3.sat:
@@ -629,17 +671,69 @@ def is_valid(formula: z3.BoolRef, timeout: int = 500) -> ThreeValuedTruth:
     except NotImplementedError:
         pass
 
+    return check_validity(formula, timeout)
+
+
+# Decided validity checks by formula and timeout, for `check_validity`.
+VALIDITY_CACHE: Dict[Tuple[z3.BoolRef, int], ThreeValuedTruth] = {}
+
+
+def check_validity(formula: z3.BoolRef, timeout: int = 500) -> ThreeValuedTruth:
+    """
+    Checks the validity of the given formula by asking Z3 for a counterexample.
+    Decided results are cached by the (structurally compared) formula and the
+    timeout. "Unknown" results are not cached, since whether Z3 times out depends
+    on the load.
+
+    >>> x = z3.String("x")
+    >>> check_validity(z3.Length(x) >= 0)
+    ThreeValuedTruth(val=1)
+    >>> check_validity(z3.Length(x) > 0)
+    ThreeValuedTruth(val=0)
+
+    :param formula: The formula to check.
+    :param timeout: A timeout for Z3 in milliseconds.
+    :return: The validity of the formula, which is "unknown" if Z3 times out.
+    """
+
+    key = (formula, timeout)
+    if key in VALIDITY_CACHE:
+        return VALIDITY_CACHE[key]
+
     solver = z3.Solver()
     solver.set("timeout", timeout)
     solver.add(z3.Not(formula))
+    result = solver.check()
 
-    if solver.check() == z3.unsat:
-        return ThreeValuedTruth.true()
-    elif solver.check() == z3.sat:
-        return ThreeValuedTruth.false()
-    else:
+    if result == z3.unknown:
         return ThreeValuedTruth.unknown()
 
+    if len(VALIDITY_CACHE) >= 1024:
+        del VALIDITY_CACHE[next(iter(VALIDITY_CACHE))]
+    VALIDITY_CACHE[key] = ThreeValuedTruth.from_bool(result == z3.unsat)
+
+    return VALIDITY_CACHE[key]
+
+
+@lru_cache(maxsize=4096)
+def z3_string(name: str) -> z3.SeqRef:
+    """
+    Returns the Z3 string constant with the given name. Z3 constants are
+    immutable and identified by their name, so we reuse the constants of the 4096
+    most recently used names. Since the solver keeps creating fresh variable
+    names, the cache is bounded.
+
+    >>> z3_string("x") is z3_string("x")
+    True
+    >>> z3_string("x").eq(z3.String("x"))
+    True
+
+    :param name: The name of the constant.
+    :return: The Z3 string constant.
+    """
+
+    return z3.String(name)
+
 
 def z3_eq(formula_1: z3.ExprRef, formula_2: z3.ExprRef | str | int) -> z3.BoolRef:
     a, b = _coerce_exprs(formula_1, formula_2)
@@ -721,26 +815,42 @@ def replace_in_z3_expr(
 
 def visit_z3_expr(
     e: z3.ExprRef | z3.QuantifierRef,
-    seen: Optional[Dict[Union[z3.ExprRef, z3.QuantifierRef], bool]] = None,
 ) -> Generator[z3.ExprRef | z3.QuantifierRef, None, None]:
-    if seen is None:
-        seen = {}
-    elif e in seen:
-        return
-
-    seen[e] = True
-    yield e
-
-    if z3.is_app(e):
-        for ch in e.children():
-            for e in visit_z3_expr(ch, seen):
-                yield e
-        return
-
-    if z3.is_quantifier(e):
-        for e in visit_z3_expr(e.body(), seen):
-            yield e
-        return
+    """
+    Yields all distinct subexpressions of :code:`e` (including :code:`e`) in
+    pre-order. Shared subexpressions are only visited once; we track them by
+    their Z3 AST IDs.
+
+    >>> x, y = z3.Strings("x y")
+    >>> expr = z3.And(z3.Length(x) > 1, z3.Length(x) < z3.Length(y))
+    >>> sub_exprs = list(visit_z3_expr(expr))
+    >>> sub_exprs[0] is expr
+    True
+    >>> len(sub_exprs)
+    8
+    >>> len([sub_expr for sub_expr in sub_exprs if sub_expr.eq(z3.Length(x))])
+    1
+
+    :param e: The expression to visit.
+    :return: A generator of the subexpressions of :code:`e`.
+    """
+
+    seen: Set[int] = set()
+    stack: List[z3.ExprRef | z3.QuantifierRef] = [e]
+
+    while stack:
+        e = stack.pop()
+        e_id = e.get_id()
+        if e_id in seen:
+            continue
+
+        seen.add(e_id)
+        yield e
+
+        if z3.is_app(e):
+            stack.extend(reversed(e.children()))
+        elif z3.is_quantifier(e):
+            stack.append(e.body())
 
 
 @lru_cache()
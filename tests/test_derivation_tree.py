@@ -16,6 +16,7 @@
 # You should have received a copy of the GNU General Public License
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
 
+import copy
 import pickle
 import random
 import unittest
@@ -23,7 +24,7 @@ from typing import List
 
 from isla.derivation_tree import DerivationTree
 from isla.fuzzer import GrammarFuzzer
-from isla.helpers import parent_or_child, canonical
+from isla.helpers import parent_or_child, canonical, is_nonterminal
 from isla_formalizations.xml_lang import XML_GRAMMAR
 from test_data import LANG_GRAMMAR
 from test_helpers import parse
@@ -135,6 +136,22 @@ class TestDerivationTree(unittest.TestCase):
 
         self.assertNotEqual(orig_hash, new_tree.structural_hash())
 
+    def test_is_open_caching(self):
+        tree = DerivationTree.from_parse_tree(
+            ("1", [("2", [("4", [])]), ("3", [("5", [("7", [])]), ("6", [])])])
+        )
+
+        self.assertIsNone(tree._DerivationTree__is_open)
+        self.assertFalse(tree.is_open())
+
+        for path, subtree in tree.paths():
+            self.assertIs(False, subtree._DerivationTree__is_open)
+
+        new_tree = tree.replace_path((1, 1), DerivationTree("6", None))
+        self.assertTrue(new_tree.is_open())
+        self.assertFalse(new_tree.get_subtree((0,)).is_open())
+        self.assertEqual(4, new_tree.depth())
+
     def test_next_path(self):
         tree = DerivationTree.from_parse_tree(
             ("1", [("2", [("4", [])]), ("3", [("5", [("7", [])]), ("6", [])])])
@@ -201,6 +218,60 @@ class TestDerivationTree(unittest.TestCase):
             result.to_parse_tree(),
         )
 
+    def test_substitute_nested(self):
+        tree = DerivationTree.from_parse_tree(
+            ("1", [("2", [("4", [])]), ("3", [("5", [("7", [])]), ("6", [])])])
+        )
+
+        # The replacement of the inner node "5" is subsumed by that of "3",
+        # regardless of the order of the substitution map.
+        for subst_map in [
+            {
+                tree.get_subtree((1, 0)): DerivationTree("8", []),
+                tree.get_subtree((1,)): DerivationTree("9", []),
+            },
+            {
+                tree.get_subtree((1,)): DerivationTree("9", []),
+                tree.get_subtree((1, 0)): DerivationTree("8", []),
+            },
+        ]:
+            self.assertEqual(
+                ("1", [("2", [("4", [])]), ("9", [])]),
+                tree.substitute(subst_map).to_parse_tree(),
+            )
+
+    def test_substitute_shared_subtree(self):
+        shared = DerivationTree.from_parse_tree(("2", [("4", []), ("5", [])]))
+        tree = DerivationTree("1", [shared, DerivationTree("3", [shared])])
+
+        # Only the first occurrence (in pre-order) of a shared node is replaced.
+        result = tree.substitute(
+            {
+                shared.get_subtree((0,)): DerivationTree("6", []),
+                shared.get_subtree((1,)): DerivationTree("7", []),
+            }
+        )
+
+        self.assertEqual(
+            (
+                "1",
+                [("2", [("6", []), ("7", [])]), ("3", [("2", [("4", []), ("5", [])])])],
+            ),
+            result.to_parse_tree(),
+        )
+
+        result = tree.substitute(
+            {
+                shared: DerivationTree("6", []),
+                shared.get_subtree((1,)): DerivationTree("7", []),
+            }
+        )
+
+        self.assertEqual(
+            ("1", [("6", []), ("3", [("2", [("4", []), ("7", [])])])]),
+            result.to_parse_tree(),
+        )
+
     def test_potential_prefix(self):
         potential_prefix_tree = DerivationTree.from_parse_tree(
             (
@@ -233,6 +304,19 @@ class TestDerivationTree(unittest.TestCase):
         tree = DerivationTree("<start>", id=1)
         self.assertEqual((), tree.find_node(1))
 
+    def test_find_node_repeatedly(self):
+        tree = DerivationTree.from_parse_tree(
+            ("1", [("2", [("4", [])]), ("3", [("5", [("7", [])]), ("6", [])])])
+        )
+
+        # Repeated lookups in the same tree yield the same results.
+        for _ in range(2):
+            for path, subtree in tree.paths():
+                self.assertEqual(path, tree.find_node(subtree))
+                self.assertEqual(path, tree.find_node(subtree.id))
+
+            self.assertIsNone(tree.find_node(DerivationTree("7", [])))
+
     def test_from_parse_tree(self):
         for _ in range(20):
             fuzzer = GrammarFuzzer(
@@ -278,6 +362,103 @@ class TestDerivationTree(unittest.TestCase):
 
         self.assertEqual(tree, DerivationTree.from_json(tree.to_json()))
 
+    def test_serialization_with_populated_caches(self):
+        tree = DerivationTree.from_parse_tree(
+            (
+                "<a>",
+                [("<b>", [("x", [])]), ("<c>", [("<d>", [("y", [])]), ("<e>", None)])],
+            )
+        )
+
+        # Populate the caches of the root and of a subtree.
+        subtree = tree.get_subtree((1,))
+        self.assertEqual({"<c>", "<d>", "<e>"}, subtree.nonterminals())
+        self.assertEqual("y<e>", str(subtree))
+        tree.depth()
+
+        json_str = tree.to_json()
+        self.assertEqual(tree, DerivationTree.from_json(json_str))
+
+        unpickled = pickle.loads(pickle.dumps(tree))
+        self.assertEqual(tree, unpickled)
+        self.assertEqual(str(tree), str(unpickled))
+        self.assertEqual(tree.nonterminals(), unpickled.nonterminals())
+        self.assertEqual(tree.depth(), unpickled.depth())
+
+        # Serialization does not modify the serialized tree.
+        self.assertEqual({"<c>", "<d>", "<e>"}, subtree.nonterminals())
+        self.assertEqual({"<a>", "<b>", "<c>", "<d>", "<e>"}, tree.nonterminals())
+        self.assertEqual(json_str, tree.to_json())
+
+    def test_cached_values_agree_with_computation(self):
+        def check_cached_values(tree: DerivationTree):
+            # Compare the cached values (twice: computed and cached) to values
+            # computed from the nodes of the tree.
+            for _ in range(2):
+                self.assertEqual(
+                    {
+                        subtree.value
+                        for _, subtree in tree.paths()
+                        if is_nonterminal(subtree.value)
+                    },
+                    tree.nonterminals(),
+                )
+                self.assertEqual(tree.to_string(show_open_leaves=True), str(tree))
+                self.assertEqual(
+                    1 + max(len(path) for path, _ in tree.paths()), tree.depth()
+                )
+
+        fuzzer = GrammarFuzzer(XML_GRAMMAR, max_nonterminals=50, min_nonterminals=10)
+
+        for _ in range(20):
+            tree = fuzzer.fuzz_tree()
+
+            # Populate the caches of some subtrees first.
+            for _, subtree in tree.paths()[::3]:
+                check_cached_values(subtree)
+            check_cached_values(tree)
+
+            # Derived trees reuse the cached values of unchanged subtrees.
+            leaf_path = next(tree.leaves())[0]
+            derived_tree = tree.replace_path(
+                leaf_path[:-1], DerivationTree(tree.get_subtree(leaf_path[:-1]).value)
+            )
+            check_cached_values(derived_tree)
+
+            for round_tripped_tree in [
+                pickle.loads(pickle.dumps(derived_tree)),
+                DerivationTree.from_json(derived_tree.to_json()),
+            ]:
+                self.assertEqual(derived_tree, round_tripped_tree)
+                check_cached_values(round_tripped_tree)
+                self.assertEqual(
+                    derived_tree.nonterminals(), round_tripped_tree.nonterminals()
+                )
+                self.assertEqual(str(derived_tree), str(round_tripped_tree))
+                self.assertEqual(derived_tree.depth(), round_tripped_tree.depth())
+
+    def test_deepcopy(self):
+        tree = DerivationTree.from_parse_tree(
+            ("1", [("2", [("4", [])]), ("3", [("5", None), ("6", [])])])
+        )
+        tree_copy = copy.deepcopy(tree)
+
+        self.assertEqual(tree, tree_copy)
+        self.assertEqual(tree.to_parse_tree(), tree_copy.to_parse_tree())
+
+        # Deep copies of containers do not copy trees.
+        state = {"trees": [tree]}
+        self.assertIs(tree, copy.deepcopy(state)["trees"][0])
+
+        # "Changing" the copy returns a new tree and leaves the original intact.
+        new_tree = tree_copy.replace_path((1, 0), DerivationTree("5", []))
+        self.assertFalse(new_tree.is_open())
+        self.assertTrue(tree.is_open())
+        self.assertEqual(
+            ("1", [("2", [("4", [])]), ("3", [("5", None), ("6", [])])]),
+            tree.to_parse_tree(),
+        )
+
     def test_zero_id(self):
         DerivationTree.next_id = 42
         tree = DerivationTree("<start>", id=0)
@@ -16,6 +16,7 @@
 # You should have received a copy of the GNU General Public License
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
 
+import pickle
 import string
 import unittest
 from typing import cast, Callable
@@ -32,12 +33,13 @@ from isla.derivation_tree import DerivationTree
 from isla.evaluator import (
     evaluate,
     matches_for_quantified_formula,
+    compute_matches_for_quantified_formula,
     quantified_formula_might_match,
     can_extend_leaf_to_make_quantifier_match_parent,
     fix_str_to_int,
 )
 from isla.fuzzer import GrammarCoverageFuzzer
-from isla.helpers import srange
+from isla.helpers import srange, grammar_to_immutable
 from isla.isla_predicates import (
     BEFORE_PREDICATE,
     LEVEL_PREDICATE,
@@ -507,6 +509,57 @@ class TestEvaluator(unittest.TestCase):
             )
         )
 
+    def test_matches_for_quantified_formula_cached(self):
+        tree = DerivationTree.from_parse_tree(
+            next(EarleyParser(LANG_GRAMMAR).parse("x := y ; y := z ; z := x"))
+        )
+
+        lhs = BoundVariable("lhs", "<var>")
+        rhs = BoundVariable("rhs", "<var>")
+        assgn = BoundVariable("assgn", "<assgn>")
+        formula = cast(
+            QuantifiedFormula,
+            sc.forall_bind(
+                lhs + " := " + rhs,
+                assgn,
+                tree,
+                smt_for(z3_eq(lhs.to_smt(), rhs.to_smt()), lhs, rhs),
+            ),
+        )
+
+        expected_matches = compute_matches_for_quantified_formula(
+            formula, LANG_GRAMMAR, tree
+        )
+        self.assertEqual(3, len(expected_matches))
+
+        # Matches in the tree of the formula are cached; callers get copies.
+        for grammar in [LANG_GRAMMAR, dict(LANG_GRAMMAR)]:
+            matches = matches_for_quantified_formula(formula, grammar)
+            self.assertEqual(expected_matches, matches)
+            matches[0].clear()
+            matches.clear()
+
+        self.assertEqual(
+            expected_matches,
+            matches_for_quantified_formula(
+                formula,
+                LANG_GRAMMAR,
+                immutable_grammar=grammar_to_immutable(LANG_GRAMMAR),
+            ),
+        )
+
+        self.assertEqual(
+            expected_matches, matches_for_quantified_formula(formula, LANG_GRAMMAR)
+        )
+
+        # Unpickled formulas have the same matches.
+        unpickled_formula = pickle.loads(pickle.dumps(formula))
+        self.assertEqual(formula, unpickled_formula)
+        self.assertEqual(
+            expected_matches,
+            matches_for_quantified_formula(unpickled_formula, LANG_GRAMMAR),
+        )
+
     def test_match_open_tree(self):
         tree = DerivationTree.from_parse_tree(
             next(EarleyParser(LANG_GRAMMAR).parse("c := 6 ; x := c"))
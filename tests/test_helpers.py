@@ -45,6 +45,9 @@ from isla.helpers import (
     parent_or_child,
     Failure,
     Maybe,
+    cluster_by_common_elements,
+    grammar_to_immutable,
+    nonterminal_reachability,
 )
 from isla.isla_predicates import is_before
 from isla.parser import EarleyParser
@@ -357,6 +360,21 @@ class TestHelpers(unittest.TestCase):
                 set(eliminate_suffixes(permutation)),
             )
 
+    def test_cluster_by_common_elements(self):
+        calls = []
+
+        def elements(l):
+            calls.append(l)
+            return set(l)
+
+        self.assertEqual(
+            [[[5, 6]], [[3, 4], [1, 2], [2, 3]], []],
+            cluster_by_common_elements([[3, 4], [5, 6], [1, 2], [2, 3], []], elements),
+        )
+
+        # The elements of interest are only computed once per list element.
+        self.assertEqual(5, len(calls))
+
     def test_to_id(self):
         x = 17
 
@@ -411,6 +429,17 @@ class TestHelpers(unittest.TestCase):
         grammar = delete_unreachable(grammar)
         self.assertEqual(expected, grammar)
 
+    def test_nonterminal_reachability(self):
+        graph = GrammarGraph.from_grammar(LANG_GRAMMAR)
+        reachability = nonterminal_reachability(grammar_to_immutable(LANG_GRAMMAR))
+
+        for from_nonterminal in LANG_GRAMMAR:
+            for to_nonterminal in LANG_GRAMMAR:
+                self.assertEqual(
+                    graph.reachable(from_nonterminal, to_nonterminal),
+                    to_nonterminal in reachability[from_nonterminal],
+                )
+
     def test_exceptional_reraise(self):
         try:
             Exceptional.of(lambda: 1 // 0).reraise()
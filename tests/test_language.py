@@ -17,6 +17,7 @@
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
 
 import copy
+import pickle
 import random
 import unittest
 
@@ -858,6 +859,54 @@ forall <xml-tree> tree="<<id>><inner-xml-tree></<id>>" in start:
 
         pickle.dumps(constraint)
 
+    def test_pickle_formula_with_populated_caches(self):
+        x = Constant("x", "<var>")
+        y = Constant("y", "<var>")
+        var = BoundVariable("var", "<var>")
+        a = SMTFormula(z3_eq(x.to_smt(), z3.StringVal("a")), x)
+        b = SMTFormula(z3_eq(y.to_smt(), z3.StringVal("b")), y)
+        c = ExistsFormula(var, x, SMTFormula(z3_eq(var.to_smt(), x.to_smt()), var, x))
+        formula = (a & (b & c)) | (b & true())
+
+        def views(f: Formula):
+            return (
+                language.split_conjunction(f),
+                language.split_disjunction(f),
+                language.get_conjuncts(f),
+                language.has_conjunct_of_type(f, ExistsFormula),
+                language.partition_smt_conjuncts(f),
+                language.VariablesCollector.collect(f),
+                language.BoundVariablesCollector.collect(f),
+                f.free_variables(),
+                hash(f),
+            )
+
+        # Results for formulas whose caches are not populated yet.
+        self.assertEqual([a, b, c], language.split_conjunction(a & (b & c)))
+        self.assertEqual([a & (b & c), b], language.split_disjunction(formula))
+        self.assertEqual([a, b, c, b], language.get_conjuncts(formula))
+        self.assertTrue(language.has_conjunct_of_type(formula, ExistsFormula))
+        self.assertFalse(language.has_conjunct_of_type(a & b, ExistsFormula))
+        self.assertEqual(((a, b), (c,)), language.partition_smt_conjuncts(a & (b & c)))
+        self.assertEqual({x, y, var}, set(language.VariablesCollector.collect(formula)))
+        self.assertEqual({var}, set(language.BoundVariablesCollector.collect(formula)))
+        self.assertEqual({x, y}, set(formula.free_variables()))
+
+        # Populate the caches of the formula, its subformulas, and `true()`.
+        subformulas = [formula, a & (b & c), b & true(), a, c, true()]
+        expected_views = [views(f) for f in subformulas]
+
+        # Cached results are equal to the computed ones, and callers get copies.
+        self.assertEqual(expected_views, [views(f) for f in subformulas])
+        language.split_conjunction(a & (b & c)).clear()
+        language.VariablesCollector.collect(formula).clear()
+        self.assertEqual(expected_views, [views(f) for f in subformulas])
+
+        for f, expected in zip(subformulas, expected_views):
+            unpickled = pickle.loads(pickle.dumps(f))
+            self.assertEqual(f, unpickled)
+            self.assertEqual(expected, views(unpickled))
+
     def test_match(self):
         # We assume a match expression `{<var> lhs} := {<var> rhs} ; <assgn>` for the assignment language.
         lhs = BoundVariable("<lhs>", "<var>")
@@ -964,6 +1013,28 @@ forall <xml-tree> tree="<<id>><inner-xml-tree></<id>>" in start:
 
         self.assertEqual(expected, result)
 
+    def test_replace_formula_shared_subformula(self):
+        pred = language.StructuralPredicate("pred", 1, lambda arg: True)
+        w = language.StructuralPredicateFormula(pred, "w")
+        x = language.StructuralPredicateFormula(pred, "x")
+        y = language.StructuralPredicateFormula(pred, "y")
+
+        shared = w | x
+        formula = language.ConjunctiveFormula(
+            shared, language.DisjunctiveFormula(shared, y)
+        )
+
+        visited = []
+
+        def replace_w(f: Formula) -> bool:
+            visited.append(f)
+            return f == w
+
+        result = language.replace_formula(formula, replace_w, y)
+
+        self.assertEqual((y | x) & ((y | x) | y), result)
+        self.assertEqual(1, sum(1 for f in visited if f is shared))
+
 
 if __name__ == "__main__":
     unittest.main()
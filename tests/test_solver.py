@@ -83,7 +83,7 @@ from isla.solver import (
     SolverDefaults,
 )
 from isla.type_defs import Grammar, ImmutableList
-from isla.z3_helpers import z3_eq, smt_string_val_to_string
+from isla.z3_helpers import z3_eq
 from isla_formalizations import rest, tar, simple_tar, scriptsizec
 from isla_formalizations.csv import csv_lint, CSV_GRAMMAR, CSV_HEADERBODY_GRAMMAR
 from isla_formalizations.tar import extract_tar
@@ -930,6 +930,76 @@ forall <assgn> assgn_2="{<var> var_2} := <rhs>" in <start>:
         self.assertTrue(result.is_present())
         result.if_present(lambda a: self.assertEqual([], a))
 
+    def test_solution_state_hash_caching(self):
+        tree = DerivationTree("<start>", None)
+        formula = parse_isla('forall <var> var in start: var = "x"', LANG_GRAMMAR)
+        state = SolutionState(
+            formula.substitute_expressions({start_constant(): tree}), tree
+        )
+
+        self.assertIsNone(state._SolutionState__hash)
+        self.assertEqual(hash(state), hash(state))
+        self.assertEqual(hash(state), state._SolutionState__hash)
+        self.assertEqual(hash(state), hash(SolutionState(state.constraint, tree)))
+
+    def test_quantifier_free_solutions_cached(self):
+        solver = ISLaSolver(LANG_GRAMMAR)
+
+        var = language.BoundVariable("var", "<var>")
+        var_tree = DerivationTree("<var>", None)
+
+        def smt_formulas() -> ImmutableList[language.SMTFormula]:
+            return (
+                language.SMTFormula(
+                    z3.Not(z3_eq(var.to_smt(), z3.StringVal("x"))),
+                    instantiated_variables=OrderedSet([var]),
+                    substitutions={var: var_tree},
+                ),
+            )
+
+        solutions = solver.solve_quantifier_free_formula(smt_formulas(), 3)
+
+        self.assertEqual(3, len(solutions))
+        solution_strings = [str(solution[var_tree]) for solution in solutions]
+        self.assertEqual(3, len(set(solution_strings)))
+        self.assertNotIn("x", solution_strings)
+
+        # Repeated queries for equal formulas return equal solutions.
+        self.assertEqual(
+            solutions, solver.solve_quantifier_free_formula(smt_formulas(), 3)
+        )
+
+        # The number of instantiations is part of the query.
+        (solution,) = solver.solve_quantifier_free_formula(smt_formulas(), 1)
+        self.assertEqual({var_tree}, set(solution))
+        self.assertNotEqual("x", str(solution[var_tree]))
+        self.assertEqual(
+            solutions, solver.solve_quantifier_free_formula(smt_formulas(), 3)
+        )
+
+    def test_solution_state_deepcopy(self):
+        tree = DerivationTree("<start>", None)
+        formula = parse_isla('forall <var> var in start: var = "x"', LANG_GRAMMAR)
+        state = SolutionState(
+            formula.substitute_expressions({start_constant(): tree}), tree
+        )
+        state_copy = copy.deepcopy(state)
+
+        self.assertEqual(state, state_copy)
+        self.assertEqual(hash(state), hash(state_copy))
+        self.assertFalse(state_copy.complete())
+
+        # Deep copies of queues do not copy the states.
+        queue = [(0, state)]
+        self.assertIs(state, copy.deepcopy(queue)[0][1])
+
+        # "Changing" the copy creates a new state and leaves the original intact.
+        new_state = SolutionState(sc.true(), state_copy.tree)
+        self.assertNotEqual(state, new_state)
+        self.assertEqual(
+            formula.substitute_expressions({start_constant(): tree}), state.constraint
+        )
+
     def test_unsatisfiable_forall_exists_formula(self):
         solver = ISLaSolver(
             LANG_GRAMMAR,
@@ -1429,54 +1499,47 @@ and str.len(<payload>) = 10
         byte_2_tree = DerivationTree("<byte>", None, id=3880)
         payload_tree = DerivationTree("<payload>", None, id=3824)
 
-        formula_1 = z3_eq(
-            z3.IntVal(256) * z3.StrToCode(byte_1.to_smt())
-            + z3.StrToCode(byte_2.to_smt()),
-            z3.IntVal(2) * z3.Length(payload.to_smt()),
-        )
-
-        formula_2 = z3_eq(byte_1.to_smt(), z3.StringVal("\x01"))
-
-        to_exclude = [
-            {
-                byte_1: z3.StringVal("\x01"),
-                byte_2: z3.StringVal("\x00"),
-                language.BoundVariable("<payload>_3824", "<payload>"): z3.StringVal(
-                    "".join([random.choice(string.printable) for _ in range(256)])
-                ),
-            }
-        ]
-
-        sat_result, model = solver.solve_smt_formulas_with_language_constraints(
-            {byte_1, byte_2, payload},
-            cast(ImmutableList[z3.BoolRef], (formula_1, formula_2)),
-            {
+        formula_1 = language.SMTFormula(
+            z3_eq(
+                z3.IntVal(256) * z3.StrToCode(byte_1.to_smt())
+                + z3.StrToCode(byte_2.to_smt()),
+                z3.IntVal(2) * z3.Length(payload.to_smt()),
+            ),
+            instantiated_variables=OrderedSet([byte_2, payload, byte_1]),
+            substitutions={
                 byte_1: byte_1_tree,
                 byte_2: byte_2_tree,
                 payload: payload_tree,
             },
-            to_exclude,
         )
 
-        self.assertEqual(z3.sat, sat_result)
+        formula_2 = language.SMTFormula(
+            z3_eq(byte_1.to_smt(), z3.StringVal("\x01")),
+            instantiated_variables=OrderedSet([byte_1]),
+            substitutions={byte_1: byte_1_tree},
+        )
 
-        self.assertEqual(3, len(model))
-        self.assertIn(byte_1, model)
-        self.assertIn(byte_2, model)
-        self.assertIn(payload, model)
+        # The second solution is computed after excluding the first one.
+        first_solution, second_solution = solver.solve_quantifier_free_formula(
+            cast(ImmutableList[language.SMTFormula], (formula_1, formula_2)), 2
+        )
 
-        self.assertEqual(1, ord(str(model[byte_1])))
+        for solution in [first_solution, second_solution]:
+            self.assertEqual(3, len(solution))
+            self.assertIn(byte_1_tree, solution)
+            self.assertIn(byte_2_tree, solution)
+            self.assertIn(payload_tree, solution)
 
-        self.assertEqual(
-            256 * ord(str(model[byte_1])) + ord(str(model[byte_2])),
-            2 * len(str(model[payload])),
-        )
+            self.assertEqual(1, ord(str(solution[byte_1_tree])))
 
-        self.assertEqual(0, ord(smt_string_val_to_string(to_exclude[0][byte_2])))
-        self.assertNotEqual(0, ord(str(model[byte_2])))
+            self.assertEqual(
+                256 * ord(str(solution[byte_1_tree])) + ord(str(solution[byte_2_tree])),
+                2 * len(str(solution[payload_tree])),
+            )
 
         self.assertNotEqual(
-            to_exclude[0], {var: z3.StringVal(str(val)) for var, val in model.items()}
+            {tree: str(value) for tree, value in first_solution.items()},
+            {tree: str(value) for tree, value in second_solution.items()},
         )
 
     def test_filter_length_variables(self):